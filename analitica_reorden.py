@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Consumo diario y punto de reorden de todos los materiales
+
+El consumo de un material son sus SALIDAS y su material EN USO. Para los
+últimos DIAS_HISTORIA días se guarda una matriz material x día con la
+cantidad consumida; con ella se calculan de una vez, con NumPy, el consumo
+diario promedio, su desviación, los días que alcanza el stock actual y el
+punto de reorden:
+
+    punto de reorden = consumo diario x días de entrega
+                       + z x desviación x raíz(días de entrega)
+
+donde z corresponde al nivel de servicio (0.95 -> 1.64). stock_minimo sigue
+siendo el valor que se captura a mano; el punto de reorden es una sugerencia.
+
+AnaliticaReorden conserva la matriz entre consultas: cada vez solo lee los
+movimientos con id mayor al último que vio y, al cambiar el día, desplaza la
+ventana en lugar de volver a leer los 90 días.
+"""
+import threading
+from datetime import date, timedelta
+from statistics import NormalDist
+
+from fechas import FORMATO_FECHA, PATRON_FECHA, interpretar_fecha
+
+DIAS_HISTORIA = 90
+DIAS_ENTREGA = 7
+# Con menos días de historia el promedio no es representativo: no se calcula
+MIN_DIAS_OBSERVADOS = 7
+NIVEL_SERVICIO = 0.95
+
+TIPOS_CONSUMO = ('SALIDA', 'EN USO')
+
+COLUMNAS_REORDEN = ('material_id', 'codigo', 'nombre', 'unidad', 'cantidad_actual', 'stock_minimo',
+                    'dias_observados', 'consumo_diario', 'desviacion', 'dias_cobertura',
+                    'punto_reorden', 'reordenar')
+
+
+def factor_servicio(nivel_servicio):
+    """z de la distribución normal para el nivel de servicio (0.5 a 0.999)
+
+    Lanza ValueError si el nivel está fuera de ese rango.
+    """
+    if not 0.5 <= nivel_servicio <= 0.999:
+        raise ValueError(nivel_servicio)
+    return NormalDist().inv_cdf(nivel_servicio)
+
+
+class AnaliticaReorden:
+    """Matriz de consumo por material y día, compartida entre hilos"""
+
+    def __init__(self, dias=DIAS_HISTORIA):
+        self.dias = dias
+        self._lock = threading.Lock()
+        self._inicio = None
+        self._ultimo_id = 0
+        self._filas = {}
+        self._consumo = None
+
+    def actualizar(self, conn, hoy=None):
+        """Agrega los movimientos nuevos y desplaza la ventana si cambió el día
+
+        Devuelve cuántos movimientos de consumo se agregaron.
+        """
+        import numpy as np   # dependencia de pandas, se carga al primer uso
+
+        hoy = hoy or date.today()
+        inicio = hoy - timedelta(days=self.dias - 1)
+
+        with self._lock:
+            # Una sola transacción de lectura: el id máximo y los movimientos coinciden
+            conn.execute('BEGIN')
+            try:
+                maximo = conn.execute('SELECT COALESCE(MAX(id), 0) FROM movimientos').fetchone()[0]
+                ids = [fila[0] for fila in conn.execute('SELECT id FROM materiales')]
+
+                if (self._inicio is None or maximo < self._ultimo_id
+                        or (inicio - self._inicio).days >= self.dias):
+                    # Primera vez, base restaurada o ventana sin días en común
+                    self._filas = {}
+                    self._consumo = np.zeros((0, self.dias))
+                    self._ultimo_id = 0
+                elif inicio > self._inicio:
+                    desplazar = (inicio - self._inicio).days
+                    self._consumo = np.roll(self._consumo, -desplazar, axis=1)
+                    self._consumo[:, -desplazar:] = 0
+                self._inicio = inicio
+
+                nuevos = [i for i in ids if i not in self._filas]
+                if nuevos:
+                    base = len(self._filas)
+                    self._filas.update((i, base + n) for n, i in enumerate(nuevos))
+                    self._consumo = np.vstack([self._consumo, np.zeros((len(nuevos), self.dias))])
+
+                # Fechas que normalizar_fechas() no pudo interpretar: fuera del cálculo
+                movimientos = conn.execute(f'''
+                    SELECT material_id, cantidad, fecha FROM movimientos
+                    WHERE id > ? AND id <= ? AND fecha >= ? AND fecha GLOB '{PATRON_FECHA}'
+                      AND tipo_movimiento IN ({', '.join('?' for _ in TIPOS_CONSUMO)})
+                ''', (self._ultimo_id, maximo, inicio.strftime(FORMATO_FECHA)) + TIPOS_CONSUMO).fetchall()
+                self._ultimo_id = maximo
+            finally:
+                conn.commit()
+
+            movimientos = [m for m in movimientos if m[0] in self._filas]
+            if not movimientos:
+                return 0
+
+            material, cantidad, fecha = zip(*movimientos)
+            filas = np.fromiter((self._filas[i] for i in material), dtype=np.int64, count=len(material))
+            # 'AAAA-MM-DD HH:MM:SS' recortado a 10 caracteres es el día
+            dias = (np.array(fecha, dtype='U10').astype('datetime64[D]')
+                    - np.datetime64(inicio, 'D')).astype(np.int64)
+            en_ventana = (dias >= 0) & (dias < self.dias)
+            np.add.at(self._consumo, (filas[en_ventana], dias[en_ventana]),
+                      np.array(cantidad, dtype=float)[en_ventana])
+            return int(en_ventana.sum())
+
+    def calcular(self, conn, dias_entrega=DIAS_ENTREGA, nivel_servicio=NIVEL_SERVICIO):
+        """(columnas, filas) de COLUMNAS_REORDEN para todos los materiales, ordenadas por días de cobertura
+
+        Llamar después de actualizar(). Un material registrado dentro de la
+        ventana se promedia solo desde su fecha de registro; con menos de
+        MIN_DIAS_OBSERVADOS días el consumo, la cobertura, el punto de reorden
+        y `reordenar` quedan en None.
+        """
+        import numpy as np
+
+        z = factor_servicio(nivel_servicio)
+        materiales = conn.execute('''
+            SELECT id, codigo, nombre, unidad, cantidad_actual, stock_minimo, fecha_registro
+            FROM materiales
+        ''').fetchall()
+        if not materiales:
+            return list(COLUMNAS_REORDEN), []
+
+        with self._lock:
+            inicio = self._inicio
+            # Un material dado de alta después de actualizar() aún no tiene fila: sin consumo
+            filas = np.array([self._filas.get(m[0], -1) for m in materiales])
+            presentes = filas >= 0
+            consumo = np.zeros((len(materiales), self.dias))
+            consumo[presentes] = self._consumo[filas[presentes]]
+
+        # Días observados: toda la ventana, o desde el registro del material
+        # (una fecha de registro que no se puede interpretar cuenta como toda la ventana)
+        registro = np.array([(interpretar_fecha(m[6]) or inicio).strftime('%Y-%m-%d') for m in materiales],
+                            dtype='datetime64[D]')
+        observados = (np.datetime64(inicio, 'D') + self.dias - registro).astype(np.int64)
+        observados = np.clip(observados, 1, self.dias)
+        consumo[np.arange(self.dias) < (self.dias - observados)[:, None]] = 0
+
+        total = consumo.sum(axis=1)
+        cuadrados = (consumo ** 2).sum(axis=1)
+        promedio = total / observados
+        varianza = (cuadrados - observados * promedio ** 2) / np.maximum(observados - 1, 1)
+        desviacion = np.sqrt(np.clip(varianza, 0, None))
+
+        punto_reorden = promedio * dias_entrega + z * desviacion * np.sqrt(dias_entrega)
+        stock = np.array([m[4] or 0 for m in materiales], dtype=float)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            cobertura = np.where(promedio > 0, stock / promedio, np.nan)
+        reordenar = (promedio > 0) & (stock <= punto_reorden)
+        suficientes = observados >= MIN_DIAS_OBSERVADOS
+        cobertura[~suficientes] = np.nan
+
+        orden = np.lexsort((-promedio * suficientes, np.nan_to_num(cobertura, nan=np.inf)))
+        resultado = []
+        for i in orden:
+            m = materiales[i]
+            if suficientes[i]:
+                calculado = [
+                    round(float(promedio[i]), 4),
+                    round(float(desviacion[i]), 4),
+                    None if np.isnan(cobertura[i]) else round(float(cobertura[i]), 1),
+                    round(float(punto_reorden[i]), 2),
+                    bool(reordenar[i]),
+                ]
+            else:
+                calculado = [None] * 5
+            resultado.append([m[0], m[1], m[2], m[3], m[4], m[5], int(observados[i])] + calculado)
+        return list(COLUMNAS_REORDEN), resultado
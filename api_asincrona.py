@@ -0,0 +1,395 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+API de lectura asíncrona (ASGI) del Sistema de Inventario PTAR
+
+Las rutas de consulta y el flujo de eventos se atienden en un bucle asyncio:
+- Las consultas a SQLite se envían a EjecutorLectura, unos pocos hilos con una
+  conexión de solo lectura cada uno. Si hay demasiadas consultas esperando se
+  responde 503 en vez de acumularlas.
+- /api/eventos espera en una ColaAsincrona, así que miles de navegadores
+  conectados no ocupan ningún hilo.
+- El resto de rutas (escrituras, reportes, imágenes, la página) se pasan a la
+  aplicación Flask en un grupo de hilos aparte, para que un reporte lento no
+  retrase las consultas rápidas.
+
+Uso:
+    python servidor.py --servidor uvicorn
+"""
+import asyncio
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from flask import jsonify, request
+
+import app as aplicacion_flask
+from archivo_movimientos import ArchivoNoDisponible
+from fechas import limite_de_fecha, rango_de_fechas
+from formatos_respuesta import responder_documento, responder_filas
+from publicador_eventos import ColaAsincrona, eventos_perdidos, formatear_sse
+
+# Hilos con conexión de solo lectura y consultas que pueden esperar turno
+HILOS_LECTURA = 4
+MAX_LECTURAS_EN_ESPERA = 200
+# Hilos para las rutas que atiende Flask (SQLite admite un solo escritor a la vez)
+HILOS_FLASK = 4
+
+
+class EjecutorSaturado(Exception):
+    """Hay demasiadas consultas esperando un hilo de lectura"""
+
+
+class EjecutorLectura:
+    """Grupo acotado de hilos, cada uno con su propia conexión de solo lectura"""
+
+    def __init__(self, db_path, hilos=HILOS_LECTURA, max_en_espera=MAX_LECTURAS_EN_ESPERA):
+        self.db_path = db_path
+        self.max_en_espera = max_en_espera
+        self._en_curso = 0
+        self._local = threading.local()
+        self._executor = ThreadPoolExecutor(max_workers=hilos, thread_name_prefix='lectura',
+                                            initializer=self._abrir)
+
+    def _abrir(self):
+        self._local.conn = aplicacion_flask.conectar_lectura(self.db_path)
+
+    def _llamar(self, funcion, args):
+        return funcion(self._local.conn, *args)
+
+    async def ejecutar(self, funcion, *args):
+        """Ejecuta funcion(conn, *args) en un hilo de lectura y devuelve su resultado"""
+        # Solo se modifica desde el hilo del bucle: no necesita lock
+        if self._en_curso >= self.max_en_espera:
+            raise EjecutorSaturado()
+        self._en_curso += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, self._llamar, funcion, args)
+        finally:
+            self._en_curso -= 1
+
+    def cerrar(self):
+        """Espera a las consultas en curso; cada conexión se libera al terminar su hilo"""
+        self._executor.shutdown(wait=True)
+
+
+# ===============================
+# CONSULTAS (se ejecutan en los hilos de lectura)
+# ===============================
+
+def leer_materiales(conn, args):
+    hasta = aplicacion_flask.ultimo_cambio(conn)
+    return hasta, aplicacion_flask.consultar_materiales(
+        conn,
+        categoria=args.get('categoria', ''),
+        ubicacion=args.get('ubicacion', ''),
+        estado=args.get('estado', ''),
+        busqueda=args.get('busqueda', '')
+    )
+
+
+async def materiales(lectura):
+    hasta, (columnas, filas) = await lectura.ejecutar(leer_materiales, request.args)
+    respuesta = responder_filas(request, columnas, filas)
+    respuesta.headers['X-Cambios-Hasta'] = str(hasta)
+    return respuesta
+
+
+def fecha_invalida():
+    respuesta = jsonify({'error': 'Fecha inválida, use AAAA-MM-DD o AAAA-MM-DD HH:MM:SS'})
+    respuesta.status_code = 400
+    return respuesta
+
+
+async def movimientos(lectura):
+    try:
+        desde, hasta = rango_de_fechas(request.args.get('desde'), request.args.get('hasta'))
+    except ValueError:
+        return fecha_invalida()
+    columnas, filas = await lectura.ejecutar(aplicacion_flask.consultar_movimientos,
+                                             request.args.get('tipo', ''), desde, hasta)
+    return responder_filas(request, columnas, filas)
+
+
+async def prestamos(lectura):
+    try:
+        desde, hasta = rango_de_fechas(request.args.get('desde'), request.args.get('hasta'))
+    except ValueError:
+        return fecha_invalida()
+    columnas, filas = await lectura.ejecutar(aplicacion_flask.consultar_prestamos_activos,
+                                             desde, hasta)
+    return responder_filas(request, columnas, filas)
+
+
+async def material_en_uso(lectura):
+    try:
+        desde, hasta = rango_de_fechas(request.args.get('desde'), request.args.get('hasta'))
+    except ValueError:
+        return fecha_invalida()
+    columnas, filas = await lectura.ejecutar(aplicacion_flask.consultar_material_en_uso,
+                                             desde, hasta)
+    return responder_filas(request, columnas, filas)
+
+
+async def estadisticas(lectura):
+    return jsonify(await lectura.ejecutar(aplicacion_flask.calcular_estadisticas))
+
+
+async def cambios(lectura):
+    return jsonify(await lectura.ejecutar(aplicacion_flask.leer_cambios, request.args))
+
+
+async def catalogos(lectura):
+    return responder_documento(request, await lectura.ejecutar(aplicacion_flask.leer_catalogos))
+
+
+async def bootstrap(lectura):
+    datos = await lectura.ejecutar(aplicacion_flask.leer_bootstrap,
+                                   request.args.get('materiales', '1') != '0')
+    return responder_documento(request, datos)
+
+
+async def stock(lectura):
+    try:
+        limite = limite_de_fecha(request.args.get('fecha'))
+    except ValueError:
+        return fecha_invalida()
+    columnas, filas = await lectura.ejecutar(aplicacion_flask.leer_stock_en_fecha, limite)
+    return responder_filas(request, columnas, filas)
+
+
+RUTAS_LECTURA = {
+    '/api/materiales': materiales,
+    '/api/movimientos': movimientos,
+    '/api/prestamos': prestamos,
+    '/api/material-en-uso': material_en_uso,
+    '/api/estadisticas': estadisticas,
+    '/api/cambios': cambios,
+    '/api/bootstrap': bootstrap,
+    '/api/catalogos': catalogos,
+    '/api/stock': stock,
+}
+
+
+# ===============================
+# ADAPTACIÓN ASGI <-> WSGI
+# ===============================
+
+def entorno_wsgi(scope, cuerpo=b''):
+    """Entorno WSGI equivalente a una petición ASGI"""
+    servidor = scope.get('server') or ('localhost', 80)
+    cliente = scope.get('client') or ('', 0)
+    entorno = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': servidor[0],
+        'SERVER_PORT': str(servidor[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': cliente[0],
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': BytesIO(cuerpo),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    for nombre, valor in scope.get('headers', []):
+        nombre = nombre.decode('latin-1').upper().replace('-', '_')
+        valor = valor.decode('latin-1')
+        if nombre not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            nombre = 'HTTP_' + nombre
+        entorno[nombre] = f'{entorno[nombre]},{valor}' if nombre in entorno else valor
+    return entorno
+
+
+def ejecutar_wsgi(app_wsgi, entorno):
+    """Ejecuta una aplicación WSGI y devuelve (estado, encabezados, cuerpo)"""
+    resultado = {}
+
+    def start_response(estado, encabezados, exc_info=None):
+        resultado['estado'] = int(estado.split(' ', 1)[0])
+        resultado['encabezados'] = encabezados
+
+    iterable = app_wsgi(entorno, start_response)
+    try:
+        cuerpo = b''.join(iterable)
+    finally:
+        if hasattr(iterable, 'close'):
+            iterable.close()
+    return resultado['estado'], resultado['encabezados'], cuerpo
+
+
+async def leer_cuerpo(receive):
+    """Cuerpo completo de la petición"""
+    partes = []
+    while True:
+        mensaje = await receive()
+        if mensaje['type'] == 'http.disconnect':
+            break
+        partes.append(mensaje.get('body', b''))
+        if not mensaje.get('more_body'):
+            break
+    return b''.join(partes)
+
+
+async def enviar(send, estado, encabezados, cuerpo):
+    await send({
+        'type': 'http.response.start',
+        'status': estado,
+        'headers': [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in encabezados],
+    })
+    await send({'type': 'http.response.body', 'body': cuerpo})
+
+
+# ===============================
+# APLICACIÓN ASGI
+# ===============================
+
+class AplicacionAsincrona:
+    """Aplicación ASGI: consultas y eventos asíncronos, el resto a través de Flask"""
+
+    def __init__(self, flask_app=aplicacion_flask.app, db_path=aplicacion_flask.DB_PATH,
+                 hilos_lectura=HILOS_LECTURA, hilos_flask=HILOS_FLASK):
+        self.flask_app = flask_app
+        self.db_path = db_path
+        self.hilos_lectura = hilos_lectura
+        self.hilos_flask = hilos_flask
+        self.lectura = None
+        self.ejecutor_flask = None
+        self.servicios = []
+
+    def iniciar(self):
+        """Crea los grupos de hilos e inicia los servicios en segundo plano (una vez por proceso)"""
+        if self.lectura is None:
+            self.lectura = EjecutorLectura(self.db_path, self.hilos_lectura)
+            self.ejecutor_flask = ThreadPoolExecutor(max_workers=self.hilos_flask,
+                                                     thread_name_prefix='flask')
+            self.servicios = aplicacion_flask.iniciar_worker()
+
+    def detener(self):
+        """Detiene los servicios y espera a que terminen las consultas en curso"""
+        if self.lectura is not None:
+            for servicio in self.servicios:
+                servicio.detener()
+            self.ejecutor_flask.shutdown(wait=True)
+            self.lectura.cerrar()
+            self.lectura = None
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._ciclo_de_vida(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+
+        # Por si el servidor ASGI no envía eventos lifespan
+        self.iniciar()
+
+        if scope['method'] == 'GET' and scope['path'] == '/api/eventos':
+            await self._eventos(scope, receive, send)
+            return
+
+        cuerpo = await leer_cuerpo(receive)
+        entorno = entorno_wsgi(scope, cuerpo)
+        ruta = RUTAS_LECTURA.get(scope['path']) if scope['method'] == 'GET' else None
+
+        if ruta is None:
+            loop = asyncio.get_running_loop()
+            await enviar(send, *await loop.run_in_executor(
+                self.ejecutor_flask, ejecutar_wsgi, self.flask_app, entorno))
+            return
+
+        with self.flask_app.request_context(entorno):
+            try:
+                respuesta = await ruta(self.lectura)
+            except EjecutorSaturado:
+                respuesta = jsonify({'error': 'Servidor ocupado, intenta de nuevo'})
+                respuesta.status_code = 503
+                respuesta.headers['Retry-After'] = '1'
+            except ArchivoNoDisponible as e:
+                respuesta = jsonify({'error': str(e)})
+                respuesta.status_code = 503
+            except Exception as e:
+                respuesta = jsonify({'error': str(e)})
+                respuesta.status_code = 500
+            # after_request (compresión) igual que en Flask
+            respuesta = self.flask_app.process_response(respuesta)
+            datos = respuesta.get_data()
+
+        await enviar(send, respuesta.status_code, respuesta.headers.items(), datos)
+
+    async def _ciclo_de_vida(self, receive, send):
+        while True:
+            mensaje = await receive()
+            if mensaje['type'] == 'lifespan.startup':
+                self.iniciar()
+                await send({'type': 'lifespan.startup.complete'})
+            elif mensaje['type'] == 'lifespan.shutdown':
+                await asyncio.get_running_loop().run_in_executor(None, self.detener)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _eventos(self, scope, receive, send):
+        """Flujo Server-Sent Events sin un hilo por cliente"""
+        ultimo_id = None
+        for nombre, valor in scope.get('headers', []):
+            if nombre == b'last-event-id' and valor.isdigit():
+                ultimo_id = int(valor)
+
+        publicador = aplicacion_flask.publicador
+        cola = ColaAsincrona(asyncio.get_running_loop())
+        # Primero la suscripción: lo que se confirme mientras se leen los perdidos llega por la cola
+        publicador.suscribir(cola=cola)
+        desconexion = asyncio.ensure_future(self._esperar_desconexion(receive))
+        try:
+            perdidos = []
+            if ultimo_id is not None:
+                try:
+                    perdidos = await self.lectura.ejecutar(eventos_perdidos, ultimo_id)
+                except EjecutorSaturado:
+                    # Sin turno de lectura: el navegador recarga todo en vez de esperar
+                    perdidos = [(None, 'reiniciar', {})]
+            await send({
+                'type': 'http.response.start',
+                'status': 200,
+                'headers': [(b'content-type', b'text/event-stream; charset=utf-8'),
+                            (b'cache-control', b'no-cache'),
+                            (b'x-accel-buffering', b'no')],
+            })
+            texto = 'retry: 5000\n\n' + ''.join(formatear_sse(e) for e in perdidos)
+            await send({'type': 'http.response.body', 'body': texto.encode('utf-8'), 'more_body': True})
+
+            while True:
+                espera = asyncio.ensure_future(cola.aviso.wait())
+                hechos, _ = await asyncio.wait({espera, desconexion},
+                                               timeout=aplicacion_flask.INTERVALO_KEEPALIVE_SSE,
+                                               return_when=asyncio.FIRST_COMPLETED)
+                espera.cancel()
+                if desconexion in hechos:
+                    break
+
+                if espera not in hechos:
+                    texto = ': keepalive\n\n'
+                else:
+                    eventos = cola.vaciar()
+                    # None: el publicador cerró el flujo de un cliente demasiado lento
+                    cerrado = None in eventos
+                    texto = ''.join(formatear_sse(e) for e in eventos if e is not None)
+                    if cerrado:
+                        await send({'type': 'http.response.body', 'body': texto.encode('utf-8')})
+                        break
+                await send({'type': 'http.response.body', 'body': texto.encode('utf-8'),
+                            'more_body': True})
+        finally:
+            desconexion.cancel()
+            publicador.desuscribir(cola)
+
+    @staticmethod
+    async def _esperar_desconexion(receive):
+        while (await receive())['type'] != 'http.disconnect':
+            pass
@@ -1,12 +1,35 @@
-from flask import Flask, render_template, request, jsonify, send_file
+from flask import (Flask, render_template, request, jsonify, send_file, send_from_directory, url_for, Response,
+                   has_request_context)
 import sqlite3
+import queue
+import csv
+import hmac
+import threading
+import weakref
+import mimetypes
 from datetime import datetime
-import pandas as pd
-from io import BytesIO
+from io import BytesIO, StringIO
 import os
+from werkzeug.test import EnvironBuilder
 from werkzeug.utils import secure_filename
+from analitica_reorden import DIAS_ENTREGA, NIVEL_SERVICIO, AnaliticaReorden
+from archivo_movimientos import ArchivoNoDisponible, adjuntar_archivos, inicio_base_activa
+from catalogos import MapaCatalogos, instalar_catalogos
+from conciliacion_stock import como_filas, conciliar_stock, instalar_stock_inicial, reparar_stock
+from exportador_reportes import TAMAÑO_LOTE, cargar_pandas, precarga_solicitada, precargar_dependencias
+from fechas import filtro_rango, instalar_fechas, limite_de_fecha, rango_de_fechas, rango_de_mes
+from kardex import COLUMNAS_KARDEX, MAX_POR_PAGINA_KARDEX, POR_PAGINA_KARDEX, consulta_kardex, parametros_kardex
+from instantaneas_stock import (RevisionInstantaneas, asegurar_instantaneas, consulta_stock_en_fecha,
+                                 instalar_instantaneas)
+from vigilante_cambios import TABLAS_VIGILADAS, instalar_registro_cambios, leer_cambios_desde, ultimo_seq
+from publicador_eventos import PublicadorEventos, PuenteCambios, eventos_perdidos, formatear_sse
+from proveedor_json import ProveedorJSONRapido
+from formatos_respuesta import consultar_filas, en_columnas, responder_documento, responder_filas
+from recursos_estaticos import (CACHE_INMUTABLE, RecursosEstaticos, comprimir_respuesta,
+                                elegir_codificacion)
 
 app = Flask(__name__)
+app.json = ProveedorJSONRapido(app)
 app.config['SECRET_KEY'] = 'ptar-inventario-2025'
 app.config['UPLOAD_FOLDER'] = 'imagenes_materiales'
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16 MB max
@@ -15,18 +38,89 @@ ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
 # Ruta a la base de datos existente
 DB_PATH = 'inventario_ptar.db'
 
+# Máximo de consultas en una llamada a /api/batch y rutas que no se pueden incluir
+MAX_PETICIONES_LOTE = 20
+RUTAS_EXCLUIDAS_LOTE = ('/api/batch', '/api/eventos', '/api/reportes/')
+
+# Segundos sin eventos tras los que se envía un comentario para mantener viva la conexión SSE
+INTERVALO_KEEPALIVE_SSE = 15
+
+# Publicador único del proceso para /api/eventos
+publicador = PublicadorEventos()
+
+# Conexiones de lectura: 256 MiB mapeados en memoria y 64 MiB de caché de páginas
+MMAP_LECTURA = 256 * 1024 * 1024
+CACHE_LECTURA_KIB = 64 * 1024
+_conexiones_hilo = threading.local()
+
+# Mapas id -> nombre de los catálogos, compartidos por todos los hilos
+catalogos = MapaCatalogos()
+# Consumo de los últimos 90 días; se actualiza solo con los movimientos nuevos
+analitica = AnaliticaReorden()
+
 def allowed_file(filename):
     """Verifica si el archivo tiene una extensión permitida"""
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def get_db_connection():
-    """Obtiene conexión a la base de datos"""
+def conectar_escritura():
+    """Conexión para las rutas que modifican datos"""
     conn = sqlite3.connect(DB_PATH, timeout=30.0)
     conn.row_factory = sqlite3.Row
     # Configurar modo WAL para mejor concurrencia
     conn.execute('PRAGMA journal_mode=WAL')
+    # Con WAL, NORMAL no puede corromper la base; un corte de luz puede perder la última transacción
+    conn.execute('PRAGMA synchronous=NORMAL')
     return conn
 
+def conectar_lectura(db_path=None, factory=sqlite3.Connection, check_same_thread=True):
+    """Conexión de solo lectura con caché grande y la base mapeada en memoria"""
+    conn = sqlite3.connect(f'file:{db_path or DB_PATH}?mode=ro', uri=True, timeout=30.0,
+                           factory=factory, check_same_thread=check_same_thread)
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA query_only=ON')
+    conn.execute(f'PRAGMA mmap_size={MMAP_LECTURA}')
+    conn.execute(f'PRAGMA cache_size=-{CACHE_LECTURA_KIB}')
+    conn.execute('PRAGMA temp_store=MEMORY')
+    return conn
+
+class ConexionLectura(sqlite3.Connection):
+    """Conexión de lectura que se conserva en su hilo: close() no la cierra
+
+    Así las páginas en caché se reutilizan entre peticiones en vez de
+    perderse al terminar cada una.
+    """
+
+    def close(self):
+        if self.in_transaction:
+            self.rollback()
+
+def conexion_lectura_hilo():
+    """Conexión de solo lectura del hilo actual (se crea la primera vez)
+
+    Se cierra cuando termina el hilo: el servidor de desarrollo y waitress
+    crean hilos nuevos, y cada uno dejaría abierta su conexión.
+    """
+    conn = getattr(_conexiones_hilo, 'lectura', None)
+    if conn is None:
+        # check_same_thread=False solo para que el cierre pueda ocurrir desde otro hilo
+        conn = _conexiones_hilo.lectura = conectar_lectura(factory=ConexionLectura,
+                                                           check_same_thread=False)
+        weakref.finalize(threading.current_thread(), sqlite3.Connection.close, conn)
+    return conn
+
+def get_db_connection():
+    """Obtiene conexión a la base de datos: de solo lectura en las rutas GET"""
+    if has_request_context() and request.method in ('GET', 'HEAD'):
+        return conexion_lectura_hilo()
+    return conectar_escritura()
+
+def publicar_stock(conn, material_id):
+    """Publica la cantidad actual de un material (llamar después de conn.commit())"""
+    material = conn.execute('SELECT id, cantidad_actual, stock_minimo FROM materiales WHERE id = ?',
+                            (material_id,)).fetchone()
+    if material:
+        publicador.publicar('stock', dict(material))
+
 def init_database():
     """Inicializa la base de datos si no existe"""
     conn = sqlite3.connect(DB_PATH)
@@ -96,11 +190,76 @@ def init_database():
         )
     ''')
 
+    # Índice para consultas de movimientos por tipo ordenadas por fecha
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_movimientos_tipo_fecha
+        ON movimientos (tipo_movimiento, fecha)
+    ''')
+
+    # Registro de cambios para sincronizar con la versión de escritorio
+    instalar_registro_cambios(conn)
+
+    # Fechas en formato único e índices para los filtros por rango
+    instalar_fechas(conn)
+
+    # Catálogos de categorías, ubicaciones, unidades, responsables y destinos
+    instalar_catalogos(conn)
+
+    # Cantidad de alta de cada material, para conciliar el stock con los movimientos
+    instalar_stock_inicial(conn, DB_PATH)
+
+    # Instantáneas mensuales para consultar el stock en fechas pasadas
+    instalar_instantaneas(conn)
+    asegurar_instantaneas(conn)
+
     conn.commit()
     conn.close()
 
-# Inicializar DB al arrancar
-init_database()
+# Copias con hash de app.js y styles.css (static/dist/)
+recursos = RecursosEstaticos(app.static_folder)
+
+def preparar_aplicacion(precargar_reportes=None):
+    """Fase de arranque: esquema de la base de datos y recursos estáticos
+
+    Importar el módulo no toca la base de datos ni el disco; quien inicia el
+    servidor (servidor.py o `python app.py`) llama a esta función una vez antes
+    de atender peticiones. Con precargar_reportes (por defecto según
+    PTAR_PRECARGAR_REPORTES) pandas y openpyxl se importan en segundo plano.
+    """
+    init_database()
+    recursos.construir()
+
+    if precargar_reportes is None:
+        precargar_reportes = precarga_solicitada()
+    if precargar_reportes:
+        precargar_dependencias()
+
+def iniciar_worker():
+    """Preparación de cada proceso del servidor de producción (servidor.py)
+
+    En gunicorn se llama después del fork: los hilos no pasan al proceso hijo,
+    así que no se pueden iniciar al importar el módulo. Devuelve los servicios
+    en segundo plano iniciados, cada uno con detener().
+    """
+    servicios = [PuenteCambios(DB_PATH, publicador), RevisionInstantaneas(DB_PATH)]
+    for servicio in servicios:
+        servicio.iniciar()
+    return servicios
+
+@app.context_processor
+def inyectar_recursos():
+    """Permite usar {{ recurso('js/app.js') }} en las plantillas"""
+    return {'recurso': lambda nombre: url_for('static', filename=recursos.ruta(nombre))}
+
+@app.after_request
+def comprimir_respuestas(respuesta):
+    """Comprime con brotli o gzip las respuestas de texto grandes"""
+    return comprimir_respuesta(respuesta, request.accept_encodings)
+
+@app.errorhandler(ArchivoNoDisponible)
+def archivo_no_disponible(e):
+    """Consulta histórica sin los años archivados: mensaje claro en lugar de un error interno"""
+    return jsonify({'error': str(e)}), 503
 
 # ===============================
 # RUTAS PRINCIPALES
@@ -111,20 +270,32 @@ def index():
     """Página principal"""
     return render_template('index.html')
 
+@app.route('/static/dist/<path:nombre>')
+def recurso_estatico(nombre):
+    """Sirve un recurso con hash en el nombre, ya comprimido si el navegador lo acepta"""
+    archivo, codificacion = recursos.variante(nombre, elegir_codificacion(request.accept_encodings))
+    respuesta = send_from_directory(recursos.carpeta_dist, archivo,
+                                    mimetype=mimetypes.guess_type(nombre)[0])
+    if codificacion:
+        respuesta.headers['Content-Encoding'] = codificacion
+    respuesta.vary.add('Accept-Encoding')
+    respuesta.headers['Cache-Control'] = CACHE_INMUTABLE
+    return respuesta
+
 # ===============================
 # API - MATERIALES
 # ===============================
 
-@app.route('/api/materiales', methods=['GET'])
-def get_materiales():
-    """Obtiene todos los materiales con filtros opcionales"""
-    categoria = request.args.get('categoria', '')
-    ubicacion = request.args.get('ubicacion', '')
-    estado = request.args.get('estado', '')
-    busqueda = request.args.get('busqueda', '')
-
-    conn = get_db_connection()
-    query = 'SELECT * FROM materiales WHERE 1=1'
+def consultar_materiales(conn, categoria='', ubicacion='', estado='', busqueda=''):
+    """Materiales filtrados como (columnas, filas), con la clase de estado para el frontend"""
+    query = '''
+        SELECT *,
+               CASE WHEN cantidad_actual <= 0 THEN 'sin-stock'
+                    WHEN cantidad_actual <= stock_minimo THEN 'stock-bajo'
+                    ELSE 'stock-normal'
+               END AS estado_clase
+        FROM materiales WHERE 1=1
+    '''
     params = []
 
     if categoria and categoria != 'Todas':
@@ -140,36 +311,40 @@ def get_materiales():
         busqueda_param = f'%{busqueda}%'
         params.extend([busqueda_param, busqueda_param, busqueda_param])
 
-    query += ' ORDER BY nombre'
-
-    materiales = conn.execute(query, params).fetchall()
-    conn.close()
+    # Filtro de estado
+    if estado == 'sin_stock':
+        query += ' AND cantidad_actual <= 0'
+    elif estado == 'stock_bajo':
+        query += ' AND cantidad_actual <= stock_minimo AND cantidad_actual > 0'
+    elif estado == 'stock_normal':
+        query += ' AND cantidad_actual > stock_minimo'
 
-    # Convertir a lista de diccionarios y aplicar filtro de estado
-    result = []
-    for m in materiales:
-        material = dict(m)
-
-        # Aplicar filtro de estado
-        if estado:
-            if estado == 'sin_stock' and material['cantidad_actual'] > 0:
-                continue
-            elif estado == 'stock_bajo' and (material['cantidad_actual'] > material['stock_minimo'] or material['cantidad_actual'] == 0):
-                continue
-            elif estado == 'stock_normal' and material['cantidad_actual'] <= material['stock_minimo']:
-                continue
+    query += ' ORDER BY nombre'
+    return consultar_filas(conn, query, params)
 
-        # Agregar clase de estado para el frontend
-        if material['cantidad_actual'] == 0:
-            material['estado_clase'] = 'sin-stock'
-        elif material['cantidad_actual'] <= material['stock_minimo']:
-            material['estado_clase'] = 'stock-bajo'
-        else:
-            material['estado_clase'] = 'stock-normal'
+def ultimo_cambio(conn):
+    """Secuencia más reciente del registro de cambios (aunque la purga lo haya vaciado)"""
+    return ultimo_seq(conn)
 
-        result.append(material)
+@app.route('/api/materiales', methods=['GET'])
+def get_materiales():
+    """Obtiene todos los materiales con filtros opcionales"""
+    conn = get_db_connection()
+    # Se lee antes que los materiales: el cliente continúa desde aquí con /api/cambios
+    # y, como mucho, vuelve a aplicar algún cambio que ya traía la lista
+    hasta = ultimo_cambio(conn)
+    columnas, materiales = consultar_materiales(
+        conn,
+        categoria=request.args.get('categoria', ''),
+        ubicacion=request.args.get('ubicacion', ''),
+        estado=request.args.get('estado', ''),
+        busqueda=request.args.get('busqueda', '')
+    )
+    conn.close()
 
-    return jsonify(result)
+    respuesta = responder_filas(request, columnas, materiales)
+    respuesta.headers['X-Cambios-Hasta'] = str(hasta)
+    return respuesta
 
 @app.route('/api/materiales/<int:id>', methods=['GET'])
 def get_material(id):
@@ -214,6 +389,8 @@ def create_material():
 
         conn.commit()
         material_id = cursor.lastrowid
+        publicador.publicar('material', {'id': material_id, 'accion': 'creado'})
+        publicar_stock(conn, material_id)
 
         return jsonify({'success': True, 'id': material_id, 'message': 'Material creado exitosamente'}), 201
 
@@ -263,6 +440,8 @@ def update_material(id):
         ))
 
         conn.commit()
+        publicador.publicar('material', {'id': id, 'accion': 'actualizado'})
+        publicar_stock(conn, id)
         return jsonify({'success': True, 'message': 'Material actualizado exitosamente'})
 
     except sqlite3.IntegrityError:
@@ -291,6 +470,7 @@ def delete_material(id):
         conn = get_db_connection()
         conn.execute('DELETE FROM materiales WHERE id = ?', (id,))
         conn.commit()
+        publicador.publicar('material', {'id': id, 'accion': 'eliminado'})
 
         return jsonify({'success': True, 'message': 'Material eliminado exitosamente'})
     except sqlite3.OperationalError as e:
@@ -307,19 +487,128 @@ def delete_material(id):
         if conn:
             conn.close()
 
+def tabla_movimientos(conn, desde):
+    """Tabla o vista con los movimientos desde `desde` (incluye los años archivados si hacen falta)
+
+    Llamar fuera de una transacción: adjuntar los archivos hace ATTACH.
+    """
+    inicio = inicio_base_activa(DB_PATH)
+    if inicio and desde < inicio:
+        return adjuntar_archivos(conn, DB_PATH)
+    return 'movimientos'
+
+def leer_stock_en_fecha(conn, limite, material_id=None):
+    """Stock justo antes de `limite` como (columnas, filas), en una sola transacción"""
+    tabla = tabla_movimientos(conn, limite)
+    # Una sola transacción de lectura: instantáneas y movimientos consistentes
+    conn.execute('BEGIN')
+    try:
+        consulta, params = consulta_stock_en_fecha(conn, limite, material_id, tabla)
+        return consultar_filas(conn, consulta, params)
+    finally:
+        conn.commit()
+
+@app.route('/api/materiales/<int:id>/stock', methods=['GET'])
+def get_stock_material(id):
+    """Stock de un material en una fecha (?fecha=AAAA-MM-DD al cierre del día o AAAA-MM-DD HH:MM:SS)"""
+    try:
+        limite = limite_de_fecha(request.args.get('fecha'))
+    except ValueError:
+        return jsonify({'error': 'Fecha inválida, use AAAA-MM-DD o AAAA-MM-DD HH:MM:SS'}), 400
+
+    conn = get_db_connection()
+    try:
+        columnas, filas = leer_stock_en_fecha(conn, limite, id)
+    finally:
+        conn.close()
+
+    if not filas:
+        return jsonify({'error': 'Material no encontrado en esa fecha'}), 404
+
+    return jsonify({'fecha': request.args.get('fecha'), **dict(zip(columnas, filas[0]))})
+
+@app.route('/api/stock', methods=['GET'])
+def get_stock():
+    """Stock de todos los materiales en una fecha (?fecha=AAAA-MM-DD o AAAA-MM-DD HH:MM:SS)"""
+    try:
+        limite = limite_de_fecha(request.args.get('fecha'))
+    except ValueError:
+        return jsonify({'error': 'Fecha inválida, use AAAA-MM-DD o AAAA-MM-DD HH:MM:SS'}), 400
+
+    conn = get_db_connection()
+    try:
+        columnas, filas = leer_stock_en_fecha(conn, limite)
+    finally:
+        conn.close()
+
+    return responder_filas(request, columnas, filas)
+
+def leer_kardex(conn, material_id, desde=None, hasta=None, pagina=1, por_pagina=POR_PAGINA_KARDEX):
+    """Una página del kardex de un material como documento, o None si el material no existe"""
+    tabla = tabla_movimientos(conn, desde or '')
+    # Una sola transacción de lectura: saldo inicial, total y página consistentes
+    conn.execute('BEGIN')
+    try:
+        material = conn.execute('''
+            SELECT id, codigo, nombre, unidad, cantidad_actual FROM materiales WHERE id = ?
+        ''', (material_id,)).fetchone()
+        if material is None:
+            return None
+
+        params = parametros_kardex(conn, material_id, desde, hasta, tabla)
+        consulta = consulta_kardex(desde, hasta, tabla)
+        total = conn.execute(f'SELECT COUNT(*) FROM ({consulta})', params).fetchone()[0]
+        columnas, filas = consultar_filas(conn, consulta + ' LIMIT :limite OFFSET :desplazamiento', {
+            **params, 'limite': por_pagina, 'desplazamiento': (pagina - 1) * por_pagina
+        })
+        return {
+            'material': dict(zip(('id', 'codigo', 'nombre', 'unidad', 'cantidad_actual'), material)),
+            'saldo_inicial': params['saldo_inicial'],
+            'total': total,
+            'pagina': pagina,
+            'por_pagina': por_pagina,
+            'movimientos': en_columnas(columnas, filas)
+        }
+    finally:
+        conn.commit()
+
+@app.route('/api/materiales/<int:id>/kardex', methods=['GET'])
+def get_kardex(id):
+    """Movimientos de un material con su saldo (?desde=, ?hasta=, ?pagina=, ?por_pagina=)"""
+    try:
+        desde, hasta = rango_de_fechas(request.args.get('desde'), request.args.get('hasta'))
+    except ValueError:
+        return jsonify({'error': 'Fecha inválida, use AAAA-MM-DD o AAAA-MM-DD HH:MM:SS'}), 400
+
+    pagina = max(request.args.get('pagina', 1, type=int), 1)
+    por_pagina = min(max(request.args.get('por_pagina', POR_PAGINA_KARDEX, type=int), 1),
+                     MAX_POR_PAGINA_KARDEX)
+
+    conn = get_db_connection()
+    try:
+        datos = leer_kardex(conn, id, desde, hasta, pagina, por_pagina)
+    finally:
+        conn.close()
+
+    if datos is None:
+        return jsonify({'error': 'Material no encontrado'}), 404
+
+    return responder_documento(request, datos)
+
 # ===============================
 # API - MOVIMIENTOS
 # ===============================
 
-@app.route('/api/movimientos', methods=['GET'])
-def get_movimientos():
-    """Obtiene historial de movimientos"""
-    tipo = request.args.get('tipo', '')
+def consultar_movimientos(conn, tipo='', desde=None, hasta=None):
+    """Movimientos (opcionalmente de un tipo) como (columnas, filas)
 
-    conn = get_db_connection()
-    query = '''
+    Sin rango devuelve los últimos 100; con `desde` (inclusivo) o `hasta`
+    (exclusivo) devuelve todos los del rango, incluidos los años archivados.
+    """
+    tabla = tabla_movimientos(conn, desde) if desde else 'movimientos'
+    query = f'''
         SELECT m.*, mat.nombre as material_nombre, mat.codigo as material_codigo
-        FROM movimientos m
+        FROM {tabla} m
         JOIN materiales mat ON m.material_id = mat.id
         WHERE 1=1
     '''
@@ -329,12 +618,25 @@ def get_movimientos():
         query += ' AND m.tipo_movimiento = ?'
         params.append(tipo)
 
-    query += ' ORDER BY m.fecha DESC LIMIT 100'
+    query += filtro_rango('m.fecha', desde, hasta, params)
+    query += ' ORDER BY m.fecha DESC'
+    if not (desde or hasta):
+        query += ' LIMIT 100'
+    return consultar_filas(conn, query, params)
 
-    movimientos = conn.execute(query, params).fetchall()
+@app.route('/api/movimientos', methods=['GET'])
+def get_movimientos():
+    """Obtiene historial de movimientos (?tipo=, ?desde= y ?hasta= con AAAA-MM-DD)"""
+    try:
+        desde, hasta = rango_de_fechas(request.args.get('desde'), request.args.get('hasta'))
+    except ValueError:
+        return jsonify({'error': 'Fecha inválida, use AAAA-MM-DD o AAAA-MM-DD HH:MM:SS'}), 400
+
+    conn = get_db_connection()
+    columnas, movimientos = consultar_movimientos(conn, request.args.get('tipo', ''), desde, hasta)
     conn.close()
 
-    return jsonify([dict(m) for m in movimientos])
+    return responder_filas(request, columnas, movimientos)
 
 @app.route('/api/movimientos/entrada', methods=['POST'])
 def registrar_entrada():
@@ -359,6 +661,7 @@ def registrar_entrada():
             data['origen'],
             data.get('observaciones', '')
         ))
+        movimiento_id = cursor.lastrowid
 
         # Actualizar cantidad en inventario
         cursor.execute('''
@@ -368,6 +671,9 @@ def registrar_entrada():
         ''', (data['cantidad'], data['material_id']))
 
         conn.commit()
+        publicar_stock(conn, data['material_id'])
+        publicador.publicar('movimiento', {'id': movimiento_id, 'material_id': data['material_id'],
+                                           'tipo_movimiento': 'ENTRADA', 'cantidad': data['cantidad']})
 
         return jsonify({'success': True, 'message': 'Entrada registrada exitosamente'})
 
@@ -418,6 +724,7 @@ def registrar_salida():
             data['destino'],
             data.get('observaciones', '')
         ))
+        movimiento_id = cursor.lastrowid
 
         # Actualizar cantidad en inventario
         cursor.execute('''
@@ -427,6 +734,9 @@ def registrar_salida():
         ''', (data['cantidad'], data['material_id']))
 
         conn.commit()
+        publicar_stock(conn, data['material_id'])
+        publicador.publicar('movimiento', {'id': movimiento_id, 'material_id': data['material_id'],
+                                           'tipo_movimiento': 'SALIDA', 'cantidad': data['cantidad']})
 
         return jsonify({'success': True, 'message': 'Salida registrada exitosamente'})
 
@@ -448,20 +758,31 @@ def registrar_salida():
 # API - PRÉSTAMOS
 # ===============================
 
-@app.route('/api/prestamos', methods=['GET'])
-def get_prestamos():
-    """Obtiene préstamos activos"""
-    conn = get_db_connection()
-    prestamos = conn.execute('''
+def consultar_prestamos_activos(conn, desde=None, hasta=None):
+    """Préstamos activos (opcionalmente prestados en un rango) como (columnas, filas)"""
+    params = []
+    filtro = filtro_rango('p.fecha_prestamo', desde, hasta, params)
+    return consultar_filas(conn, f'''
         SELECT p.*, m.nombre as material_nombre, m.codigo as material_codigo
         FROM prestamos p
         JOIN materiales m ON p.material_id = m.id
-        WHERE p.estado = 'ACTIVO'
+        WHERE p.estado = 'ACTIVO' {filtro}
         ORDER BY p.fecha_prestamo DESC
-    ''').fetchall()
+    ''', params)
+
+@app.route('/api/prestamos', methods=['GET'])
+def get_prestamos():
+    """Obtiene préstamos activos (?desde= y ?hasta= con AAAA-MM-DD)"""
+    try:
+        desde, hasta = rango_de_fechas(request.args.get('desde'), request.args.get('hasta'))
+    except ValueError:
+        return jsonify({'error': 'Fecha inválida, use AAAA-MM-DD o AAAA-MM-DD HH:MM:SS'}), 400
+
+    conn = get_db_connection()
+    columnas, prestamos = consultar_prestamos_activos(conn, desde, hasta)
     conn.close()
 
-    return jsonify([dict(p) for p in prestamos])
+    return responder_filas(request, columnas, prestamos)
 
 @app.route('/api/prestamos', methods=['POST'])
 def registrar_prestamo():
@@ -496,6 +817,7 @@ def registrar_prestamo():
             data['area_destino'],
             data.get('observaciones', '')
         ))
+        prestamo_id = cursor.lastrowid
 
         # Actualizar cantidad en inventario
         cursor.execute('''
@@ -517,8 +839,13 @@ def registrar_prestamo():
             data['area_destino'],
             data.get('observaciones', '')
         ))
+        movimiento_id = cursor.lastrowid
 
         conn.commit()
+        publicar_stock(conn, data['material_id'])
+        publicador.publicar('movimiento', {'id': movimiento_id, 'material_id': data['material_id'],
+                                           'tipo_movimiento': 'PRÉSTAMO', 'cantidad': data['cantidad']})
+        publicador.publicar('prestamo', {'id': prestamo_id, 'material_id': data['material_id'], 'estado': 'ACTIVO'})
 
         return jsonify({'success': True, 'message': 'Préstamo registrado exitosamente'})
 
@@ -580,8 +907,13 @@ def devolver_prestamo(id):
             prestamo['area_destino'],
             'Devolución de préstamo'
         ))
+        movimiento_id = cursor.lastrowid
 
         conn.commit()
+        publicar_stock(conn, prestamo['material_id'])
+        publicador.publicar('movimiento', {'id': movimiento_id, 'material_id': prestamo['material_id'],
+                                           'tipo_movimiento': 'DEVOLUCIÓN', 'cantidad': prestamo['cantidad']})
+        publicador.publicar('prestamo', {'id': id, 'material_id': prestamo['material_id'], 'estado': 'DEVUELTO'})
 
         return jsonify({'success': True, 'message': 'Préstamo devuelto exitosamente'})
 
@@ -603,19 +935,31 @@ def devolver_prestamo(id):
 # API - MATERIAL EN USO
 # ===============================
 
-@app.route('/api/material-en-uso', methods=['GET'])
-def get_material_en_uso():
-    """Obtiene material en uso"""
-    conn = get_db_connection()
-    material_uso = conn.execute('''
+def consultar_material_en_uso(conn, desde=None, hasta=None):
+    """Material en uso (opcionalmente instalado en un rango) como (columnas, filas)"""
+    params = []
+    filtro = filtro_rango('mu.fecha_instalacion', desde, hasta, params)
+    return consultar_filas(conn, f'''
         SELECT mu.*, m.nombre as material_nombre, m.codigo as material_codigo
         FROM material_en_uso mu
         JOIN materiales m ON mu.material_id = m.id
+        WHERE 1=1 {filtro}
         ORDER BY mu.fecha_instalacion DESC
-    ''').fetchall()
+    ''', params)
+
+@app.route('/api/material-en-uso', methods=['GET'])
+def get_material_en_uso():
+    """Obtiene material en uso (?desde= y ?hasta= con AAAA-MM-DD)"""
+    try:
+        desde, hasta = rango_de_fechas(request.args.get('desde'), request.args.get('hasta'))
+    except ValueError:
+        return jsonify({'error': 'Fecha inválida, use AAAA-MM-DD o AAAA-MM-DD HH:MM:SS'}), 400
+
+    conn = get_db_connection()
+    columnas, material_uso = consultar_material_en_uso(conn, desde, hasta)
     conn.close()
 
-    return jsonify([dict(m) for m in material_uso])
+    return responder_filas(request, columnas, material_uso)
 
 @app.route('/api/material-en-uso', methods=['POST'])
 def registrar_material_uso():
@@ -650,6 +994,7 @@ def registrar_material_uso():
             data['responsable'],
             data.get('observaciones', '')
         ))
+        material_uso_id = cursor.lastrowid
 
         # Actualizar cantidad en inventario
         cursor.execute('''
@@ -671,8 +1016,13 @@ def registrar_material_uso():
             data['equipo_instalacion'],
             data.get('observaciones', '')
         ))
+        movimiento_id = cursor.lastrowid
 
         conn.commit()
+        publicar_stock(conn, data['material_id'])
+        publicador.publicar('movimiento', {'id': movimiento_id, 'material_id': data['material_id'],
+                                           'tipo_movimiento': 'EN USO', 'cantidad': data['cantidad']})
+        publicador.publicar('material_en_uso', {'id': material_uso_id, 'material_id': data['material_id']})
 
         return jsonify({'success': True, 'message': 'Material en uso registrado exitosamente'})
 
@@ -694,11 +1044,8 @@ def registrar_material_uso():
 # API - ESTADÍSTICAS
 # ===============================
 
-@app.route('/api/estadisticas', methods=['GET'])
-def get_estadisticas():
-    """Obtiene estadísticas del inventario"""
-    conn = get_db_connection()
-
+def calcular_estadisticas(conn):
+    """Estadísticas del inventario"""
     # Total de materiales
     total_materiales = conn.execute('SELECT COUNT(*) as total FROM materiales').fetchone()['total']
 
@@ -710,7 +1057,7 @@ def get_estadisticas():
 
     # Materiales sin stock
     sin_stock = conn.execute('''
-        SELECT COUNT(*) as total FROM materiales WHERE cantidad_actual = 0
+        SELECT COUNT(*) as total FROM materiales WHERE cantidad_actual <= 0
     ''').fetchone()['total']
 
     # Préstamos activos
@@ -723,21 +1070,18 @@ def get_estadisticas():
         SELECT COUNT(*) as total FROM material_en_uso
     ''').fetchone()['total']
 
-    # Movimientos del mes
-    mes_actual = datetime.now().strftime('%Y-%m')
+    # Movimientos del mes (rango sobre idx_movimientos_fecha)
     movimientos_mes = conn.execute('''
         SELECT COUNT(*) as total FROM movimientos
-        WHERE fecha LIKE ?
-    ''', (f'{mes_actual}%',)).fetchone()['total']
+        WHERE fecha >= ? AND fecha < ?
+    ''', rango_de_mes(datetime.now())).fetchone()['total']
 
     # Valor total del inventario
     valor_total = conn.execute('''
         SELECT SUM(cantidad_actual * costo_unitario) as total FROM materiales
     ''').fetchone()['total'] or 0
 
-    conn.close()
-
-    return jsonify({
+    return {
         'total_materiales': total_materiales,
         'stock_bajo': stock_bajo,
         'sin_stock': sin_stock,
@@ -745,6 +1089,214 @@ def get_estadisticas():
         'material_en_uso': material_en_uso_total,
         'movimientos_mes': movimientos_mes,
         'valor_total': round(valor_total, 2)
+    }
+
+@app.route('/api/estadisticas', methods=['GET'])
+def get_estadisticas():
+    """Obtiene estadísticas del inventario"""
+    conn = get_db_connection()
+    estadisticas = calcular_estadisticas(conn)
+    conn.close()
+
+    return jsonify(estadisticas)
+
+# ===============================
+# API - ANALÍTICA
+# ===============================
+
+def parametros_reorden(args):
+    """(días de entrega, nivel de servicio) de ?dias_entrega= y ?nivel_servicio=
+
+    Lanza ValueError si alguno está fuera de rango.
+    """
+    dias_entrega = args.get('dias_entrega', DIAS_ENTREGA, type=float)
+    nivel_servicio = args.get('nivel_servicio', NIVEL_SERVICIO, type=float)
+    if not 0 < dias_entrega <= 365 or not 0.5 <= nivel_servicio <= 0.999:
+        raise ValueError((dias_entrega, nivel_servicio))
+    return dias_entrega, nivel_servicio
+
+def leer_reorden(conn, dias_entrega=DIAS_ENTREGA, nivel_servicio=NIVEL_SERVICIO, solo_reorden=False):
+    """(columnas, filas) del consumo y punto de reorden de cada material"""
+    analitica.actualizar(conn)
+    columnas, filas = analitica.calcular(conn, dias_entrega, nivel_servicio)
+    if solo_reorden:
+        filas = [fila for fila in filas if fila[-1]]
+    return columnas, filas
+
+@app.route('/api/analitica/reorden', methods=['GET'])
+def get_reorden():
+    """Consumo diario, días de cobertura y punto de reorden (?dias_entrega=, ?nivel_servicio=, ?solo_reorden=1)"""
+    try:
+        dias_entrega, nivel_servicio = parametros_reorden(request.args)
+    except ValueError:
+        return jsonify({'error': 'Use dias_entrega entre 0 y 365 y nivel_servicio entre 0.5 y 0.999'}), 400
+
+    conn = get_db_connection()
+    try:
+        columnas, filas = leer_reorden(conn, dias_entrega, nivel_servicio,
+                                       request.args.get('solo_reorden') == '1')
+    finally:
+        conn.close()
+
+    return responder_filas(request, columnas, filas)
+
+# ===============================
+# API - CAMBIOS (SINCRONIZACIÓN INCREMENTAL)
+# ===============================
+
+def leer_cambios(conn, args):
+    """Cambios posteriores a ?desde= (con ?limite= y ?tablas=) en una sola transacción"""
+    desde = args.get('desde', 0, type=int)
+    limite = min(args.get('limite', 1000, type=int), 5000)
+    tablas = args.get('tablas', '')
+    tablas = set(tablas.split(',')) & set(TABLAS_VIGILADAS) if tablas else None
+
+    # Una sola transacción de lectura: registro de cambios y filas consistentes
+    conn.execute('BEGIN')
+    try:
+        return leer_cambios_desde(conn, desde, limite, tablas)
+    finally:
+        conn.commit()
+
+@app.route('/api/cambios', methods=['GET'])
+def get_cambios():
+    """Obtiene los cambios posteriores a una secuencia (?desde=<seq>&tablas=materiales,...)"""
+    conn = get_db_connection()
+    try:
+        resultado = leer_cambios(conn, request.args)
+    finally:
+        conn.close()
+
+    return jsonify(resultado)
+
+# ===============================
+# API - CARGA INICIAL Y LOTES
+# ===============================
+
+def leer_catalogos(conn):
+    """Catálogos como {catálogo: [[id, nombre], ...]}; solo consulta la base si cambiaron"""
+    catalogos.actualizar(conn)
+    return catalogos.como_listas()
+
+@app.route('/api/catalogos', methods=['GET'])
+def get_catalogos():
+    """Valores de los filtros: categorías, ubicaciones, unidades, responsables y destinos"""
+    conn = get_db_connection()
+    try:
+        datos = leer_catalogos(conn)
+    finally:
+        conn.close()
+
+    return responder_documento(request, datos)
+
+def leer_bootstrap(conn, incluir_materiales=True):
+    """Datos de la primera pantalla"""
+    # Una sola transacción de lectura: todas las secciones ven el mismo estado
+    conn.execute('BEGIN')
+    try:
+        datos = {
+            'cambios_hasta': ultimo_cambio(conn),
+            'estadisticas': calcular_estadisticas(conn),
+            'prestamos': en_columnas(*consultar_prestamos_activos(conn)),
+            'material_en_uso': en_columnas(*consultar_material_en_uso(conn)),
+            'entradas': en_columnas(*consultar_movimientos(conn, 'ENTRADA')),
+            'salidas': en_columnas(*consultar_movimientos(conn, 'SALIDA')),
+            'catalogos': leer_catalogos(conn)
+        }
+        if incluir_materiales:
+            datos['materiales'] = en_columnas(*consultar_materiales(conn))
+        return datos
+    finally:
+        conn.commit()
+
+@app.route('/api/bootstrap', methods=['GET'])
+def bootstrap():
+    """Datos de la primera pantalla leídos en una sola transacción (?materiales=0 omite el catálogo)"""
+    conn = get_db_connection()
+    try:
+        datos = leer_bootstrap(conn, request.args.get('materiales', '1') != '0')
+    finally:
+        conn.close()
+
+    return responder_documento(request, datos)
+
+def ejecutar_subpeticion(url):
+    """Ejecuta una consulta GET de la API dentro de /api/batch"""
+    if not isinstance(url, str):
+        return {'url': url, 'status': 400, 'body': {'error': 'URL inválida'}}
+
+    ruta, _, consulta = url.partition('?')
+    if not ruta.startswith('/api/') or ruta.startswith(RUTAS_EXCLUIDAS_LOTE):
+        return {'url': url, 'status': 400, 'body': {'error': 'Ruta no permitida en un lote'}}
+
+    entorno = EnvironBuilder(path=ruta, query_string=consulta, method='GET',
+                             headers={'Accept': 'application/json'}).get_environ()
+    try:
+        with app.request_context(entorno):
+            respuesta = app.full_dispatch_request()
+    except Exception as e:
+        return {'url': url, 'status': 500, 'body': {'error': str(e)}}
+
+    return {'url': url, 'status': respuesta.status_code, 'body': respuesta.get_json(silent=True)}
+
+@app.route('/api/batch', methods=['POST'])
+def batch():
+    """Ejecuta varias consultas GET en una sola llamada
+
+    Cuerpo: {"peticiones": ["/api/estadisticas", "/api/movimientos?tipo=SALIDA", ...]}
+    """
+    peticiones = (request.get_json(silent=True) or {}).get('peticiones')
+
+    if not isinstance(peticiones, list) or not peticiones:
+        return jsonify({'error': 'Se requiere una lista de peticiones'}), 400
+
+    if len(peticiones) > MAX_PETICIONES_LOTE:
+        return jsonify({'error': f'Máximo {MAX_PETICIONES_LOTE} peticiones por lote'}), 400
+
+    return jsonify({'respuestas': [ejecutar_subpeticion(url) for url in peticiones]})
+
+# ===============================
+# API - EVENTOS EN TIEMPO REAL (SSE)
+# ===============================
+
+@app.route('/api/eventos', methods=['GET'])
+def eventos():
+    """Flujo Server-Sent Events con cambios de stock, movimientos y préstamos"""
+    ultimo_id = request.headers.get('Last-Event-ID', type=int)
+    # Primero la suscripción: lo que se confirme mientras se leen los perdidos llega por la cola
+    cola = publicador.suscribir()
+    perdidos = []
+    if ultimo_id is not None:
+        conn = get_db_connection()
+        try:
+            perdidos = eventos_perdidos(conn, ultimo_id)
+        except Exception:
+            publicador.desuscribir(cola)
+            raise
+        finally:
+            conn.close()
+
+    def generar():
+        try:
+            yield 'retry: 5000\n\n'
+            for evento in perdidos:
+                yield formatear_sse(evento)
+            while True:
+                try:
+                    evento = cola.get(timeout=INTERVALO_KEEPALIVE_SSE)
+                except queue.Empty:
+                    yield ': keepalive\n\n'
+                    continue
+                if evento is None:
+                    # El publicador cerró el flujo de un cliente demasiado lento
+                    break
+                yield formatear_sse(evento)
+        finally:
+            publicador.desuscribir(cola)
+
+    return Response(generar(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
     })
 
 # ===============================
@@ -804,6 +1356,7 @@ def serve_imagen(filename):
 def reporte_inventario():
     """Genera reporte de inventario completo en Excel"""
     try:
+        pd = cargar_pandas()
         conn = get_db_connection()
         df = pd.read_sql_query('SELECT * FROM materiales ORDER BY nombre', conn)
         conn.close()
@@ -831,6 +1384,7 @@ def reporte_inventario():
 def reporte_stock_bajo():
     """Genera reporte de materiales con stock bajo"""
     try:
+        pd = cargar_pandas()
         conn = get_db_connection()
         df = pd.read_sql_query('''
             SELECT * FROM materiales
@@ -857,20 +1411,63 @@ def reporte_stock_bajo():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/reportes/reorden', methods=['GET'])
+def reporte_reorden():
+    """Genera reporte de consumo y puntos de reorden (?dias_entrega=, ?nivel_servicio=)"""
+    try:
+        dias_entrega, nivel_servicio = parametros_reorden(request.args)
+    except ValueError:
+        return jsonify({'error': 'Use dias_entrega entre 0 y 365 y nivel_servicio entre 0.5 y 0.999'}), 400
+
+    try:
+        pd = cargar_pandas()
+        conn = get_db_connection()
+        try:
+            columnas, filas = leer_reorden(conn, dias_entrega, nivel_servicio)
+        finally:
+            conn.close()
+        df = pd.DataFrame(filas, columns=columnas)
+
+        output = BytesIO()
+        with pd.ExcelWriter(output, engine='openpyxl') as writer:
+            df.to_excel(writer, index=False, sheet_name='Reorden')
+
+        output.seek(0)
+
+        filename = f'reorden_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx'
+
+        return send_file(
+            output,
+            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+            as_attachment=True,
+            download_name=filename
+        )
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/reportes/movimientos', methods=['GET'])
 def reporte_movimientos():
-    """Genera reporte de movimientos del mes"""
+    """Genera reporte de movimientos del mes (?mes=AAAA-MM, por defecto el actual)"""
     try:
-        mes_actual = datetime.now().strftime('%Y-%m')
-
+        mes_actual = request.args.get('mes') or datetime.now().strftime('%Y-%m')
+        try:
+            inicio_mes = datetime.strptime(mes_actual, '%Y-%m')
+        except ValueError:
+            return jsonify({'error': 'Mes inválido, use AAAA-MM'}), 400
+        desde, hasta = rango_de_mes(inicio_mes)
+
+        pd = cargar_pandas()
         conn = get_db_connection()
-        df = pd.read_sql_query('''
+        # Los meses de años archivados se leen de la vista con los archivos adjuntos
+        tabla = tabla_movimientos(conn, desde)
+        df = pd.read_sql_query(f'''
             SELECT m.*, mat.nombre as material_nombre, mat.codigo as material_codigo
-            FROM movimientos m
+            FROM {tabla} m
             JOIN materiales mat ON m.material_id = mat.id
-            WHERE m.fecha LIKE ?
+            WHERE m.fecha >= ? AND m.fecha < ?
             ORDER BY m.fecha DESC
-        ''', conn, params=(f'{mes_actual}%',))
+        ''', conn, params=(desde, hasta))
         conn.close()
 
         output = BytesIO()
@@ -891,6 +1488,100 @@ def reporte_movimientos():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/reportes/kardex/<int:id>', methods=['GET'])
+def reporte_kardex(id):
+    """Kardex completo de un material en CSV, enviado por partes (?desde= y ?hasta=)"""
+    try:
+        desde, hasta = rango_de_fechas(request.args.get('desde'), request.args.get('hasta'))
+    except ValueError:
+        return jsonify({'error': 'Fecha inválida, use AAAA-MM-DD o AAAA-MM-DD HH:MM:SS'}), 400
+
+    # Conexión propia: se mantiene abierta mientras el cliente descarga
+    conn = conectar_lectura()
+    try:
+        tabla = tabla_movimientos(conn, desde or '')
+        conn.execute('BEGIN')
+        material = conn.execute('SELECT codigo FROM materiales WHERE id = ?', (id,)).fetchone()
+        if material is None:
+            conn.close()
+            return jsonify({'error': 'Material no encontrado'}), 404
+        cursor = conn.execute(consulta_kardex(desde, hasta, tabla),
+                              parametros_kardex(conn, id, desde, hasta, tabla))
+    except Exception:
+        conn.close()
+        raise
+
+    def generar():
+        try:
+            salida = StringIO()
+            escritor = csv.writer(salida)
+            # BOM para que Excel reconozca UTF-8
+            salida.write('\ufeff')
+            escritor.writerow(COLUMNAS_KARDEX)
+            while True:
+                filas = cursor.fetchmany(TAMAÑO_LOTE)
+                if not filas:
+                    break
+                escritor.writerows(filas)
+                yield salida.getvalue()
+                salida.seek(0)
+                salida.truncate()
+            if salida.getvalue():
+                yield salida.getvalue()
+        finally:
+            conn.close()
+
+    filename = f'kardex_{material["codigo"]}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
+    respuesta = Response(generar(), mimetype='text/csv', headers={
+        'Content-Disposition': f'attachment; filename="{secure_filename(filename)}"'
+    })
+    # El servidor cierra la respuesta aunque nunca la recorra (HEAD, cliente que corta antes del cuerpo)
+    respuesta.call_on_close(conn.close)
+    return respuesta
+
+# ===============================
+# API - ADMINISTRACIÓN
+# ===============================
+
+def admin_autorizado():
+    """La petición envía en X-Clave-Admin la clave de PTAR_CLAVE_ADMIN
+
+    Sin clave configurada solo se permiten las consultas (GET): corregir datos
+    siempre requiere la clave.
+    """
+    clave = os.environ.get('PTAR_CLAVE_ADMIN')
+    if not clave:
+        return request.method == 'GET'
+    # Comparación en tiempo constante: no revela cuántos caracteres coinciden
+    return hmac.compare_digest(request.headers.get('X-Clave-Admin', '').encode(), clave.encode())
+
+@app.route('/api/admin/conciliacion', methods=['GET', 'POST'])
+def conciliacion():
+    """Materiales cuyo stock no cuadra con los movimientos; POST además los corrige"""
+    if not admin_autorizado():
+        return jsonify({'error': 'No autorizado'}), 403
+
+    try:
+        reparados = []
+        if request.method == 'POST':
+            reparados = reparar_stock(DB_PATH)
+            if reparados:
+                conn = get_db_connection()
+                try:
+                    for material_id in reparados:
+                        publicar_stock(conn, material_id)
+                finally:
+                    conn.close()
+        diferencias, integridad = conciliar_stock(DB_PATH)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+    return responder_documento(request, {
+        'diferencias': en_columnas(*como_filas(diferencias)),
+        'integridad': integridad,
+        'reparados': reparados
+    })
+
 if __name__ == '__main__':
     print("=" * 60)
     print("SISTEMA DE INVENTARIO PTAR - VERSIÓN WEB")
@@ -901,4 +1592,5 @@ if __name__ == '__main__':
     print(f"\n Presiona Ctrl+C para detener el servidor\n")
     print("=" * 60)
 
+    preparar_aplicacion()
     app.run(debug=True, host='0.0.0.0', port=5000)
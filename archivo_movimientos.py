@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Archivo anual de movimientos en bases SQLite aparte
+
+Los movimientos de los años cerrados se mueven de inventario_ptar.db a
+archivo/movimientos_AAAA.db, de modo que la base activa (consultas, respaldos
+y VACUUM) no crece con los años. Los archivos ya no cambian: basta con
+respaldarlos una vez.
+
+Las consultas históricas usan adjuntar_archivos(), que hace ATTACH de cada año
+y crea la vista temporal `movimientos_historicos` (UNION ALL de la tabla activa
+y los archivos) en la conexión. SQLite admite hasta 10 bases adjuntas, así
+que no se archivan más de MAX_ANIOS_ARCHIVADOS años: los siguientes se quedan
+en la base activa.
+
+Archivar es repetible: si se interrumpe entre copiar y borrar, volver a
+ejecutarlo termina el trabajo sin duplicar filas en el archivo.
+
+Uso:
+    python archivo_movimientos.py [--db inventario_ptar.db] [--conservar 2] [--vacuum]
+"""
+import argparse
+import os
+import re
+import sqlite3
+from datetime import datetime
+
+from instantaneas_stock import asegurar_instantaneas, instalar_instantaneas
+
+CARPETA_ARCHIVO = 'archivo'
+PATRON_ARCHIVO = re.compile(r'^movimientos_(\d{4})\.db$')
+VISTA_HISTORICA = 'movimientos_historicos'
+
+# Años que permanecen en la base activa: el actual y el anterior
+ANIOS_EN_BASE = 2
+
+# Límite de bases adjuntas de SQLite (SQLITE_MAX_ATTACHED)
+MAX_ANIOS_ARCHIVADOS = 10
+
+
+class ArchivoNoDisponible(Exception):
+    """No se pudieron adjuntar los años archivados a la conexión"""
+
+
+def carpeta_archivo(db_path):
+    return os.path.join(os.path.dirname(os.path.abspath(db_path)), CARPETA_ARCHIVO)
+
+
+def ruta_archivo(db_path, anio):
+    return os.path.join(carpeta_archivo(db_path), f'movimientos_{anio}.db')
+
+
+def anios_archivados(db_path):
+    """Años con archivo, de menor a mayor"""
+    try:
+        nombres = os.listdir(carpeta_archivo(db_path))
+    except FileNotFoundError:
+        return []
+    return sorted(int(m.group(1)) for m in map(PATRON_ARCHIVO.match, nombres) if m)
+
+
+def inicio_base_activa(db_path):
+    """Primer instante cuyos movimientos están en la base activa (None si no hay archivos)"""
+    anios = anios_archivados(db_path)
+    return f'{anios[-1] + 1}-01-01 00:00:00' if anios else None
+
+
+def columnas_movimientos(conn, esquema='main'):
+    return [fila[1] for fila in conn.execute(f'PRAGMA {esquema}.table_info(movimientos)')]
+
+
+def anios_archivables(conn, conservar=ANIOS_EN_BASE, ahora=None):
+    """Años con movimientos en la base activa anteriores a los `conservar` más recientes"""
+    primer_anio_activo = (ahora or datetime.now()).year - conservar + 1
+    return [int(fila[0]) for fila in conn.execute('''
+        SELECT DISTINCT substr(fecha, 1, 4) FROM movimientos
+        WHERE fecha < ? ORDER BY 1
+    ''', (f'{primer_anio_activo}-01-01',)) if fila[0] and fila[0].isdigit()]
+
+
+def archivar_anio(conn, db_path, anio):
+    """Mueve los movimientos de `anio` a su archivo y devuelve cuántos se movieron
+
+    `conn` es una conexión de escritura a la base activa sin transacción abierta.
+    Lanza ArchivoNoDisponible si ya hay MAX_ANIOS_ARCHIVADOS años archivados.
+    """
+    if not archivo_admite(db_path, anio):
+        raise ArchivoNoDisponible(
+            f'Ya hay {MAX_ANIOS_ARCHIVADOS} años archivados (límite de SQLite); {anio} se queda en la base activa')
+    os.makedirs(carpeta_archivo(db_path), exist_ok=True)
+    desde, hasta = f'{anio}-01-01 00:00:00', f'{anio + 1}-01-01 00:00:00'
+    alias = f'archivo_{anio}'
+
+    # Las consultas de stock posteriores al año archivado parten de la instantánea del 1 de enero
+    instalar_instantaneas(conn)
+    asegurar_instantaneas(conn)
+    conn.commit()
+
+    conn.execute('ATTACH DATABASE ? AS ' + alias, (ruta_archivo(db_path, anio),))
+    try:
+        definicion = conn.execute(
+            "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'movimientos'").fetchone()[0]
+        conn.execute(re.sub(r'^CREATE TABLE\s+movimientos',
+                            f'CREATE TABLE IF NOT EXISTS {alias}.movimientos', definicion.strip()))
+        conn.execute(f'''CREATE INDEX IF NOT EXISTS {alias}.idx_movimientos_material_fecha
+                         ON movimientos (material_id, fecha)''')
+        conn.execute(f'''CREATE INDEX IF NOT EXISTS {alias}.idx_movimientos_fecha
+                         ON movimientos (fecha)''')
+
+        columnas = ', '.join(columnas_movimientos(conn))
+        # 1. Copiar (OR IGNORE: las filas copiadas en un intento anterior no se duplican)
+        conn.execute(f'''
+            INSERT OR IGNORE INTO {alias}.movimientos ({columnas})
+            SELECT {columnas} FROM main.movimientos WHERE fecha >= ? AND fecha < ?
+        ''', (desde, hasta))
+        conn.commit()
+
+        # 2. Borrar de la base activa solo si todas las filas están en el archivo
+        faltantes = conn.execute(f'''
+            SELECT COUNT(*) FROM main.movimientos m
+            WHERE m.fecha >= ? AND m.fecha < ?
+              AND NOT EXISTS (SELECT 1 FROM {alias}.movimientos a WHERE a.id = m.id)
+        ''', (desde, hasta)).fetchone()[0]
+        if faltantes:
+            raise sqlite3.DatabaseError(f'{faltantes} movimientos de {anio} no se copiaron al archivo')
+
+        movidos = conn.execute('DELETE FROM main.movimientos WHERE fecha >= ? AND fecha < ?',
+                               (desde, hasta)).rowcount
+        conn.commit()
+        return movidos
+    finally:
+        if conn.in_transaction:
+            conn.rollback()
+        conn.execute('DETACH DATABASE ' + alias)
+
+
+def archivar_anios_cerrados(conn, db_path, conservar=ANIOS_EN_BASE):
+    """Archiva los años anteriores a los `conservar` más recientes; {año: movidos}
+
+    Sin pasar de MAX_ANIOS_ARCHIVADOS: los años que no caben se quedan en la
+    base activa (ver anios_sin_espacio).
+    """
+    return {anio: archivar_anio(conn, db_path, anio)
+            for anio in anios_archivables(conn, conservar) if archivo_admite(db_path, anio)}
+
+
+def archivo_admite(db_path, anio):
+    """Indica si `anio` ya tiene archivo o todavía cabe uno más"""
+    anios = anios_archivados(db_path)
+    return anio in anios or len(anios) < MAX_ANIOS_ARCHIVADOS
+
+
+def anios_sin_espacio(conn, db_path, conservar=ANIOS_EN_BASE):
+    """Años archivables que no se archivan por el límite de archivos"""
+    return [anio for anio in anios_archivables(conn, conservar) if not archivo_admite(db_path, anio)]
+
+
+def adjuntar_archivos(conn, db_path):
+    """Adjunta los años archivados y (re)crea la vista temporal movimientos_historicos
+
+    Devuelve el nombre de la vista. Es barata si no hay archivos nuevos, así que
+    se puede llamar en cada consulta histórica con una conexión reutilizada.
+    La conexión debe admitir URIs (conectar_lectura() de app.py). Lanza
+    ArchivoNoDisponible si un archivo no se puede adjuntar.
+    """
+    adjuntas = {fila[1] for fila in conn.execute('PRAGMA database_list')}
+    anios = anios_archivados(db_path)
+    nuevos = [anio for anio in anios if f'archivo_{anio}' not in adjuntas]
+    vista_existe = conn.execute("SELECT 1 FROM temp.sqlite_master WHERE name = ?",
+                                (VISTA_HISTORICA,)).fetchone()
+    if not nuevos and vista_existe:
+        return VISTA_HISTORICA
+
+    # ATTACH y las vistas temporales no modifican la base, pero query_only los impide
+    solo_consulta = conn.execute('PRAGMA query_only').fetchone()[0]
+    conn.execute('PRAGMA query_only=OFF')
+    try:
+        for anio in nuevos:
+            uri = 'file:' + ruta_archivo(db_path, anio).replace('\\', '/') + '?mode=ro'
+            try:
+                conn.execute(f'ATTACH DATABASE ? AS archivo_{anio}', (uri,))
+            except sqlite3.DatabaseError as e:
+                raise ArchivoNoDisponible(
+                    f'No se pudo abrir el archivo de movimientos de {anio} ({e}); '
+                    f'SQLite admite hasta {MAX_ANIOS_ARCHIVADOS} años archivados') from e
+
+        columnas = columnas_movimientos(conn)
+        partes = [f"SELECT {', '.join(columnas)} FROM main.movimientos"]
+        for anio in anios:
+            # Columnas agregadas después de archivar un año: NULL en ese archivo
+            propias = set(columnas_movimientos(conn, f'archivo_{anio}'))
+            seleccion = ', '.join(c if c in propias else f'NULL AS {c}' for c in columnas)
+            partes.append(f'SELECT {seleccion} FROM archivo_{anio}.movimientos')
+
+        conn.execute(f'DROP VIEW IF EXISTS temp.{VISTA_HISTORICA}')
+        conn.execute(f'CREATE TEMP VIEW {VISTA_HISTORICA} AS ' + ' UNION ALL '.join(partes))
+    finally:
+        if solo_consulta:
+            conn.execute('PRAGMA query_only=ON')
+    return VISTA_HISTORICA
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Archiva los movimientos de años cerrados')
+    parser.add_argument('--db', default='inventario_ptar.db')
+    parser.add_argument('--conservar', type=int, default=ANIOS_EN_BASE,
+                        help='años más recientes que se quedan en la base activa')
+    parser.add_argument('--vacuum', action='store_true',
+                        help='compactar la base activa al terminar')
+    opciones = parser.parse_args()
+
+    conn = sqlite3.connect(opciones.db, timeout=30.0)
+    try:
+        movidos = archivar_anios_cerrados(conn, opciones.db, opciones.conservar)
+        for anio, cantidad in movidos.items():
+            print(f'{anio}: {cantidad} movimientos -> {ruta_archivo(opciones.db, anio)}')
+        if not movidos:
+            print('No hay años para archivar')
+        pendientes = anios_sin_espacio(conn, opciones.db, opciones.conservar)
+        if pendientes:
+            print(f'Límite de {MAX_ANIOS_ARCHIVADOS} años archivados: '
+                  f'{", ".join(map(str, pendientes))} se quedan en la base activa')
+        if opciones.vacuum and movidos:
+            conn.execute('VACUUM')
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
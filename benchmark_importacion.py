@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark del tiempo de importación (python -X importtime)
+
+Importa cada módulo en un intérprete nuevo varias veces y muestra la mediana
+del tiempo total y los módulos que más tardan:
+    python benchmark_importacion.py                 # app y exportador_reportes
+    python benchmark_importacion.py app --top 15
+
+Con --prohibidos falla (código de salida 1) si alguno de esos módulos se
+importa al cargar, para detectar que una dependencia pesada volvió a
+importarse al inicio:
+    python benchmark_importacion.py app --prohibidos pandas,openpyxl
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+
+MODULOS_POR_DEFECTO = ('app', 'exportador_reportes')
+PROHIBIDOS_POR_DEFECTO = 'pandas,openpyxl'
+
+
+def medir_importacion(modulo):
+    """Importa `modulo` con -X importtime
+
+    Devuelve ({módulo: acumulado_us}, nombres de lo que `modulo` importa directamente).
+    """
+    proceso = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {modulo}'],
+                             capture_output=True, text=True)
+    if proceso.returncode != 0:
+        ultima = proceso.stderr.strip().splitlines()[-1] if proceso.stderr.strip() else ''
+        raise RuntimeError(f'No se pudo importar {modulo}: {ultima}')
+
+    tiempos = {}
+    directos = []
+    hijos = []   # nivel 1 desde el último módulo de nivel 0
+    for linea in proceso.stderr.splitlines():
+        if not linea.startswith('import time:'):
+            continue
+        propio, acumulado, nombre = linea[len('import time:'):].split('|')
+        if not propio.strip().isdigit():
+            continue   # encabezado
+        # La salida va en postorden: los hijos aparecen antes que quien los importa
+        nivel = (len(nombre) - len(nombre.lstrip()) - 1) // 2
+        nombre = nombre.strip()
+        tiempos[nombre] = int(acumulado)
+        if nivel == 1:
+            hijos.append(nombre)
+        elif nivel == 0:
+            if nombre == modulo:
+                directos = hijos
+            hijos = []
+    return tiempos, directos
+
+
+def resumir(modulo, repeticiones):
+    """Mediana del tiempo total y de cada importación directa sobre varias ejecuciones"""
+    ejecuciones = [medir_importacion(modulo) for _ in range(repeticiones)]
+    mediana = lambda nombre: statistics.median(t[nombre] for t, _ in ejecuciones if nombre in t)
+    return {
+        'total_ms': mediana(modulo) / 1000,
+        'directos': {nombre: mediana(nombre) for _, d in ejecuciones for nombre in d},
+        'importados': set().union(*(t for t, _ in ejecuciones)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Tiempo de importación de los módulos del inventario')
+    parser.add_argument('modulos', nargs='*', default=MODULOS_POR_DEFECTO)
+    parser.add_argument('--repeticiones', type=int, default=5)
+    parser.add_argument('--top', type=int, default=10, help='importaciones directas más lentas a mostrar')
+    parser.add_argument('--prohibidos', default=PROHIBIDOS_POR_DEFECTO,
+                        help='módulos que no deben importarse al cargar (separados por comas, vacío para omitir)')
+    opciones = parser.parse_args()
+
+    prohibidos = [p for p in opciones.prohibidos.split(',') if p]
+    fallos = []
+
+    for modulo in opciones.modulos:
+        try:
+            resumen = resumir(modulo, opciones.repeticiones)
+        except RuntimeError as e:
+            print(f'\n{e}')
+            fallos.append(modulo)
+            continue
+
+        print(f"\n{modulo}: {resumen['total_ms']:.1f} ms (mediana de {opciones.repeticiones})")
+        # Solo los importados directamente: los demás ya están en el acumulado de quien los importa
+        lentos = sorted(((t, n) for n, t in resumen['directos'].items()), reverse=True)[:opciones.top]
+        for tiempo, nombre in lentos:
+            print(f'  {tiempo / 1000:8.1f} ms  {nombre}')
+
+        importados = [p for p in prohibidos if p in resumen['importados']]
+        if importados:
+            print(f"  ¡{', '.join(importados)} se importa al cargar {modulo}!")
+            fallos.append(modulo)
+
+    sys.exit(1 if fallos else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark de la serialización JSON por ruta (json estándar contra orjson)
+
+Ejecuta cada ruta con el cliente de pruebas de Flask, primero con el proveedor
+JSON estándar de Flask y luego con ProveedorJSONRapido, y muestra la mediana:
+    python benchmark_json.py                      # sobre inventario_ptar.db (solo lee)
+    python benchmark_json.py --sintetica 5000     # base temporal con 5000 materiales
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+from flask.json.provider import DefaultJSONProvider
+
+import app
+from benchmark_lectura import generar_base
+from proveedor_json import ProveedorJSONRapido, orjson
+
+RUTAS = (
+    '/api/materiales',
+    '/api/materiales?formato=columnas',
+    '/api/movimientos',
+    '/api/bootstrap',
+    '/api/estadisticas',
+    '/api/cambios?desde=0&limite=5000',
+)
+
+
+def medir(cliente, ruta, repeticiones):
+    """Mediana en ms de una petición GET completa"""
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        respuesta = cliente.get(ruta, headers={'Accept-Encoding': 'identity'})
+        respuesta.get_data()
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    return statistics.median(tiempos)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de la serialización JSON por ruta')
+    parser.add_argument('--db', default=app.DB_PATH)
+    parser.add_argument('--sintetica', type=int, metavar='MATERIALES',
+                        help='generar una base temporal con este número de materiales')
+    parser.add_argument('--repeticiones', type=int, default=20)
+    opciones = parser.parse_args()
+
+    if orjson is None:
+        print('orjson no está instalado: ambos proveedores usarían json estándar')
+        return
+
+    temporal = None
+    if opciones.sintetica:
+        temporal = tempfile.TemporaryDirectory()
+        opciones.db = os.path.join(temporal.name, 'benchmark.db')
+        print(f'Generando base temporal con {opciones.sintetica} materiales...')
+        generar_base(opciones.db, opciones.sintetica)
+    app.DB_PATH = opciones.db
+
+    proveedores = {
+        'json estándar': DefaultJSONProvider(app.app),
+        'orjson': ProveedorJSONRapido(app.app),
+    }
+    cliente = app.app.test_client()
+
+    print(f'\nBase: {opciones.db}, mediana de {opciones.repeticiones} peticiones (ms)\n')
+    print('| Ruta | ' + ' | '.join(proveedores) + ' | Mejora |')
+    print('|---|' + '---:|' * (len(proveedores) + 1))
+    for ruta in RUTAS:
+        tiempos = []
+        for proveedor in proveedores.values():
+            app.app.json = proveedor
+            cliente.get(ruta)   # calentamiento
+            tiempos.append(medir(cliente, ruta, opciones.repeticiones))
+        mejora = tiempos[0] / tiempos[-1] if tiempos[-1] else 0
+        print(f'| `{ruta}` | ' + ' | '.join(f'{t:.1f}' for t in tiempos) + f' | {mejora:.1f}x |')
+
+    if temporal:
+        temporal.cleanup()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark de las conexiones de lectura (listados y consultas de reportes)
+
+Compara tres formas de abrir la conexión para cada consulta:
+- antes: conexión nueva de lectura/escritura sin ajustes, como hacía get_db_connection()
+- solo lectura: conexión nueva con mode=ro, mmap_size, cache_size y temp_store
+- reutilizada: la conexión de solo lectura que conserva cada hilo (rutas GET)
+
+Uso:
+    python benchmark_lectura.py                       # sobre inventario_ptar.db (solo lee)
+    python benchmark_lectura.py --sintetica 20000     # base temporal con 20000 materiales
+"""
+import argparse
+import os
+import random
+import statistics
+import sqlite3
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import app
+from instantaneas_stock import DELTA_SQL
+
+
+def conexion_antes(db_path):
+    conn = sqlite3.connect(db_path, timeout=30.0)
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA journal_mode=WAL')
+    return conn
+
+
+def reporte_inventario(conn):
+    return conn.execute('SELECT * FROM materiales ORDER BY nombre').fetchall()
+
+
+def reporte_movimientos(conn):
+    mes = conn.execute('SELECT substr(MAX(fecha), 1, 7) FROM movimientos').fetchone()[0] or ''
+    return conn.execute('''
+        SELECT m.*, mat.nombre as material_nombre, mat.codigo as material_codigo
+        FROM movimientos m
+        JOIN materiales mat ON m.material_id = mat.id
+        WHERE m.fecha LIKE ?
+        ORDER BY m.fecha DESC
+    ''', (f'{mes}%',)).fetchall()
+
+
+CONSULTAS = {
+    'listado materiales': lambda conn: app.consultar_materiales(conn),
+    'búsqueda materiales': lambda conn: app.consultar_materiales(conn, busqueda='12'),
+    'listado movimientos': lambda conn: app.consultar_movimientos(conn),
+    'estadísticas': app.calcular_estadisticas,
+    'reporte inventario': reporte_inventario,
+    'reporte movimientos': reporte_movimientos,
+}
+
+
+def generar_base(db_path, materiales):
+    """Base temporal con `materiales` materiales y diez movimientos por material"""
+    app.DB_PATH = db_path
+    app.init_database()
+    conn = sqlite3.connect(db_path)
+    rnd = random.Random(42)
+    conn.executemany('''
+        INSERT INTO materiales (codigo, nombre, descripcion, categoria, unidad, cantidad_actual,
+                                stock_minimo, ubicacion, costo_unitario)
+        VALUES (?, ?, ?, ?, 'pza', ?, ?, ?, ?)
+    ''', [(f'MAT-{i:06d}', f'Material {i}', f'Descripción del material {i}', f'Categoría {i % 12}',
+           rnd.randint(0, 100), rnd.randint(0, 20), f'Almacén {i % 5}', rnd.random() * 500)
+          for i in range(materiales)])
+    inicio = datetime.now() - timedelta(days=365)
+    conn.executemany('''
+        INSERT INTO movimientos (material_id, tipo_movimiento, cantidad, fecha, responsable, destino_origen)
+        VALUES (?, ?, ?, ?, 'benchmark', 'benchmark')
+    ''', [(rnd.randint(1, materiales), rnd.choice(('ENTRADA', 'SALIDA')), rnd.randint(1, 10),
+           (inicio + timedelta(minutes=rnd.randint(0, 525600))).strftime('%Y-%m-%d %H:%M:%S'))
+          for _ in range(materiales * 10)])
+    # Stock consistente con los movimientos, como lo dejarían las aplicaciones
+    conn.execute(f'''
+        UPDATE materiales SET cantidad_actual = cantidad_actual + COALESCE((
+            SELECT SUM({DELTA_SQL}) FROM movimientos WHERE material_id = materiales.id), 0)
+    ''')
+    conn.commit()
+    conn.close()
+
+
+def medir(abrir, cerrar, consulta, repeticiones):
+    """Mediana en ms de abrir la conexión, ejecutar la consulta y cerrarla"""
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        conn = abrir()
+        consulta(conn)
+        cerrar(conn)
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    return statistics.median(tiempos)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de las conexiones de lectura')
+    parser.add_argument('--db', default=app.DB_PATH)
+    parser.add_argument('--sintetica', type=int, metavar='MATERIALES',
+                        help='generar una base temporal con este número de materiales')
+    parser.add_argument('--repeticiones', type=int, default=20)
+    opciones = parser.parse_args()
+
+    temporal = None
+    if opciones.sintetica:
+        temporal = tempfile.TemporaryDirectory()
+        opciones.db = os.path.join(temporal.name, 'benchmark.db')
+        print(f'Generando base temporal con {opciones.sintetica} materiales...')
+        generar_base(opciones.db, opciones.sintetica)
+    app.DB_PATH = opciones.db
+
+    reutilizada = app.conectar_lectura(opciones.db)
+    variantes = {
+        'antes': (lambda: conexion_antes(opciones.db), lambda c: c.close()),
+        'solo lectura': (lambda: app.conectar_lectura(opciones.db), lambda c: c.close()),
+        'reutilizada': (lambda: reutilizada, lambda c: None),
+    }
+
+    print(f'\nBase: {opciones.db}, mediana de {opciones.repeticiones} repeticiones (ms)\n')
+    print('| Consulta | ' + ' | '.join(variantes) + ' |')
+    print('|---|' + '---:|' * len(variantes))
+    for nombre, consulta in CONSULTAS.items():
+        # Una vuelta sin medir para que todas partan con la base en la caché del sistema
+        consulta(reutilizada)
+        tiempos = [medir(abrir, cerrar, consulta, opciones.repeticiones)
+                   for abrir, cerrar in variantes.values()]
+        print(f'| {nombre} | ' + ' | '.join(f'{t:.2f}' for t in tiempos) + ' |')
+
+    reutilizada.close()
+    if temporal:
+        temporal.cleanup()
+
+
+if __name__ == '__main__':
+    main()
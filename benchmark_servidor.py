@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark de rendimiento del servidor web (peticiones por segundo y latencias)
+
+Mide un servidor ya iniciado:
+    python benchmark_servidor.py --url http://localhost:5000
+
+O inicia uno tras otro el servidor de desarrollo (app.run con debug) y el de
+producción (servidor.py) en puertos libres y compara ambos:
+    python benchmark_servidor.py --comparar
+
+Solo hace peticiones GET, no modifica la base de datos.
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+from urllib.error import URLError
+
+RUTAS_BENCHMARK = ('/api/materiales', '/api/estadisticas', '/api/prestamos', '/api/movimientos')
+
+COMANDO_DESARROLLO = [sys.executable, '-c',
+                      "import app; app.preparar_aplicacion(); "
+                      "app.app.run(debug=True, use_reloader=False, port={puerto})"]
+COMANDO_PRODUCCION = [sys.executable, 'servidor.py', '--port', '{puerto}']
+
+
+def medir(url, duracion, concurrencia, rutas=RUTAS_BENCHMARK):
+    """Lanza `concurrencia` clientes durante `duracion` segundos y devuelve el resumen"""
+    latencias = []
+    errores = [0]
+    lock = threading.Lock()
+    fin = time.perf_counter() + duracion
+
+    def cliente(desfase):
+        propias = []
+        fallidas = 0
+        i = desfase
+        while time.perf_counter() < fin:
+            ruta = rutas[i % len(rutas)]
+            i += 1
+            inicio = time.perf_counter()
+            try:
+                with urllib.request.urlopen(url + ruta, timeout=30) as respuesta:
+                    respuesta.read()
+                propias.append(time.perf_counter() - inicio)
+            except (URLError, OSError):
+                fallidas += 1
+        with lock:
+            latencias.extend(propias)
+            errores[0] += fallidas
+
+    hilos = [threading.Thread(target=cliente, args=(n,)) for n in range(concurrencia)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+
+    latencias.sort()
+    percentil = lambda p: latencias[min(len(latencias) - 1, int(len(latencias) * p))] * 1000
+    return {
+        'peticiones': len(latencias),
+        'errores': errores[0],
+        'por_segundo': len(latencias) / duracion,
+        'p50_ms': percentil(0.50) if latencias else 0,
+        'p95_ms': percentil(0.95) if latencias else 0,
+        'media_ms': statistics.mean(latencias) * 1000 if latencias else 0,
+    }
+
+
+def esperar_servidor(url, limite=30):
+    """Espera a que el servidor responda"""
+    fin = time.monotonic() + limite
+    while time.monotonic() < fin:
+        try:
+            with urllib.request.urlopen(url + '/api/estadisticas', timeout=2):
+                return
+        except (URLError, OSError):
+            time.sleep(0.3)
+    raise RuntimeError(f'El servidor en {url} no respondió en {limite} s')
+
+
+def medir_comando(nombre, comando, puerto, duracion, concurrencia):
+    """Inicia el servidor con `comando`, lo mide y lo detiene"""
+    comando = [parte.format(puerto=puerto) for parte in comando]
+    url = f'http://127.0.0.1:{puerto}'
+    proceso = subprocess.Popen(comando, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        esperar_servidor(url)
+        medir(url, 2, concurrencia)   # calentamiento
+        resultado = medir(url, duracion, concurrencia)
+    finally:
+        proceso.terminate()
+        proceso.wait(timeout=15)
+    resultado['servidor'] = nombre
+    return resultado
+
+
+def imprimir(resultados, concurrencia):
+    print(f"\nConcurrencia: {concurrencia} clientes, rutas: {', '.join(RUTAS_BENCHMARK)}\n")
+    print('| Servidor | Peticiones/s | p50 (ms) | p95 (ms) | Errores |')
+    print('|---|---:|---:|---:|---:|')
+    for r in resultados:
+        print(f"| {r['servidor']} | {r['por_segundo']:.0f} | {r['p50_ms']:.1f} | "
+              f"{r['p95_ms']:.1f} | {r['errores']} |")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark del servidor web del inventario PTAR')
+    parser.add_argument('--url', default='http://localhost:5000')
+    parser.add_argument('--duracion', type=float, default=10.0, help='segundos por medición')
+    parser.add_argument('--concurrencia', type=int, default=16)
+    parser.add_argument('--comparar', action='store_true',
+                        help='iniciar y comparar el servidor de desarrollo y el de producción')
+    parser.add_argument('--puerto', type=int, default=5099, help='puerto para --comparar')
+    opciones = parser.parse_args()
+
+    if opciones.comparar:
+        resultados = [
+            medir_comando('app.run (debug)', COMANDO_DESARROLLO, opciones.puerto,
+                          opciones.duracion, opciones.concurrencia),
+            medir_comando('servidor.py', COMANDO_PRODUCCION, opciones.puerto + 1,
+                          opciones.duracion, opciones.concurrencia),
+        ]
+    else:
+        resultado = medir(opciones.url, opciones.duracion, opciones.concurrencia)
+        resultado['servidor'] = opciones.url
+        resultados = [resultado]
+
+    imprimir(resultados, opciones.concurrencia)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Caché LRU de imágenes de materiales ya decodificadas y redimensionadas
+
+Las imágenes se decodifican con PIL (en segundo plano cuando se precargan) y el
+PhotoImage se crea en el hilo de Tk la primera vez que se pide. La memoria se
+contabiliza por píxeles y se descartan las entradas menos usadas al pasar el límite.
+"""
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, ImageTk
+
+# Límite por defecto: 64 MB de píxeles decodificados
+MAX_BYTES_DEFECTO = 64 * 1024 * 1024
+
+
+def decodificar_imagen(ruta, tamaño):
+    """Abre la imagen y la reduce con LANCZOS para que quepa en tamaño (ancho, alto)"""
+    with Image.open(ruta) as img:
+        img.thumbnail(tamaño, Image.Resampling.LANCZOS)
+        if img.mode not in ('RGB', 'RGBA'):
+            return img.convert('RGBA')
+        return img.copy()
+
+
+class _Entrada:
+    """Imagen decodificada y, si ya se mostró, su PhotoImage"""
+
+    __slots__ = ('imagen', 'photo', 'bytes')
+
+    def __init__(self, imagen):
+        self.imagen = imagen
+        self.photo = None
+        self.bytes = imagen.width * imagen.height * len(imagen.getbands())
+
+
+class CacheImagenes:
+    """Caché LRU acotada por memoria, con clave (ruta, mtime, tamaño)"""
+
+    def __init__(self, max_bytes=MAX_BYTES_DEFECTO):
+        self.max_bytes = max_bytes
+        self.bytes_usados = 0
+        self._entradas = OrderedDict()
+        self._pendientes = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='precarga-imagenes')
+
+    @staticmethod
+    def _clave(ruta, tamaño):
+        return (os.path.abspath(ruta), os.stat(ruta).st_mtime_ns, tuple(tamaño))
+
+    def obtener(self, ruta, tamaño):
+        """Devuelve un PhotoImage de la imagen (debe llamarse desde el hilo de Tk)"""
+        clave = self._clave(ruta, tamaño)
+
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is not None:
+                self._entradas.move_to_end(clave)
+            futuro = self._pendientes.get(clave) if entrada is None else None
+
+        if entrada is None:
+            imagen = futuro.result() if futuro is not None else decodificar_imagen(ruta, tamaño)
+            entrada = self._guardar(clave, imagen)
+
+        if entrada.photo is None:
+            entrada.photo = ImageTk.PhotoImage(entrada.imagen)
+            with self._lock:
+                # Tk guarda su propia copia de los píxeles
+                if self._entradas.get(clave) is entrada:
+                    self.bytes_usados += entrada.bytes
+                    self._recortar()
+                entrada.bytes *= 2
+        return entrada.photo
+
+    def precargar(self, ruta, tamaño):
+        """Decodifica la imagen en segundo plano para que obtener() sea inmediato"""
+        try:
+            clave = self._clave(ruta, tamaño)
+        except OSError:
+            return
+
+        with self._lock:
+            if clave in self._entradas or clave in self._pendientes:
+                return
+            futuro = self._executor.submit(decodificar_imagen, ruta, tamaño)
+            self._pendientes[clave] = futuro
+
+        def terminado(f):
+            if f.exception() is None:
+                self._guardar(clave, f.result())
+            else:
+                with self._lock:
+                    self._pendientes.pop(clave, None)
+
+        futuro.add_done_callback(terminado)
+
+    def invalidar(self, ruta):
+        """Descarta todas las versiones en caché de una ruta"""
+        ruta = os.path.abspath(ruta)
+        with self._lock:
+            for clave in [c for c in self._entradas if c[0] == ruta]:
+                self.bytes_usados -= self._entradas.pop(clave).bytes
+
+    def limpiar(self):
+        """Vacía la caché"""
+        with self._lock:
+            self._entradas.clear()
+            self.bytes_usados = 0
+
+    def _guardar(self, clave, imagen):
+        with self._lock:
+            self._pendientes.pop(clave, None)
+            entrada = self._entradas.get(clave)
+            if entrada is None:
+                entrada = _Entrada(imagen)
+                self._entradas[clave] = entrada
+                self.bytes_usados += entrada.bytes
+            self._entradas.move_to_end(clave)
+            self._recortar()
+            return entrada
+
+    def _recortar(self):
+        # Siempre se conserva la entrada más reciente aunque exceda el límite
+        while self.bytes_usados > self.max_bytes and len(self._entradas) > 1:
+            _, entrada = self._entradas.popitem(last=False)
+            self.bytes_usados -= entrada.bytes
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Catálogo de materiales en memoria compartido por las pestañas de la aplicación
+de escritorio (Entrada, Salida, Préstamos y Material en Uso)
+"""
+import threading
+import unicodedata
+
+# Columnas que usan las tablas de selección de materiales
+COLUMNAS = ('id', 'codigo', 'nombre', 'categoria', 'cantidad_actual', 'unidad')
+CONSULTA_BASE = f"SELECT {', '.join(COLUMNAS)} FROM materiales"
+
+
+def normalizar(texto):
+    """Normaliza un texto para búsquedas: minúsculas y sin acentos"""
+    if not texto:
+        return ''
+    texto = unicodedata.normalize('NFKD', str(texto).casefold())
+    return ''.join(c for c in texto if not unicodedata.combining(c))
+
+
+class CatalogoMateriales:
+    """Catálogo de materiales cargado una sola vez e indexado en memoria
+
+    Se mantiene actualizado por escritura directa: después de cada cambio en
+    la tabla materiales se llama a refrescar() o eliminar() con el id afectado.
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+        self._lock = threading.RLock()
+        self._por_id = {}
+        self._por_codigo = {}
+        self._por_nombre = {}
+        self._claves_busqueda = {}
+        self._ordenados = None
+
+    # ---------------------------------
+    # Carga y escritura directa
+    # ---------------------------------
+
+    def cargar(self):
+        """Carga el catálogo completo desde la base de datos"""
+        filas = self.conn.execute(f"{CONSULTA_BASE} ORDER BY nombre").fetchall()
+        with self._lock:
+            self._por_id.clear()
+            self._por_codigo.clear()
+            self._por_nombre.clear()
+            self._claves_busqueda.clear()
+            for fila in filas:
+                self._indexar(tuple(fila))
+            self._ordenados = None
+
+    def refrescar(self, material_id):
+        """Vuelve a leer un material por id (después de insertarlo o modificarlo)"""
+        fila = self.conn.execute(f"{CONSULTA_BASE} WHERE id = ?", (material_id,)).fetchone()
+        with self._lock:
+            self._desindexar(material_id)
+            if fila:
+                self._indexar(tuple(fila))
+            self._ordenados = None
+
+    def eliminar(self, material_id):
+        """Quita un material del catálogo"""
+        with self._lock:
+            self._desindexar(material_id)
+            self._ordenados = None
+
+    def actualizar_stock(self, material_id, cantidad_actual):
+        """Actualiza en memoria la cantidad de un material ya confirmada en la BD"""
+        with self._lock:
+            fila = self._por_id.get(material_id)
+            if fila is None:
+                return
+            nueva = fila[:4] + (cantidad_actual,) + fila[5:]
+            self._desindexar(material_id)
+            self._indexar(nueva)
+            self._ordenados = None
+
+    def _indexar(self, fila):
+        material_id, codigo, nombre = fila[0], fila[1], fila[2]
+        self._por_id[material_id] = fila
+        if codigo:
+            self._por_codigo[codigo] = fila
+        self._por_nombre.setdefault(normalizar(nombre), fila)
+        self._claves_busqueda[material_id] = (normalizar(nombre), normalizar(codigo))
+
+    def _desindexar(self, material_id):
+        fila = self._por_id.pop(material_id, None)
+        if fila is None:
+            return
+        self._claves_busqueda.pop(material_id, None)
+        if fila[1] and self._por_codigo.get(fila[1]) is fila:
+            del self._por_codigo[fila[1]]
+        clave = normalizar(fila[2])
+        if self._por_nombre.get(clave) is fila:
+            del self._por_nombre[clave]
+            # Puede haber otro material con el mismo nombre
+            for otra in self._por_id.values():
+                if normalizar(otra[2]) == clave:
+                    self._por_nombre[clave] = otra
+                    break
+
+    # ---------------------------------
+    # Consultas
+    # ---------------------------------
+
+    def por_id(self, material_id):
+        """Obtiene la fila (id, codigo, nombre, categoria, cantidad_actual, unidad) por id"""
+        return self._por_id.get(material_id)
+
+    def por_codigo(self, codigo):
+        """Obtiene un material por su código"""
+        return self._por_codigo.get(codigo)
+
+    def por_nombre(self, nombre):
+        """Obtiene un material por nombre (sin distinguir mayúsculas ni acentos)"""
+        return self._por_nombre.get(normalizar(nombre.strip()) if nombre else '')
+
+    def nombres(self):
+        """Lista de nombres ordenada"""
+        return [fila[2] for fila in self._lista_ordenada()]
+
+    def filtrar(self, busqueda='', categoria='Todas'):
+        """Filtra en memoria por nombre/código y categoría, ordenado por nombre"""
+        texto = normalizar(busqueda.strip()) if busqueda else ''
+        resultado = []
+        with self._lock:
+            for fila in self._lista_ordenada():
+                if categoria and categoria != 'Todas' and fila[3] != categoria:
+                    continue
+                if texto:
+                    nombre, codigo = self._claves_busqueda[fila[0]]
+                    if texto not in nombre and texto not in codigo:
+                        continue
+                resultado.append(fila)
+        return resultado
+
+    def _lista_ordenada(self):
+        with self._lock:
+            if self._ordenados is None:
+                self._ordenados = sorted(self._por_id.values(), key=lambda f: f[2] or '')
+            return self._ordenados
+
+    def __len__(self):
+        return len(self._por_id)
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Catálogos de valores repetidos: categorías, ubicaciones, unidades, responsables
+y destinos
+
+Cada catálogo es una tabla (id, nombre) y las tablas de datos guardan, junto
+al texto, la llave entera del valor (categoria_id, responsable_id, ...). Los
+triggers dan de alta los valores nuevos y mantienen las llaves al insertar o
+modificar desde cualquiera de las dos aplicaciones, así que el texto sigue
+siendo la columna que escriben y leen las consultas existentes (la aplicación
+de escritorio, los archivos anuales y la caché del cliente web). Las llaves no
+se registran como cambios ni se envían en /api/cambios (vigilante_cambios.py).
+
+MapaCatalogos guarda en memoria los mapas id -> nombre y solo los vuelve a
+leer cuando cambia la firma (número de valores e id máximo) de los catálogos.
+"""
+import threading
+
+# catálogo -> columnas (tabla, columna de texto, columna con la llave)
+CATALOGOS = {
+    'categorias': (('materiales', 'categoria', 'categoria_id'),),
+    'ubicaciones': (('materiales', 'ubicacion', 'ubicacion_id'),),
+    'unidades': (('materiales', 'unidad', 'unidad_id'),),
+    'responsables': (('movimientos', 'responsable', 'responsable_id'),
+                     ('material_en_uso', 'responsable', 'responsable_id')),
+    'destinos': (('movimientos', 'destino_origen', 'destino_id'),
+                 ('prestamos', 'area_destino', 'area_id')),
+}
+
+# Valores que antes estaban fijos en los formularios: siguen apareciendo aunque no se usen
+VALORES_INICIALES = {
+    'categorias': ('Fontanería y Ferretería', 'Herramientas y Equipos', 'Seguridad',
+                   'Limpieza', 'Papelería'),
+    'ubicaciones': ('PTAR I', 'PTAR II', 'PTAR2 - Almacén', 'Almacén General',
+                    'Estaciones de Bombeo', 'Taller'),
+    'unidades': ('Piezas', 'Litros', 'Kilogramos', 'Metros', 'Cajas', 'Sets', 'Rollos',
+                 'Bolsas', 'Galones'),
+}
+
+
+def columnas_por_tabla():
+    """tabla -> [(catálogo, columna de texto, columna con la llave)]"""
+    por_tabla = {}
+    for catalogo, columnas in CATALOGOS.items():
+        for tabla, columna, llave in columnas:
+            por_tabla.setdefault(tabla, []).append((catalogo, columna, llave))
+    return por_tabla
+
+
+def _valor_definido(expresion):
+    return f"{expresion} IS NOT NULL AND {expresion} != ''"
+
+
+def instalar_catalogos(conn):
+    """Crea los catálogos, agrega las llaves, migra los datos existentes y crea los triggers
+
+    Llamar después de instalar_registro_cambios(), cuyo trigger de
+    modificaciones ya no incluye las llaves. No confirma la transacción.
+    """
+    for catalogo in CATALOGOS:
+        conn.execute(f'''
+            CREATE TABLE IF NOT EXISTS {catalogo} (
+                id INTEGER PRIMARY KEY,
+                nombre TEXT NOT NULL UNIQUE
+            )
+        ''')
+        conn.executemany(f'INSERT OR IGNORE INTO {catalogo} (nombre) VALUES (?)',
+                         [(valor,) for valor in VALORES_INICIALES.get(catalogo, ())])
+
+    for tabla, columnas in columnas_por_tabla().items():
+        existentes = {fila[1] for fila in conn.execute(f'PRAGMA table_info({tabla})')}
+        for catalogo, columna, llave in columnas:
+            if llave not in existentes:
+                conn.execute(f'ALTER TABLE {tabla} ADD COLUMN {llave} INTEGER REFERENCES {catalogo} (id)')
+            conn.execute(f'''
+                INSERT OR IGNORE INTO {catalogo} (nombre)
+                SELECT DISTINCT {columna} FROM {tabla} WHERE {_valor_definido(columna)}
+            ''')
+        _migrar_llaves(conn, tabla, columnas)
+        _crear_triggers(conn, tabla, columnas)
+
+
+def _migrar_llaves(conn, tabla, columnas):
+    """Llena las llaves de las filas anteriores a los catálogos"""
+    pendientes = ' OR '.join(f'({llave} IS NULL AND {_valor_definido(columna)})'
+                             for _, columna, llave in columnas)
+    asignaciones = ', '.join(
+        f'{llave} = (SELECT id FROM {catalogo} WHERE nombre = {tabla}.{columna})'
+        for catalogo, columna, llave in columnas)
+    conn.execute(f'UPDATE {tabla} SET {asignaciones} WHERE {pendientes}')
+
+
+def _crear_triggers(conn, tabla, columnas):
+    altas = ''.join(
+        f'INSERT OR IGNORE INTO {catalogo} (nombre) '
+        f'SELECT NEW.{columna} WHERE {_valor_definido(f"NEW.{columna}")};\n'
+        for catalogo, columna, _ in columnas)
+    asignaciones = ', '.join(
+        f'{llave} = (SELECT id FROM {catalogo} WHERE nombre = NEW.{columna})'
+        for catalogo, columna, llave in columnas)
+    # Solo cuando alguna llave no corresponde al texto (o el valor aún no está en el catálogo)
+    desactualizadas = ' OR '.join(
+        f'NEW.{llave} IS NOT (SELECT id FROM {catalogo} WHERE nombre = NEW.{columna}) '
+        f'OR (NEW.{llave} IS NULL AND {_valor_definido(f"NEW.{columna}")})'
+        for catalogo, columna, llave in columnas)
+    texto = ', '.join(columna for _, columna, _ in columnas)
+
+    for nombre, evento in (('insert', 'INSERT'), ('update', f'UPDATE OF {texto}')):
+        # Versiones anteriores escribían las llaves sin condición
+        conn.execute(f'DROP TRIGGER IF EXISTS trg_catalogos_{tabla}_{nombre}')
+        conn.execute(f'''
+            CREATE TRIGGER trg_catalogos_{tabla}_{nombre}
+            AFTER {evento} ON {tabla}
+            WHEN {desactualizadas}
+            BEGIN
+                {altas}
+                UPDATE {tabla} SET {asignaciones} WHERE id = NEW.id;
+            END
+        ''')
+
+
+def firma_catalogos(conn):
+    """Número de valores e id máximo de cada catálogo (los valores solo se agregan)"""
+    consulta = ' UNION ALL '.join(
+        f"SELECT '{catalogo}', COUNT(*), MAX(id) FROM {catalogo}" for catalogo in CATALOGOS)
+    return tuple(tuple(fila) for fila in conn.execute(consulta))
+
+
+class MapaCatalogos:
+    """Mapas id -> nombre de los catálogos, compartidos entre hilos"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._firma = None
+        self._por_id = {catalogo: {} for catalogo in CATALOGOS}
+
+    def actualizar(self, conn):
+        """Vuelve a leer los catálogos si cambiaron; indica si hubo cambios"""
+        firma = firma_catalogos(conn)
+        if firma == self._firma:
+            return False
+        por_id = {catalogo: dict(conn.execute(f'SELECT id, nombre FROM {catalogo}'))
+                  for catalogo in CATALOGOS}
+        with self._lock:
+            self._por_id = por_id
+            self._firma = firma
+        return True
+
+    def nombre(self, catalogo, valor_id):
+        return self._por_id[catalogo].get(valor_id)
+
+    def nombres(self, catalogo):
+        """Nombres de un catálogo en orden alfabético"""
+        return sorted(self._por_id[catalogo].values(), key=str.casefold)
+
+    def como_listas(self):
+        """{catálogo: [[id, nombre], ...]} ordenado por nombre, para la API"""
+        por_id = self._por_id
+        return {catalogo: sorted(([i, n] for i, n in valores.items()), key=lambda v: v[1].casefold())
+                for catalogo, valores in por_id.items()}
@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Conciliación de cantidad_actual con el libro de movimientos
+
+La cantidad de alta de cada material queda en `stock_inicial` (un trigger la
+guarda al insertar el material). El libro de un material es esa cantidad más
+todos sus movimientos: la cantidad actual debe ser igual al final del libro y
+cada instantánea mensual (instantaneas_stock.py) igual al libro en su corte.
+Una diferencia indica una escritura que no pasó por un movimiento (edición
+directa de la cantidad, una escritura con un valor desactualizado) y la
+primera instantánea que no cuadra acota el mes en que ocurrió. Un saldo
+negativo en algún punto del libro indica lo mismo antes de esa fecha.
+
+Para los materiales que ya existían al instalar la tabla no hay cantidad de
+alta registrada: se estima restando sus movimientos a la cantidad de ese
+momento (columna `estimado`). En ellos solo se detectan las diferencias
+posteriores a la instalación y los saldos negativos.
+
+El cálculo carga los movimientos de una vez y reconstruye el libro de todos
+los materiales con agrupaciones de pandas, así que revisar el catálogo
+completo toma segundos. reparar_stock() lleva la cantidad actual y las
+instantáneas al valor del libro dentro de una transacción de escritura.
+
+Uso:
+    python conciliacion_stock.py [--db inventario_ptar.db] [--reparar] [--tolerancia 0.0001]
+"""
+import argparse
+import os
+import sqlite3
+
+from archivo_movimientos import adjuntar_archivos, anios_archivados, ruta_archivo
+from exportador_reportes import cargar_pandas
+from instantaneas_stock import DELTA_SQL, SIGNOS_MOVIMIENTO
+
+# Diferencias menores se consideran redondeo de cantidades decimales
+TOLERANCIA = 1e-4
+
+COLUMNAS_DIFERENCIAS = ('material_id', 'codigo', 'nombre', 'cantidad_actual', 'esperado',
+                        'diferencia', 'inicial_estimado', 'instantaneas_con_diferencia',
+                        'primera_diferencia', 'primer_saldo_negativo')
+
+# Revisiones de integridad: nombre -> consulta que cuenta los registros con el problema
+CONSULTAS_INTEGRIDAD = {
+    'movimientos_sin_material': '''
+        SELECT COUNT(*) FROM movimientos
+        WHERE material_id NOT IN (SELECT id FROM materiales)''',
+    'prestamos_activos_sin_material': '''
+        SELECT COUNT(*) FROM prestamos
+        WHERE estado = 'ACTIVO' AND material_id NOT IN (SELECT id FROM materiales)''',
+    'material_en_uso_sin_material': '''
+        SELECT COUNT(*) FROM material_en_uso
+        WHERE material_id NOT IN (SELECT id FROM materiales)''',
+    'movimientos_tipo_desconocido': '''
+        SELECT COUNT(*) FROM movimientos
+        WHERE tipo_movimiento NOT IN ({})'''.format(', '.join(f"'{t}'" for t in SIGNOS_MOVIMIENTO)),
+    'materiales_stock_negativo': '''
+        SELECT COUNT(*) FROM materiales WHERE cantidad_actual < 0''',
+}
+
+
+def instalar_stock_inicial(conn, db_path):
+    """Crea stock_inicial y su trigger; estima la cantidad de alta de los materiales existentes
+
+    No confirma la transacción.
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS stock_inicial (
+            material_id INTEGER PRIMARY KEY,
+            cantidad REAL NOT NULL,
+            estimado INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_stock_inicial_insert
+        AFTER INSERT ON materiales
+        BEGIN
+            INSERT OR IGNORE INTO stock_inicial (material_id, cantidad)
+            VALUES (NEW.id, COALESCE(NEW.cantidad_actual, 0));
+        END
+    ''')
+
+    pendientes = conn.execute('''
+        SELECT 1 FROM materiales WHERE id NOT IN (SELECT material_id FROM stock_inicial) LIMIT 1
+    ''').fetchone()
+    if not pendientes:
+        return
+
+    # Cantidad actual menos todos los movimientos, incluidos los años archivados
+    conn.execute('''
+        INSERT INTO stock_inicial (material_id, cantidad, estimado)
+        SELECT id, COALESCE(cantidad_actual, 0), 1 FROM materiales
+        WHERE id NOT IN (SELECT material_id FROM stock_inicial)
+    ''')
+    sumas = [conn.execute(f'''
+        SELECT material_id, SUM({DELTA_SQL}) FROM movimientos GROUP BY material_id
+    ''').fetchall()]
+    for anio in anios_archivados(db_path):
+        archivo = sqlite3.connect(ruta_archivo(db_path, anio))
+        try:
+            sumas.append(archivo.execute(f'''
+                SELECT material_id, SUM({DELTA_SQL}) FROM movimientos GROUP BY material_id
+            ''').fetchall())
+        finally:
+            archivo.close()
+    for filas in sumas:
+        conn.executemany('''
+            UPDATE stock_inicial SET cantidad = cantidad - ? WHERE material_id = ? AND estimado = 1
+        ''', [(suma or 0, material_id) for material_id, suma in filas])
+
+
+def conectar(db_path):
+    """Conexión que admite adjuntar los años archivados (ATTACH con URI)"""
+    ruta = os.path.abspath(db_path).replace('\\', '/')
+    return sqlite3.connect(f'file:{ruta}', uri=True, timeout=30.0)
+
+
+def cargar_libro(conn, db_path):
+    """DataFrames de materiales (con su cantidad de alta), instantáneas y movimientos
+
+    Llamar dentro de una transacción para que las tablas estén en el mismo
+    estado; los años archivados deben estar adjuntos antes (ver leer_libro).
+    """
+    pd = cargar_pandas()
+    tabla = adjuntar_archivos(conn, db_path) if anios_archivados(db_path) else 'movimientos'
+
+    materiales = pd.read_sql_query('''
+        SELECT m.id AS material_id, m.codigo, m.nombre, m.cantidad_actual,
+               s.cantidad AS inicial, COALESCE(s.estimado, 1) AS inicial_estimado
+        FROM materiales m LEFT JOIN stock_inicial s ON s.material_id = m.id
+    ''', conn)
+    instantaneas = pd.read_sql_query(
+        'SELECT material_id, fecha, cantidad FROM stock_instantaneas', conn)
+    movimientos = pd.read_sql_query(
+        f'SELECT material_id, tipo_movimiento, cantidad, fecha FROM {tabla}', conn)
+    return materiales, instantaneas, movimientos
+
+
+def conciliar(materiales, instantaneas, movimientos, tolerancia=TOLERANCIA):
+    """(diferencias, instantáneas del libro)
+
+    diferencias: DataFrame con COLUMNAS_DIFERENCIAS de los materiales cuyo
+    stock o alguna de sus instantáneas no cuadra con el libro, o cuyo libro
+    pasa por un saldo negativo. instantáneas del libro: DataFrame
+    (material_id, fecha, cantidad) con el valor correcto de cada instantánea
+    que no cuadra.
+    """
+    pd = cargar_pandas()
+    import numpy as np   # dependencia de pandas
+
+    materiales = materiales.reset_index(drop=True)
+    indice = pd.Index(materiales['material_id'])
+    delta = (movimientos['cantidad'].fillna(0).to_numpy(float)
+             * movimientos['tipo_movimiento'].map(SIGNOS_MOVIMIENTO).fillna(0).to_numpy(float))
+    fila = indice.get_indexer(movimientos['material_id'])
+    conocidos = fila >= 0
+    fila, delta = fila[conocidos], delta[conocidos]
+    fechas = movimientos['fecha'].fillna('').to_numpy(str)[conocidos]
+
+    # Sin cantidad de alta registrada: se parte del valor que deja cuadrar el libro
+    total = np.bincount(fila, weights=delta, minlength=len(materiales))
+    actual = materiales['cantidad_actual'].fillna(0).to_numpy(float)
+    inicial = materiales['inicial'].to_numpy(float)
+    inicial = np.where(np.isnan(inicial), actual - total, inicial)
+    esperado = inicial + total
+
+    # Saldo después de cada movimiento, en orden cronológico por material
+    orden = np.lexsort((fechas, fila))
+    saldo = inicial[fila[orden]] + pd.Series(delta[orden]).groupby(fila[orden]).cumsum().to_numpy()
+    negativos = saldo < -tolerancia
+    primer_negativo = np.full(len(materiales), None, dtype=object)
+    if negativos.any():
+        # El primero de cada material: fila[orden] está agrupado y en orden
+        filas_negativas, primeros = np.unique(fila[orden][negativos], return_index=True)
+        primer_negativo[filas_negativas] = fechas[orden][negativos][primeros]
+    primer_negativo[inicial < -tolerancia] = 'alta'
+
+    # Instantáneas: el libro en el corte k es el inicial más los movimientos anteriores al corte
+    cortes = np.sort(instantaneas['fecha'].unique()).astype(str)
+    libro_cortes = pd.DataFrame(columns=('material_id', 'fecha', 'cantidad'))
+    con_diferencia = np.zeros(len(materiales), dtype=np.int64)
+    primera_diferencia = np.full(len(materiales), None, dtype=object)
+    if len(cortes):
+        # tramo = cortes <= fecha: el movimiento cuenta en los cortes con índice >= tramo
+        tramo = np.searchsorted(cortes, fechas, side='right')
+        D = np.zeros((len(materiales), len(cortes) + 1))
+        np.add.at(D, (fila, tramo), delta)
+        libro = inicial[:, None] + np.cumsum(D, axis=1)[:, :len(cortes)]
+
+        S = np.full((len(materiales), len(cortes)), np.nan)
+        fila_s = indice.get_indexer(instantaneas['material_id'])
+        validas = fila_s >= 0
+        S[fila_s[validas], np.searchsorted(cortes, instantaneas['fecha'].to_numpy(str)[validas])] = \
+            instantaneas['cantidad'].to_numpy(float)[validas]
+
+        distintas = np.abs(np.nan_to_num(S - libro)) > tolerancia
+        con_diferencia = distintas.sum(axis=1)
+        alguna = distintas.any(axis=1)
+        primera_diferencia[alguna] = cortes[np.argmax(distintas[alguna], axis=1)]
+        filas_d, cortes_d = np.nonzero(distintas)
+        libro_cortes = pd.DataFrame({'material_id': indice[filas_d], 'fecha': cortes[cortes_d],
+                                     'cantidad': libro[filas_d, cortes_d]})
+
+    resultado = materiales.assign(
+        esperado=esperado,
+        diferencia=actual - esperado,
+        instantaneas_con_diferencia=con_diferencia,
+        primera_diferencia=primera_diferencia,
+        primer_saldo_negativo=primer_negativo,
+    )
+    resultado = resultado[(resultado['diferencia'].abs() > tolerancia)
+                          | (resultado['instantaneas_con_diferencia'] > 0)
+                          | resultado['primer_saldo_negativo'].notna()]
+    resultado = (resultado.reindex(columns=COLUMNAS_DIFERENCIAS)
+                 .sort_values('diferencia', key=lambda d: d.abs(), ascending=False)
+                 .reset_index(drop=True))
+    resultado['inicial_estimado'] = resultado['inicial_estimado'].astype(bool)
+    return resultado, libro_cortes
+
+
+def revisar_integridad(conn):
+    """{revisión: registros con el problema}"""
+    return {nombre: conn.execute(consulta).fetchone()[0]
+            for nombre, consulta in CONSULTAS_INTEGRIDAD.items()}
+
+
+def leer_libro(db_path, escritura=False):
+    """Conexión con los años archivados adjuntos y una transacción abierta
+
+    Con escritura=True la transacción reserva la base (BEGIN IMMEDIATE): nadie
+    registra movimientos entre la lectura y la corrección.
+    """
+    conn = conectar(db_path)
+    # Base que aún no abrió ninguna de las dos aplicaciones después de actualizar
+    instalar_stock_inicial(conn, db_path)
+    conn.commit()
+    # ATTACH no se puede ejecutar dentro de una transacción
+    if anios_archivados(db_path):
+        adjuntar_archivos(conn, db_path)
+    conn.execute('BEGIN IMMEDIATE' if escritura else 'BEGIN')
+    return conn
+
+
+def conciliar_stock(db_path, tolerancia=TOLERANCIA):
+    """(diferencias, integridad) de la base de datos"""
+    conn = leer_libro(db_path)
+    try:
+        diferencias, _ = conciliar(*cargar_libro(conn, db_path), tolerancia=tolerancia)
+        return diferencias, revisar_integridad(conn)
+    finally:
+        conn.close()
+
+
+def reparar_stock(db_path, tolerancia=TOLERANCIA):
+    """Lleva cantidad_actual y las instantáneas al valor del libro; devuelve los ids corregidos
+
+    Lee y corrige en la misma transacción de escritura, así que no se pierde
+    ningún movimiento registrado al mismo tiempo. Los saldos negativos del libro
+    no se pueden corregir aquí: faltan movimientos, que hay que registrar.
+    """
+    conn = leer_libro(db_path, escritura=True)
+    try:
+        diferencias, libro_cortes = conciliar(*cargar_libro(conn, db_path), tolerancia=tolerancia)
+        pendientes = diferencias[diferencias['diferencia'].abs() > tolerancia]
+        conn.executemany('UPDATE materiales SET cantidad_actual = ? WHERE id = ?',
+                         [(float(e), int(i)) for i, e in zip(pendientes['material_id'], pendientes['esperado'])])
+        conn.executemany('UPDATE stock_instantaneas SET cantidad = ? WHERE material_id = ? AND fecha = ?',
+                         [(float(c), int(i), f) for i, f, c in libro_cortes.itertuples(index=False)])
+        conn.commit()
+    finally:
+        conn.close()
+    return sorted(set(pendientes['material_id'].astype(int)) | set(libro_cortes['material_id'].astype(int)))
+
+
+def como_filas(diferencias):
+    """(columnas, filas) con tipos de Python y None en lugar de NaN, para la API"""
+    filas = diferencias.astype(object).where(diferencias.notna(), None).values.tolist()
+    return list(diferencias.columns), filas
+
+
+def imprimir_diferencias(diferencias, limite=None, sangria='   '):
+    """Una línea por material con diferencias"""
+    for fila in diferencias.head(limite).itertuples(index=False):
+        detalles = []
+        if fila.primera_diferencia:
+            detalles.append(f'instantánea distinta desde {fila.primera_diferencia[:7]}')
+        if fila.primer_saldo_negativo:
+            detalles.append(f'saldo negativo desde {fila.primer_saldo_negativo[:10]}')
+        if fila.inicial_estimado:
+            detalles.append('cantidad de alta estimada')
+        extra = f" ({', '.join(detalles)})" if detalles else ''
+        print(f'{sangria}{fila.codigo} {fila.nombre}: actual {fila.cantidad_actual:g}, '
+              f'libro {fila.esperado:g}, diferencia {fila.diferencia:+g}{extra}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Concilia el stock con el libro de movimientos')
+    parser.add_argument('--db', default='inventario_ptar.db')
+    parser.add_argument('--reparar', action='store_true',
+                        help='corregir cantidad_actual y las instantáneas de los materiales con diferencias')
+    parser.add_argument('--tolerancia', type=float, default=TOLERANCIA)
+    opciones = parser.parse_args()
+
+    if opciones.reparar:
+        corregidos = reparar_stock(opciones.db, opciones.tolerancia)
+        print(f'[OK] {len(corregidos)} materiales corregidos\n')
+
+    diferencias, integridad = conciliar_stock(opciones.db, opciones.tolerancia)
+
+    print('Integridad:')
+    for nombre, cantidad in integridad.items():
+        print(f"   [{'OK' if not cantidad else 'ERROR'}] {nombre}: {cantidad}")
+
+    print(f'\nMateriales con diferencias: {len(diferencias)}')
+    imprimir_diferencias(diferencias)
+
+
+if __name__ == '__main__':
+    main()
@@ -22,6 +22,6 @@ echo.
 timeout /t 3 /nobreak >nul
 start http://localhost:5000
 
-python app.py
+python servidor.py
 
 pause
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Exportación de reportes a Excel en segundo plano
+
+Las filas se leen de SQLite por lotes y se escriben con un libro de openpyxl en
+modo write_only, así que la memoria usada no depende del tamaño del reporte.
+
+openpyxl y pandas tardan en importarse y solo se usan al generar reportes, así
+que se cargan la primera vez que hacen falta. precargar_dependencias() permite
+adelantar ese costo en un hilo aparte (variable de entorno PTAR_PRECARGAR_REPORTES=1).
+"""
+import os
+import queue
+import sqlite3
+import threading
+
+TAMAÑO_LOTE = 500
+
+
+def cargar_pandas():
+    """Importa pandas la primera vez que se necesita"""
+    import pandas
+    return pandas
+
+
+def cargar_openpyxl():
+    """Importa openpyxl la primera vez que se necesita"""
+    import openpyxl
+    return openpyxl
+
+
+def precarga_solicitada():
+    """Indica si PTAR_PRECARGAR_REPORTES pide cargar las dependencias al arrancar"""
+    return os.environ.get('PTAR_PRECARGAR_REPORTES', '').lower() in ('1', 'true', 'si', 'sí')
+
+
+def precargar_dependencias(con_pandas=True, en_segundo_plano=True):
+    """Importa openpyxl (y pandas) por adelantado para que el primer reporte no espere"""
+    def cargar():
+        try:
+            cargar_openpyxl()
+            if con_pandas:
+                cargar_pandas()
+        except ImportError:
+            # El reporte mostrará el error cuando se pida
+            pass
+
+    if not en_segundo_plano:
+        cargar()
+        return None
+    hilo = threading.Thread(target=cargar, daemon=True)
+    hilo.start()
+    return hilo
+
+
+class ExportacionCancelada(Exception):
+    """El usuario canceló la exportación"""
+
+
+def exportar_excel(db_path, query, params, columnas, filepath, hoja='Reporte',
+                   al_avanzar=None, cancelado=None):
+    """Escribe el resultado de una consulta en un archivo .xlsx y devuelve el número de filas"""
+    conn = sqlite3.connect(db_path, timeout=30.0)
+    try:
+        total = conn.execute(f"SELECT COUNT(*) FROM ({query})", params).fetchone()[0]
+
+        libro = cargar_openpyxl().Workbook(write_only=True)
+        hoja_excel = libro.create_sheet(hoja)
+        hoja_excel.append(columnas)
+
+        cursor = conn.execute(query, params)
+        escritas = 0
+        while True:
+            if cancelado is not None and cancelado.is_set():
+                raise ExportacionCancelada()
+
+            filas = cursor.fetchmany(TAMAÑO_LOTE)
+            if not filas:
+                break
+
+            for fila in filas:
+                hoja_excel.append(fila)
+            escritas += len(filas)
+
+            if al_avanzar:
+                al_avanzar(escritas, total)
+
+        # El archivo solo se crea al final: cancelar no deja archivos a medias
+        libro.save(filepath)
+        return escritas
+    finally:
+        conn.close()
+
+
+class ExportacionEnSegundoPlano:
+    """Ejecuta exportar_excel() en un hilo y publica su avance en una cola
+
+    Mensajes de la cola: ('progreso', escritas, total), ('fin', escritas),
+    ('cancelado',) y ('error', mensaje).
+    """
+
+    def __init__(self, db_path, query, params, columnas, filepath, hoja='Reporte'):
+        self.filepath = filepath
+        self.args = (db_path, query, params, columnas, filepath, hoja)
+        self.cola = queue.Queue()
+        self.cancelado = threading.Event()
+        self.hilo = threading.Thread(target=self._ejecutar, daemon=True)
+
+    def iniciar(self):
+        """Inicia la exportación"""
+        self.hilo.start()
+
+    def cancelar(self):
+        """Pide cancelar la exportación (se detiene al terminar el lote actual)"""
+        self.cancelado.set()
+
+    def activa(self):
+        """Indica si la exportación sigue en curso"""
+        return self.hilo.is_alive()
+
+    def _ejecutar(self):
+        try:
+            escritas = exportar_excel(*self.args,
+                                      al_avanzar=lambda n, total: self.cola.put(('progreso', n, total)),
+                                      cancelado=self.cancelado)
+            self.cola.put(('fin', escritas))
+        except ExportacionCancelada:
+            self.cola.put(('cancelado',))
+        except Exception as e:
+            self.cola.put(('error', str(e)))
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Fechas de la base de datos: formato único, índices y rangos
+
+Todas las fechas se guardan como texto 'AAAA-MM-DD HH:MM:SS'. Con un formato
+fijo el orden del texto es el orden cronológico, así que los filtros por mes o
+por rango se escriben como `fecha >= ? AND fecha < ?` y usan los índices, en
+lugar de `fecha LIKE 'AAAA-MM%'` (que recorre la tabla) o `date('now')` (que
+está en UTC y compara contra un formato distinto).
+
+normalizar_fechas() reescribe al formato único los valores que se hayan
+guardado de otra forma (con 'T', fracciones de segundo, solo el día o
+DD/MM/AAAA); los que no se pueden interpretar se dejan como están.
+"""
+from datetime import datetime, timedelta
+
+FORMATO_FECHA = '%Y-%m-%d %H:%M:%S'
+
+# Valores que ya tienen el formato único
+PATRON_FECHA = '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9] [0-9][0-9]:[0-9][0-9]:[0-9][0-9]'
+
+# Formatos aceptados al normalizar datos antiguos
+FORMATOS_ENTRADA = (
+    '%Y-%m-%dT%H:%M:%S',
+    '%Y-%m-%d %H:%M',
+    '%Y-%m-%dT%H:%M',
+    '%Y-%m-%d',
+    '%d/%m/%Y %H:%M:%S',
+    '%d/%m/%Y %H:%M',
+    '%d/%m/%Y',
+)
+
+COLUMNAS_FECHA = {
+    'materiales': ('fecha_registro',),
+    'movimientos': ('fecha',),
+    'prestamos': ('fecha_prestamo', 'fecha_devolucion'),
+    'material_en_uso': ('fecha_instalacion',),
+}
+
+# Índices para los listados ordenados por fecha y los filtros por rango
+INDICES_FECHA = (
+    ('idx_movimientos_fecha', 'movimientos', 'fecha'),
+    ('idx_prestamos_fecha', 'prestamos', 'fecha_prestamo'),
+    ('idx_material_en_uso_fecha', 'material_en_uso', 'fecha_instalacion'),
+)
+
+
+def interpretar_fecha(texto):
+    """datetime de un valor guardado en cualquiera de los formatos conocidos, o None"""
+    texto = (texto or '').strip()
+    # Fracciones de segundo y zona horaria de isoformat(): se descartan
+    base = texto[:19]
+    for formato in (FORMATO_FECHA,) + FORMATOS_ENTRADA:
+        for valor in (texto, base):
+            try:
+                return datetime.strptime(valor, formato)
+            except ValueError:
+                pass
+    return None
+
+
+def normalizar_fechas(conn):
+    """Reescribe al formato único las fechas guardadas de otra forma; devuelve cuántas cambió
+
+    No confirma la transacción.
+    """
+    cambiadas = 0
+    for tabla, columnas in COLUMNAS_FECHA.items():
+        for columna in columnas:
+            filas = conn.execute(f'''
+                SELECT rowid, {columna} FROM {tabla}
+                WHERE {columna} IS NOT NULL AND {columna} != ''
+                  AND {columna} NOT GLOB '{PATRON_FECHA}'
+            ''').fetchall()
+            for rowid, valor in filas:
+                momento = interpretar_fecha(valor)
+                if momento is not None:
+                    conn.execute(f'UPDATE {tabla} SET {columna} = ? WHERE rowid = ?',
+                                 (momento.strftime(FORMATO_FECHA), rowid))
+                    cambiadas += 1
+    return cambiadas
+
+
+def instalar_fechas(conn):
+    """Normaliza las fechas existentes y crea los índices por fecha; devuelve las fechas cambiadas"""
+    cambiadas = normalizar_fechas(conn)
+    for nombre, tabla, columna in INDICES_FECHA:
+        conn.execute(f'CREATE INDEX IF NOT EXISTS {nombre} ON {tabla} ({columna})')
+    return cambiadas
+
+
+def inicio_de_fecha(fecha):
+    """Límite inclusivo para ?desde=: 'AAAA-MM-DD' empieza a las 00:00:00
+
+    Lanza ValueError si la fecha no tiene uno de los dos formatos.
+    """
+    fecha = (fecha or '').strip()
+    try:
+        return datetime.strptime(fecha, '%Y-%m-%d').strftime(FORMATO_FECHA)
+    except ValueError:
+        return datetime.strptime(fecha, FORMATO_FECHA).strftime(FORMATO_FECHA)
+
+
+def limite_de_fecha(fecha):
+    """Límite exclusivo para ?fecha= y ?hasta=: 'AAAA-MM-DD' incluye todo ese día
+
+    Lanza ValueError si la fecha no tiene uno de los dos formatos.
+    """
+    fecha = (fecha or '').strip()
+    try:
+        dia = datetime.strptime(fecha, '%Y-%m-%d')
+        return (dia + timedelta(days=1)).strftime(FORMATO_FECHA)
+    except ValueError:
+        momento = datetime.strptime(fecha, FORMATO_FECHA)
+        return (momento + timedelta(seconds=1)).strftime(FORMATO_FECHA)
+
+
+def rango_de_fechas(desde=None, hasta=None):
+    """(inicio inclusivo, límite exclusivo) de ?desde= y ?hasta=; None donde no se indicó
+
+    Lanza ValueError si alguna fecha es inválida.
+    """
+    return (inicio_de_fecha(desde) if desde else None,
+            limite_de_fecha(hasta) if hasta else None)
+
+
+def rango_de_mes(momento):
+    """(inicio, límite exclusivo) del mes de `momento`"""
+    inicio = momento.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    fin = (inicio + timedelta(days=32)).replace(day=1)
+    return inicio.strftime(FORMATO_FECHA), fin.strftime(FORMATO_FECHA)
+
+
+def filtro_rango(columna, inicio, limite, params):
+    """Condiciones SQL ' AND columna >= ? AND columna < ?' para el rango, agregando los parámetros"""
+    filtro = ''
+    if inicio:
+        filtro += f' AND {columna} >= ?'
+        params.append(inicio)
+    if limite:
+        filtro += f' AND {columna} < ?'
+        params.append(limite)
+    return filtro
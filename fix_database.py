@@ -3,10 +3,16 @@
 """
 Script para verificar y arreglar problemas de la base de datos SQLite
 """
+import argparse
 import sqlite3
 import os
 import sys
 
+from archivo_movimientos import (MAX_ANIOS_ARCHIVADOS, anios_archivables, anios_sin_espacio,
+                                 archivar_anios_cerrados, ruta_archivo)
+from conciliacion_stock import TOLERANCIA, conciliar_stock, imprimir_diferencias
+from vigilante_cambios import instalar_registro_cambios, purgar_cambios
+
 # Configurar encoding para Windows
 if sys.platform == 'win32':
     import io
@@ -14,8 +20,12 @@ if sys.platform == 'win32':
 
 DB_PATH = 'inventario_ptar.db'
 
-def verificar_y_arreglar_db():
-    """Verifica y arregla problemas comunes de la base de datos"""
+def verificar_y_arreglar_db(archivar=False):
+    """Verifica y arregla problemas comunes de la base de datos
+
+    Con archivar=True mueve además los movimientos de los años cerrados a
+    archivo/ (la aplicación de escritorio deja de mostrarlos).
+    """
 
     print("=" * 60)
     print("VERIFICANDO BASE DE DATOS")
@@ -66,26 +76,76 @@ def verificar_y_arreglar_db():
         else:
             print("   [OK] Timeout adecuado")
 
-        # 4. Optimizar base de datos
-        print("\n4. Optimizando base de datos...")
+        # 4. Limpiar registro de cambios antiguo
+        print("\n4. Limpiando registro de cambios...")
+        instalar_registro_cambios(conn)
+        eliminados = purgar_cambios(conn)
+        conn.commit()
+        print(f"   [OK] {eliminados} cambios antiguos eliminados")
+
+        # 5. Archivar los movimientos de años cerrados (antes de VACUUM para recuperar el espacio)
+        print("\n5. Archivando movimientos de años cerrados...")
+        if archivar:
+            movidos = archivar_anios_cerrados(conn, DB_PATH)
+            for anio, cantidad in movidos.items():
+                print(f"   [OK] {anio}: {cantidad} movimientos -> {ruta_archivo(DB_PATH, anio)}")
+            if not movidos:
+                print("   [OK] No hay años para archivar")
+            pendientes = anios_sin_espacio(conn, DB_PATH)
+            if pendientes:
+                print(f"   [AVISO] Límite de {MAX_ANIOS_ARCHIVADOS} años archivados: "
+                      f"{', '.join(map(str, pendientes))} se quedan en la base activa")
+        else:
+            # Mover años fuera de la base los oculta de la aplicación de escritorio
+            archivables = anios_archivables(conn)
+            if archivables:
+                print(f"   [OK] Omitido; años que se podrían archivar: {', '.join(map(str, archivables))}")
+                print("   Para archivarlos: python fix_database.py --archivar")
+            else:
+                print("   [OK] No hay años para archivar")
+
+        # 6. Conciliar el stock con los movimientos (solo informa; corrige con --reparar)
+        print("\n6. Conciliando stock con los movimientos...")
+        conn.commit()
+        try:
+            diferencias, integridad = conciliar_stock(DB_PATH)
+            imprimir_diferencias(diferencias, limite=10, sangria='   [ERROR] ')
+            corregibles = int(((diferencias['diferencia'].abs() > TOLERANCIA)
+                               | (diferencias['instantaneas_con_diferencia'] > 0)).sum())
+            negativos = int(diferencias['primer_saldo_negativo'].notna().sum())
+            if corregibles:
+                print(f"   {corregibles} materiales con el stock o las instantáneas distintos; para corregirlos:")
+                print("   python conciliacion_stock.py --reparar")
+            if negativos:
+                print(f"   {negativos} materiales con saldo negativo en el libro: faltan movimientos por registrar")
+            if not len(diferencias):
+                print("   [OK] El stock coincide con los movimientos")
+            for nombre, cantidad in integridad.items():
+                if cantidad:
+                    print(f"   [ERROR] {nombre}: {cantidad}")
+        except ImportError:
+            print("   [AVISO] Se necesita pandas para conciliar (pip install pandas)")
+
+        # 7. Optimizar base de datos
+        print("\n7. Optimizando base de datos...")
         cursor.execute('VACUUM')
         print("   [OK] Base de datos optimizada")
 
-        # 5. Analizar tablas para mejorar rendimiento
-        print("\n5. Analizando tablas...")
+        # 8. Analizar tablas para mejorar rendimiento
+        print("\n8. Analizando tablas...")
         cursor.execute('ANALYZE')
         print("   [OK] Analisis completado")
 
-        # 6. Verificar que no hay transacciones abiertas
-        print("\n6. Verificando transacciones...")
+        # 9. Verificar que no hay transacciones abiertas
+        print("\n9. Verificando transacciones...")
         try:
             conn.commit()
             print("   [OK] No hay transacciones pendientes")
         except Exception as e:
             print(f"   [ERROR] Error: {e}")
 
-        # 7. Mostrar información de las tablas
-        print("\n7. Información de tablas:")
+        # 10. Mostrar información de las tablas
+        print("\n10. Información de tablas:")
         cursor.execute("""
             SELECT name FROM sqlite_master
             WHERE type='table' AND name NOT LIKE 'sqlite_%'
@@ -120,4 +180,7 @@ def verificar_y_arreglar_db():
         return False
 
 if __name__ == '__main__':
-    verificar_y_arreglar_db()
+    parser = argparse.ArgumentParser(description='Verifica y arregla la base de datos')
+    parser.add_argument('--archivar', action='store_true',
+                        help='mover los movimientos de los años cerrados a archivo/')
+    verificar_y_arreglar_db(parser.parse_args().archivar)
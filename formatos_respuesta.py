@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Formatos de respuesta para las rutas que devuelven listas de filas
+
+Según el encabezado Accept (o ?formato=) una lista se envía como:
+- application/json: arreglo de objetos (formato original)
+- application/vnd.ptar.columnas+json: {"columns": [...], "rows": [[...], ...]}
+- application/x-msgpack: el mismo formato de columnas en MessagePack
+
+Los formatos de columnas se arman directamente con las tuplas de SQLite,
+sin crear un diccionario por fila.
+"""
+from flask import Response, jsonify
+
+try:
+    import msgpack
+except ImportError:  # msgpack es opcional: sin él no se ofrece ese formato
+    msgpack = None
+
+MIME_JSON = 'application/json'
+MIME_COLUMNAS = 'application/vnd.ptar.columnas+json'
+MIME_MSGPACK = 'application/x-msgpack'
+
+FORMATOS_POR_NOMBRE = {
+    'json': MIME_JSON,
+    'columnas': MIME_COLUMNAS,
+    'msgpack': MIME_MSGPACK,
+}
+
+
+def formatos_disponibles():
+    """Tipos MIME que el servidor puede generar, el primero es el predeterminado"""
+    formatos = [MIME_JSON, MIME_COLUMNAS]
+    if msgpack is not None:
+        formatos.append(MIME_MSGPACK)
+    return formatos
+
+
+def elegir_formato(peticion):
+    """Tipo MIME de respuesta según ?formato= o el encabezado Accept"""
+    disponibles = formatos_disponibles()
+    nombre = peticion.args.get('formato')
+    if nombre:
+        mime = FORMATOS_POR_NOMBRE.get(nombre)
+        return mime if mime in disponibles else MIME_JSON
+    return peticion.accept_mimetypes.best_match(disponibles, default=MIME_JSON)
+
+
+def consultar_filas(conn, query, params=()):
+    """Ejecuta una consulta y devuelve (columnas, filas como tuplas)"""
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    cursor.execute(query, params)
+    columnas = [d[0] for d in cursor.description]
+    return columnas, cursor.fetchall()
+
+
+def en_columnas(columnas, filas):
+    """Forma de columnas {'columns': [...], 'rows': [[...], ...]}"""
+    return {'columns': columnas, 'rows': filas}
+
+
+def responder_filas(peticion, columnas, filas):
+    """Respuesta con las filas en el formato negociado"""
+    formato = elegir_formato(peticion)
+
+    if formato == MIME_MSGPACK:
+        respuesta = Response(msgpack.packb(en_columnas(columnas, filas), use_bin_type=True),
+                             mimetype=MIME_MSGPACK)
+    elif formato == MIME_COLUMNAS:
+        respuesta = jsonify(en_columnas(columnas, filas))
+        respuesta.mimetype = MIME_COLUMNAS
+    else:
+        respuesta = jsonify([dict(zip(columnas, fila)) for fila in filas])
+
+    respuesta.vary.add('Accept')
+    return respuesta
+
+
+def responder_documento(peticion, datos):
+    """Respuesta con un documento en MessagePack si el cliente lo prefiere, si no en JSON"""
+    disponibles = [MIME_JSON] + ([MIME_MSGPACK] if msgpack is not None else [])
+    if peticion.accept_mimetypes.best_match(disponibles, default=MIME_JSON) == MIME_MSGPACK:
+        respuesta = Response(msgpack.packb(datos, use_bin_type=True), mimetype=MIME_MSGPACK)
+    else:
+        respuesta = jsonify(datos)
+
+    respuesta.vary.add('Accept')
+    return respuesta
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Instantáneas mensuales de stock y consulta del stock en una fecha pasada
+
+Al inicio de cada mes se guarda en `stock_instantaneas` la cantidad de cada
+material en ese momento (antes de cualquier movimiento del mes). El stock en
+una fecha se calcula desde la instantánea más cercana sumando o restando solo
+los movimientos entre ambas, así que el costo depende de los movimientos de
+un mes y no de toda la historia. Sin instantáneas se parte de cantidad_actual.
+
+Las ediciones directas de la cantidad (sin movimiento) no se pueden
+reconstruir; cada instantánea nueva vuelve a tomar la cantidad real
+(cantidad_actual menos los movimientos posteriores al corte) y las fechas
+posteriores al último corte también parten de ella, así que el error queda
+acotado al mes en que ocurrió la edición. conciliacion_stock.py encuentra ese
+mes y corrige las instantáneas anteriores.
+
+Uso (por ejemplo desde el Programador de tareas una vez al día):
+    python instantaneas_stock.py [ruta_db]
+"""
+import sqlite3
+import sys
+import threading
+from datetime import datetime, timedelta
+
+from fechas import FORMATO_FECHA
+
+# Efecto de cada tipo de movimiento sobre cantidad_actual
+SIGNOS_MOVIMIENTO = {
+    'ENTRADA': 1,
+    'DEVOLUCIÓN': 1,
+    'SALIDA': -1,
+    'PRÉSTAMO': -1,
+    'EN USO': -1,
+}
+
+# Cada cuánto revisa el servidor si ya empezó un mes sin instantánea
+INTERVALO_REVISION_INSTANTANEAS = 3600
+
+# Variación de stock de un movimiento, como expresión SQL
+DELTA_SQL = 'CASE tipo_movimiento {} ELSE 0 END'.format(' '.join(
+    f"WHEN '{tipo}' THEN {'' if signo > 0 else '-'}cantidad"
+    for tipo, signo in SIGNOS_MOVIMIENTO.items()
+))
+
+
+def instalar_instantaneas(conn):
+    """Crea la tabla de instantáneas y el índice de movimientos por material y fecha"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS stock_instantaneas (
+            material_id INTEGER NOT NULL,
+            fecha TEXT NOT NULL,
+            cantidad REAL NOT NULL,
+            PRIMARY KEY (material_id, fecha)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_stock_instantaneas_fecha
+        ON stock_instantaneas (fecha)
+    ''')
+    # Los movimientos de un material en un periodo se leen sin recorrer la tabla
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_movimientos_material_fecha
+        ON movimientos (material_id, fecha)
+    ''')
+
+
+def _cortes_vecinos(conn, limite):
+    """Instantánea anterior o igual y posterior al límite (None si no hay)"""
+    anterior = conn.execute('SELECT MAX(fecha) FROM stock_instantaneas WHERE fecha <= ?',
+                            (limite,)).fetchone()[0]
+    posterior = conn.execute('SELECT MIN(fecha) FROM stock_instantaneas WHERE fecha > ?',
+                             (limite,)).fetchone()[0]
+    return anterior, posterior
+
+
+def consulta_stock_en_fecha(conn, limite, material_id=None, tabla='movimientos', hacia_atras=False):
+    """(consulta, parámetros) del stock de cada material justo antes de `limite`
+
+    Columnas: material_id, codigo, nombre, unidad, cantidad, instantanea (la
+    fecha de la instantánea de partida, o None si se partió de cantidad_actual).
+    `tabla` permite leer los movimientos de la vista con los años archivados.
+    Después del último corte, o con hacia_atras, se parte del corte siguiente o
+    de cantidad_actual, nunca de un corte anterior.
+    """
+    anterior, posterior = _cortes_vecinos(conn, limite)
+    if posterior is None or hacia_atras:
+        # La cantidad actual incluye las ediciones directas posteriores al último corte
+        anterior = None
+    params = {'limite': limite, 'corte': anterior or posterior}
+
+    def suma_movimientos(rango):
+        # Búsqueda por idx_movimientos_material_fecha: solo lee los movimientos del rango
+        return f'''COALESCE((
+                SELECT SUM({DELTA_SQL}) FROM {tabla}
+                WHERE material_id = m.id AND {rango}), 0)'''
+
+    # Sin instantánea para el material (o sin ninguna): desde la cantidad actual
+    cantidad = f"m.cantidad_actual - {suma_movimientos('fecha >= :limite')}"
+    if anterior is not None:
+        # Hacia adelante: instantánea + movimientos desde ella hasta el límite
+        desde_instantanea = f"s.cantidad + {suma_movimientos('fecha >= :corte AND fecha < :limite')}"
+    elif posterior is not None:
+        # Hacia atrás: instantánea siguiente - movimientos entre el límite y ella
+        desde_instantanea = f"s.cantidad - {suma_movimientos('fecha >= :limite AND fecha < :corte')}"
+    else:
+        desde_instantanea = None
+    if desde_instantanea:
+        cantidad = f'CASE WHEN s.cantidad IS NOT NULL THEN {desde_instantanea} ELSE {cantidad} END'
+
+    filtro = ''
+    if material_id is not None:
+        params['material_id'] = material_id
+        filtro = 'AND m.id = :material_id'
+
+    consulta = f'''
+        SELECT m.id AS material_id, m.codigo, m.nombre, m.unidad,
+               {cantidad} AS cantidad,
+               CASE WHEN s.cantidad IS NOT NULL THEN :corte END AS instantanea
+        FROM materiales m
+        LEFT JOIN stock_instantaneas s ON s.material_id = m.id AND s.fecha = :corte
+        WHERE COALESCE(m.fecha_registro, '') < :limite {filtro}
+        ORDER BY m.nombre
+    '''
+    return consulta, params
+
+
+def inicio_de_mes(momento):
+    return momento.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def cortes_mensuales(desde, hasta):
+    """Inicios de mes entre desde y hasta (incluidos), como texto"""
+    corte = inicio_de_mes(desde)
+    if corte < desde:
+        corte = (corte + timedelta(days=32)).replace(day=1)
+    cortes = []
+    while corte <= hasta:
+        cortes.append(corte.strftime(FORMATO_FECHA))
+        corte = (corte + timedelta(days=32)).replace(day=1)
+    return cortes
+
+
+def asegurar_instantaneas(conn, ahora=None):
+    """Crea las instantáneas mensuales que falten, de la más reciente a la más antigua
+
+    La primera vez genera un corte por mes desde el primer movimiento; después
+    solo el del mes en curso. Cada corte sale de cantidad_actual menos los
+    movimientos posteriores (o del corte siguiente recién creado), no del corte
+    anterior, para no arrastrar diferencias. Devuelve cuántos cortes se
+    crearon. No confirma la transacción.
+    """
+    ahora = ahora or datetime.now()
+    primero = conn.execute('SELECT MIN(fecha) FROM movimientos').fetchone()[0]
+    try:
+        desde = datetime.strptime(primero[:19], FORMATO_FECHA) if primero else ahora
+    except ValueError:
+        desde = ahora
+    existentes = {fila[0] for fila in conn.execute('SELECT DISTINCT fecha FROM stock_instantaneas')}
+    faltantes = [c for c in cortes_mensuales(inicio_de_mes(desde), ahora) if c not in existentes]
+
+    for corte in reversed(faltantes):
+        consulta, params = consulta_stock_en_fecha(conn, corte, hacia_atras=True)
+        conn.execute(f'''
+            INSERT OR REPLACE INTO stock_instantaneas (material_id, fecha, cantidad)
+            SELECT material_id, :corte_nuevo, cantidad FROM ({consulta})
+        ''', {**params, 'corte_nuevo': corte})
+    return len(faltantes)
+
+
+class RevisionInstantaneas:
+    """Crea el corte del mes en curso desde un hilo propio mientras el servidor está en marcha"""
+
+    def __init__(self, db_path, intervalo=INTERVALO_REVISION_INSTANTANEAS):
+        self.db_path = db_path
+        self.intervalo = intervalo
+        self._detener = threading.Event()
+        self._hilo = threading.Thread(target=self._ejecutar, name='instantaneas-stock', daemon=True)
+
+    def iniciar(self):
+        """Inicia la revisión periódica"""
+        self._hilo.start()
+
+    def detener(self):
+        """Detiene la revisión al terminar la vuelta actual"""
+        self._detener.set()
+
+    def _ejecutar(self):
+        while not self._detener.wait(self.intervalo):
+            conn = sqlite3.connect(self.db_path, timeout=30.0)
+            try:
+                if asegurar_instantaneas(conn):
+                    conn.commit()
+            except sqlite3.Error:
+                # Base de datos ocupada: se reintenta en la siguiente vuelta
+                pass
+            finally:
+                conn.close()
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    db_path = argv[0] if argv else 'inventario_ptar.db'
+    conn = sqlite3.connect(db_path, timeout=30.0)
+    try:
+        instalar_instantaneas(conn)
+        creados = asegurar_instantaneas(conn)
+        conn.commit()
+    finally:
+        conn.close()
+    print(f'Instantáneas de stock creadas: {creados} cortes mensuales')
+
+
+if __name__ == '__main__':
+    main()
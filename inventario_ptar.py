@@ -1,16 +1,39 @@
 import customtkinter as ctk
 from tkinter import ttk, messagebox, filedialog
 import sqlite3
-from datetime import datetime
+from datetime import datetime, timedelta
 import os
-import pandas as pd
 from PIL import Image, ImageTk
 import shutil
+import queue
+import locale
+from functools import lru_cache
+from cache_imagenes import CacheImagenes
+from catalogo_materiales import CatalogoMateriales
+from catalogos import MapaCatalogos, instalar_catalogos
+from conciliacion_stock import instalar_stock_inicial
+from exportador_reportes import ExportacionEnSegundoPlano, precarga_solicitada, precargar_dependencias
+from fechas import FORMATO_FECHA, instalar_fechas, rango_de_mes
+from kardex import POR_PAGINA_KARDEX, consulta_kardex, parametros_kardex
+from vigilante_cambios import VigilanteCambios, instalar_registro_cambios
 
 # Configuración de CustomTkinter
 ctk.set_appearance_mode("light")
 ctk.set_default_color_theme("blue")
 
+# Ruta a la base de datos
+DB_PATH = 'inventario_ptar.db'
+
+# Cada cuánto se revisa si la versión web modificó la base de datos
+INTERVALO_REVISION_CAMBIOS_MS = 2000
+
+# Ids por consulta IN (...), por debajo del límite de parámetros de SQLite (999 en versiones antiguas)
+LOTE_IDS = 500
+
+# Tamaños de imagen usados en el visor y en las ventanas de edición
+TAMAÑO_VISOR_IMAGEN = (530, 530)
+TAMAÑO_MINIATURA_IMAGEN = (280, 280)
+
 class AutocompleteEntry(ctk.CTkFrame):
     """Widget de entrada con autocompletado para materiales"""
     
@@ -143,6 +166,55 @@ class AutocompleteEntry(ctk.CTkFrame):
         """Actualiza la lista de items disponibles"""
         self.items = items or []
 
+# Orden alfabético según el idioma del sistema (acentos, ñ)
+try:
+    locale.setlocale(locale.LC_COLLATE, '')
+except locale.Error:
+    pass
+
+@lru_cache(maxsize=8192)
+def clave_orden_texto(valor):
+    """Clave de ordenamiento alfabético según el locale"""
+    return (0, locale.strxfrm(valor.casefold())) if valor else (1, '')
+
+@lru_cache(maxsize=8192)
+def clave_orden_numero(valor):
+    """Clave de ordenamiento numérico para textos como '12.50' o '$1,200.00'"""
+    try:
+        return (0, float(valor.replace('$', '').replace(',', '').split()[0]))
+    except (ValueError, IndexError):
+        return (1, 0.0)
+
+@lru_cache(maxsize=8192)
+def clave_orden_fecha(valor):
+    """Clave de ordenamiento por fecha 'YYYY-MM-DD HH:MM:SS'"""
+    try:
+        return (0, datetime.strptime(valor[:19], "%Y-%m-%d %H:%M:%S"))
+    except ValueError:
+        return (1, datetime.min)
+
+# Tipo de ordenamiento por nombre de columna (las demás se ordenan como texto)
+CLAVES_ORDEN_COLUMNA = {
+    "ID": clave_orden_numero,
+    "Cantidad": clave_orden_numero,
+    "Stock Actual": clave_orden_numero,
+    "Stock Mín": clave_orden_numero,
+    "Costo Unit.": clave_orden_numero,
+    "Fecha": clave_orden_fecha,
+    "Fecha Préstamo": clave_orden_fecha,
+    "Fecha Instalación": clave_orden_fecha,
+}
+
+# Columnas SQL de los historiales paginados (LIMIT), que se ordenan en la consulta
+COLUMNAS_SQL_HISTORIAL = {
+    "Fecha": "m.fecha",
+    "Material": "mat.nombre COLLATE NOCASE",
+    "Cantidad": "m.cantidad",
+    "Origen": "m.destino_origen",
+    "Destino": "m.destino_origen",
+    "Responsable": "m.responsable",
+}
+
 class InventarioPTAR:
     def __init__(self, root):
         self.root = root
@@ -151,12 +223,23 @@ class InventarioPTAR:
         
         # Inicializar base de datos
         self.init_database()
+
+        # Catálogo de materiales en memoria compartido por las pestañas
+        self.catalogo = CatalogoMateriales(self.conn)
+        self.catalogo.cargar()
+
+        # Categorías, ubicaciones y unidades para los combos (antes eran listas fijas)
+        self.catalogos = MapaCatalogos()
+        self.catalogos.actualizar(self.conn)
         
         # Crear directorio para imágenes
         self.imagenes_dir = "imagenes_materiales"
         if not os.path.exists(self.imagenes_dir):
             os.makedirs(self.imagenes_dir)
         
+        # Caché de imágenes decodificadas para el visor
+        self.cache_imagenes = CacheImagenes()
+        
         # Variables
         self.busqueda_var = ctk.StringVar()
         self.filtro_categoria = ctk.StringVar(value="Todas")
@@ -169,6 +252,10 @@ class InventarioPTAR:
         self.busqueda_prestamo_var = ctk.StringVar()
         self.filtro_estado_prestamo = ctk.StringVar(value="Todos")
         self.busqueda_uso_var = ctk.StringVar()
+
+        # Ordenamiento por columna: {tree: (columna, descendente)}
+        self.orden_columnas = {}
+        self.historiales_paginados = {}
         
         # Crear interfaz
         self.crear_interfaz()
@@ -183,10 +270,14 @@ class InventarioPTAR:
         self.cargar_historial_salidas()
         self.cargar_prestamos()
         self.cargar_material_en_uso()
+
+        # Vigilar cambios hechos por otros procesos (versión web)
+        self.vigilante = VigilanteCambios(self.conn)
+        self.root.after(INTERVALO_REVISION_CAMBIOS_MS, self.revisar_cambios_externos)
         
     def init_database(self):
         """Inicializa la base de datos SQLite"""
-        self.conn = sqlite3.connect('inventario_ptar.db')
+        self.conn = sqlite3.connect(DB_PATH)
         self.cursor = self.conn.cursor()
         
         # Tabla de materiales
@@ -259,6 +350,24 @@ class InventarioPTAR:
             )
         ''')
         
+        # Índice para los historiales por tipo ordenados por fecha
+        self.cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_movimientos_tipo_fecha
+            ON movimientos (tipo_movimiento, fecha)
+        ''')
+        
+        # Registro de cambios para sincronizar con la versión web
+        instalar_registro_cambios(self.conn)
+        
+        # Fechas en formato único e índices para los filtros por rango
+        instalar_fechas(self.conn)
+        
+        # Catálogos de categorías, ubicaciones, unidades, responsables y destinos
+        instalar_catalogos(self.conn)
+        
+        # Cantidad de alta de cada material, para conciliar el stock con los movimientos
+        instalar_stock_inicial(self.conn, DB_PATH)
+        
         self.conn.commit()
         
     def crear_interfaz(self):
@@ -283,6 +392,13 @@ class InventarioPTAR:
         self.crear_tab_en_uso()
         self.crear_tab_reportes()
         
+        # Ordenamiento al hacer clic en los encabezados
+        for tree in (self.tree_mat_entrada, self.tree_mat_salida, self.tree_mat_prestamo,
+                     self.tree_mat_uso, self.tree_prestamos, self.tree_en_uso):
+            self.configurar_ordenamiento(tree)
+        self.configurar_ordenamiento(self.tree_entradas, self.cargar_historial_entradas)
+        self.configurar_ordenamiento(self.tree_salidas, self.cargar_historial_salidas)
+        
     def crear_tab_inventario(self):
         """Crea la pestaña de inventario"""
         
@@ -298,12 +414,11 @@ class InventarioPTAR:
         
         # Filtro Categoría
         ctk.CTkLabel(frame_busqueda, text="Categoría:").grid(row=0, column=2, padx=5, pady=5)
-        categorias = ["Todas", "Fontanería y Ferretería", "Herramientas y Equipos", 
-                     "Seguridad", "Limpieza", "Papelería"]
-        combo_categoria = ctk.CTkComboBox(frame_busqueda, values=categorias, 
+        categorias = ["Todas"] + self.catalogos.nombres("categorias")
+        self.combo_categoria = ctk.CTkComboBox(frame_busqueda, values=categorias, 
                                          variable=self.filtro_categoria,
                                          command=lambda e: self.cargar_datos())
-        combo_categoria.grid(row=0, column=3, padx=5, pady=5)
+        self.combo_categoria.grid(row=0, column=3, padx=5, pady=5)
         
         # Filtro Estado
         ctk.CTkLabel(frame_busqueda, text="Estado:").grid(row=0, column=4, padx=5, pady=5)
@@ -324,6 +439,8 @@ class InventarioPTAR:
                      command=self.eliminar_material).grid(row=1, column=5, padx=5, pady=5)
         ctk.CTkButton(frame_busqueda, text="Actualizar", 
                      command=self.cargar_datos).grid(row=2, column=2, padx=5, pady=5)
+        ctk.CTkButton(frame_busqueda, text="Kardex", 
+                     command=self.ver_kardex_material).grid(row=2, column=3, padx=5, pady=5)
         
         # Frame para el Treeview
         frame_tree = ctk.CTkFrame(self.tab_inventario)
@@ -364,6 +481,7 @@ class InventarioPTAR:
             self.tree_inventario.heading(col, text=col, command=lambda c=col: self.ordenar_columna(c))
         
         self.tree_inventario.pack(fill="both", expand=True)
+        self.tree_inventario.bind('<<TreeviewSelect>>', self.precargar_imagen_seleccionada)
         
         # Tags para colores
         self.tree_inventario.tag_configure('normal', background='white')
@@ -387,8 +505,7 @@ class InventarioPTAR:
         self.entry_buscar_mat_entrada.bind('<KeyRelease>', lambda e: self.filtrar_materiales_entrada())
 
         ctk.CTkLabel(frame_busqueda_mat, text="Categoría:").pack(side="left", padx=5)
-        categorias = ["Todas", "Fontanería y Ferretería", "Herramientas y Equipos",
-                     "Seguridad", "Limpieza", "Papelería"]
+        categorias = ["Todas"] + self.catalogos.nombres("categorias")
         self.combo_cat_entrada = ctk.CTkComboBox(frame_busqueda_mat, values=categorias,
                                                  width=180,
                                                  command=lambda e: self.filtrar_materiales_entrada())
@@ -504,8 +621,7 @@ class InventarioPTAR:
         self.entry_buscar_mat_salida.bind('<KeyRelease>', lambda e: self.filtrar_materiales_salida())
 
         ctk.CTkLabel(frame_busqueda_mat, text="Categoría:").pack(side="left", padx=5)
-        categorias = ["Todas", "Fontanería y Ferretería", "Herramientas y Equipos",
-                     "Seguridad", "Limpieza", "Papelería"]
+        categorias = ["Todas"] + self.catalogos.nombres("categorias")
         self.combo_cat_salida = ctk.CTkComboBox(frame_busqueda_mat, values=categorias,
                                                 width=180,
                                                 command=lambda e: self.filtrar_materiales_salida())
@@ -619,8 +735,7 @@ class InventarioPTAR:
         self.entry_buscar_mat_prestamo.bind('<KeyRelease>', lambda e: self.filtrar_materiales_prestamo())
 
         ctk.CTkLabel(frame_busqueda_mat, text="Categoría:").pack(side="left", padx=5)
-        categorias = ["Todas", "Fontanería y Ferretería", "Herramientas y Equipos",
-                     "Seguridad", "Limpieza", "Papelería"]
+        categorias = ["Todas"] + self.catalogos.nombres("categorias")
         self.combo_cat_prestamo = ctk.CTkComboBox(frame_busqueda_mat, values=categorias,
                                                  width=180,
                                                  command=lambda e: self.filtrar_materiales_prestamo())
@@ -750,8 +865,7 @@ class InventarioPTAR:
         self.entry_buscar_mat_uso.bind('<KeyRelease>', lambda e: self.filtrar_materiales_uso())
 
         ctk.CTkLabel(frame_busqueda_mat, text="Categoría:").pack(side="left", padx=5)
-        categorias = ["Todas", "Fontanería y Ferretería", "Herramientas y Equipos",
-                     "Seguridad", "Limpieza", "Papelería"]
+        categorias = ["Todas"] + self.catalogos.nombres("categorias")
         self.combo_cat_uso = ctk.CTkComboBox(frame_busqueda_mat, values=categorias,
                                             width=180,
                                             command=lambda e: self.filtrar_materiales_uso())
@@ -889,6 +1003,21 @@ class InventarioPTAR:
                      command=lambda: self.exportar_reporte("en_uso"),
                      width=300, height=50).pack(pady=10)
         
+        # Progreso de la exportación (visible solo mientras se exporta)
+        self.exportacion = None
+        self.frame_exportacion = ctk.CTkFrame(frame_reportes, fg_color="transparent")
+        
+        self.label_exportacion = ctk.CTkLabel(self.frame_exportacion, text="", font=("Arial", 11))
+        self.label_exportacion.pack(pady=(5, 0))
+        
+        self.progress_exportacion = ctk.CTkProgressBar(self.frame_exportacion, width=300)
+        self.progress_exportacion.pack(pady=5)
+        self.progress_exportacion.set(0)
+        
+        ctk.CTkButton(self.frame_exportacion, text="Cancelar Exportación",
+                     command=self.cancelar_exportacion, width=150,
+                     fg_color="#d32f2f", hover_color="#b71c1c").pack(pady=5)
+        
         # Estadísticas
         frame_stats = ctk.CTkFrame(frame)
         frame_stats.pack(fill="both", expand=True, padx=20, pady=20)
@@ -902,14 +1031,8 @@ class InventarioPTAR:
         ctk.CTkButton(frame_stats, text="Actualizar Estadísticas", 
                      command=self.actualizar_estadisticas).pack(pady=10)
         
-    def cargar_datos(self):
-        """Carga los datos en el Treeview del inventario"""
-        
-        # Limpiar treeview
-        for item in self.tree_inventario.get_children():
-            self.tree_inventario.delete(item)
-        
-        # Construir query con filtros
+    def consulta_inventario(self):
+        """Construye la consulta del inventario con los filtros de búsqueda y categoría"""
         query = "SELECT * FROM materiales WHERE 1=1"
         params = []
         
@@ -924,40 +1047,63 @@ class InventarioPTAR:
             query += " AND categoria = ?"
             params.append(self.filtro_categoria.get())
         
+        return query, params
+        
+    def formatear_fila_inventario(self, row):
+        """Devuelve (valores, tag) de una fila de materiales, o None si no pasa el filtro de estado"""
+        cantidad = row[6]
+        stock_min = row[7]
+        
+        # Determinar estado
+        if cantidad <= 0:
+            estado = "Sin Stock"
+            tag = 'sin_stock'
+        elif cantidad <= stock_min:
+            estado = "Stock Bajo"
+            tag = 'bajo'
+        else:
+            estado = "Normal"
+            tag = 'normal'
+        
+        # Filtro de estado
+        if self.filtro_estado.get() != "Todos":
+            if self.filtro_estado.get() == "Stock Normal" and estado != "Normal":
+                return None
+            elif self.filtro_estado.get() == "Stock Bajo" and estado != "Stock Bajo":
+                return None
+            elif self.filtro_estado.get() == "Sin Stock" and estado != "Sin Stock":
+                return None
+        
+        # Sin ubicación: row[0]=id, [1]=codigo, [2]=nombre, [3]=desc, [4]=cat, [5]=unidad,
+        # [6]=cantidad, [7]=stock_min, [8]=ubicacion, [9]=costo, [10]=fecha, [11]=notas, [12]=imagen
+        values = (row[0], row[1], row[2], row[3], row[4], row[5], 
+                 f"{cantidad:.2f}", f"{stock_min:.2f}", 
+                 f"${row[9]:.2f}", estado)
+        
+        return values, tag
+        
+    def cargar_datos(self):
+        """Carga los datos en el Treeview del inventario"""
+        
+        # Limpiar treeview
+        for item in self.tree_inventario.get_children():
+            self.tree_inventario.delete(item)
+        
+        # Construir query con filtros
+        query, params = self.consulta_inventario()
+        
         self.cursor.execute(query, params)
         rows = self.cursor.fetchall()
         
         for row in rows:
-            cantidad = row[6]
-            stock_min = row[7]
-            
-            # Determinar estado
-            if cantidad <= 0:
-                estado = "Sin Stock"
-                tag = 'sin_stock'
-            elif cantidad <= stock_min:
-                estado = "Stock Bajo"
-                tag = 'bajo'
-            else:
-                estado = "Normal"
-                tag = 'normal'
-            
-            # Filtro de estado
-            if self.filtro_estado.get() != "Todos":
-                if self.filtro_estado.get() == "Stock Normal" and estado != "Normal":
-                    continue
-                elif self.filtro_estado.get() == "Stock Bajo" and estado != "Stock Bajo":
-                    continue
-                elif self.filtro_estado.get() == "Sin Stock" and estado != "Sin Stock":
-                    continue
-            
-            # Sin ubicación: row[0]=id, [1]=codigo, [2]=nombre, [3]=desc, [4]=cat, [5]=unidad,
-            # [6]=cantidad, [7]=stock_min, [8]=ubicacion, [9]=costo, [10]=fecha, [11]=notas, [12]=imagen
-            values = (row[0], row[1], row[2], row[3], row[4], row[5], 
-                     f"{cantidad:.2f}", f"{stock_min:.2f}", 
-                     f"${row[9]:.2f}", estado)
+            fila = self.formatear_fila_inventario(row)
+            if fila is None:
+                continue
             
-            self.tree_inventario.insert("", "end", values=values, tags=(tag,))
+            values, tag = fila
+            self.tree_inventario.insert("", "end", iid=row[0], values=values, tags=(tag,))
+        
+        self.aplicar_orden(self.tree_inventario)
         
         # Actualizar combos de materiales
         self.actualizar_combos_materiales()
@@ -965,11 +1111,45 @@ class InventarioPTAR:
         # Actualizar historial de movimientos
         self.cargar_historial_movimientos()
         
+    def actualizar_filas_inventario(self, ids):
+        """Actualiza en el Treeview del inventario solo los materiales indicados"""
+        
+        query, params = self.consulta_inventario()
+        ids = list(ids)
+        filas = {}
+        for inicio in range(0, len(ids), LOTE_IDS):
+            lote = ids[inicio:inicio + LOTE_IDS]
+            marcadores = ", ".join("?" for _ in lote)
+            self.cursor.execute(f"{query} AND id IN ({marcadores})", params + lote)
+            filas.update((row[0], self.formatear_fila_inventario(row)) for row in self.cursor.fetchall())
+        
+        reordenar = False
+        for material_id in ids:
+            iid = str(material_id)
+            fila = filas.get(material_id)
+            
+            if fila is None:
+                # Eliminado o ya no cumple los filtros
+                if self.tree_inventario.exists(iid):
+                    self.tree_inventario.delete(iid)
+                continue
+            
+            values, tag = fila
+            if self.tree_inventario.exists(iid):
+                self.tree_inventario.item(iid, values=values, tags=(tag,))
+            else:
+                self.tree_inventario.insert("", "end", iid=material_id, values=values, tags=(tag,))
+            reordenar = True
+        
+        # Filas nuevas o con otros valores: su lugar depende del orden elegido
+        if reordenar:
+            self.aplicar_orden(self.tree_inventario)
+        self.actualizar_combos_materiales()
+        
     def actualizar_combos_materiales(self):
         """Actualiza los combobox con la lista de materiales"""
         
-        self.cursor.execute("SELECT nombre FROM materiales ORDER BY nombre")
-        materiales = [row[0] for row in self.cursor.fetchall()]
+        materiales = self.catalogo.nombres()
         
         if materiales:
             self.combo_material_entrada.set_items(materiales)
@@ -1090,14 +1270,12 @@ class InventarioPTAR:
             
             if key == "categoria":
                 entry = ctk.CTkComboBox(main_frame, width=300, 
-                                       values=["Fontanería y Ferretería", "Herramientas y Equipos", 
-                                              "Seguridad", "Limpieza", "Papelería"],
+                                       values=self.catalogos.nombres("categorias"),
                                        command=lambda e: actualizar_codigo_auto())
                 entry.set("Fontanería y Ferretería")  # Valor por defecto
             elif key == "unidad":
                 entry = ctk.CTkComboBox(main_frame, width=300,
-                                       values=["Piezas", "Litros", "Kilogramos", "Metros",
-                                              "Cajas", "Sets", "Rollos", "Bolsas", "Galones"])
+                                       values=self.catalogos.nombres("unidades"))
                 entry.set("Piezas")  # Valor por defecto
             elif key in ["descripcion", "notas"]:
                 entry = ctk.CTkTextbox(main_frame, width=300, height=80)
@@ -1239,6 +1417,8 @@ class InventarioPTAR:
                      ubicacion, costo, fecha_actual, notas, imagen_ruta))
                 
                 self.conn.commit()
+                self.catalogo.refrescar(self.cursor.lastrowid)
+                self.actualizar_catalogos()
                 
                 messagebox.showinfo("Éxito", f"Material agregado correctamente\n\nCódigo: {codigo}")
                 ventana.destroy()
@@ -1314,14 +1494,12 @@ class InventarioPTAR:
             
             if "categoría" in label.lower():
                 entry = ctk.CTkComboBox(main_frame, width=300, 
-                                       values=["Fontanería y Ferretería", "Herramientas y Equipos", 
-                                              "Seguridad", "Limpieza", "Papelería"])
+                                       values=self.catalogos.nombres("categorias"))
                 if valor:
                     entry.set(valor)
             elif "unidad" in label.lower():
                 entry = ctk.CTkComboBox(main_frame, width=300,
-                                       values=["Piezas", "Litros", "Kilogramos", "Metros",
-                                              "Cajas", "Sets", "Rollos", "Bolsas", "Galones"])
+                                       values=self.catalogos.nombres("unidades"))
                 if valor:
                     entry.set(valor)
             elif "descripción" in label.lower() or "notas" in label.lower():
@@ -1359,9 +1537,7 @@ class InventarioPTAR:
             ruta_completa = os.path.join(self.imagenes_dir, imagen_actual)
             if os.path.exists(ruta_completa):
                 try:
-                    img = Image.open(ruta_completa)
-                    img.thumbnail((280, 280), Image.Resampling.LANCZOS)
-                    photo = ImageTk.PhotoImage(img)
+                    photo = self.cache_imagenes.obtener(ruta_completa, TAMAÑO_MINIATURA_IMAGEN)
                     label_imagen.configure(image=photo, text="")
                     label_imagen.image = photo
                 except:
@@ -1468,6 +1644,9 @@ class InventarioPTAR:
                             if os.path.exists(ruta_anterior):
                                 os.remove(ruta_anterior)
                         imagen_ruta = None
+                    
+                    if imagen_actual:
+                        self.cache_imagenes.invalidar(os.path.join(self.imagenes_dir, imagen_actual))
                 
                 # Actualizar en base de datos
                 self.cursor.execute('''
@@ -1480,6 +1659,8 @@ class InventarioPTAR:
                      ubicacion, costo, notas, imagen_ruta, material_id))
                 
                 self.conn.commit()
+                self.catalogo.refrescar(material_id)
+                self.actualizar_catalogos()
                 
                 messagebox.showinfo("Éxito", "Material actualizado correctamente")
                 ventana.destroy()
@@ -1501,6 +1682,80 @@ class InventarioPTAR:
         ctk.CTkButton(frame_botones, text="❌ Cancelar", command=ventana.destroy, 
                      width=150, height=45).pack(side="left", padx=5)
         
+    def stock_guardado(self, material_id):
+        """Cantidad actual en la base de datos (la de la tabla en pantalla puede estar desactualizada)"""
+        fila = self.conn.execute("SELECT cantidad_actual FROM materiales WHERE id = ?",
+                                 (material_id,)).fetchone()
+        return fila[0] if fila else 0
+    
+    def ajustar_stock(self, material_id, diferencia):
+        """Suma la diferencia a la cantidad guardada y devuelve la nueva cantidad
+
+        Con una actualización relativa no se pierden los movimientos que la
+        versión web registre mientras tanto.
+        """
+        self.conn.execute("UPDATE materiales SET cantidad_actual = cantidad_actual + ? WHERE id = ?",
+                          (diferencia, material_id))
+        return self.stock_guardado(material_id)
+        
+    def ver_kardex_material(self):
+        """Muestra los movimientos del material seleccionado con el saldo después de cada uno"""
+        
+        seleccion = self.tree_inventario.selection()
+        if not seleccion:
+            messagebox.showwarning("Advertencia", "Selecciona un material para ver su kardex")
+            return
+        
+        item = self.tree_inventario.item(seleccion[0])
+        material_id = item['values'][0]
+        material_nombre = item['values'][2]
+        
+        params = parametros_kardex(self.conn, material_id)
+        if params is None:
+            messagebox.showerror("Error", "Material no encontrado")
+            return
+        consulta = consulta_kardex() + " LIMIT :limite OFFSET :desplazamiento"
+        
+        ventana = ctk.CTkToplevel(self.root)
+        ventana.title(f"Kardex - {material_nombre}")
+        ventana.geometry("1000x600")
+        
+        ctk.CTkLabel(ventana, text=f"Kardex: {material_nombre}",
+                    font=ctk.CTkFont(size=18, weight="bold")).pack(pady=10)
+        ctk.CTkLabel(ventana, text=f"Saldo inicial: {params['saldo_inicial']:g}").pack()
+        
+        frame_tree = ctk.CTkFrame(ventana)
+        frame_tree.pack(fill="both", expand=True, padx=10, pady=10)
+        scroll_y = ctk.CTkScrollbar(frame_tree)
+        scroll_y.pack(side="right", fill="y")
+        
+        columnas = ("Fecha", "Tipo", "Entrada", "Salida", "Saldo", "Responsable", "Destino/Origen")
+        tree = ttk.Treeview(frame_tree, columns=columnas, show="headings",
+                            yscrollcommand=scroll_y.set)
+        scroll_y.configure(command=tree.yview)
+        for col in columnas:
+            tree.heading(col, text=col)
+            tree.column(col, width=150 if col in ("Fecha", "Responsable", "Destino/Origen") else 90,
+                        anchor="w" if col in ("Responsable", "Destino/Origen") else "center")
+        tree.pack(fill="both", expand=True)
+        
+        boton_mas = ctk.CTkButton(ventana, text="Cargar más")
+        
+        def cargar_pagina():
+            # Páginas en orden cronológico: el saldo sigue de una página a la siguiente
+            filas = self.conn.execute(consulta, {**params, 'limite': POR_PAGINA_KARDEX,
+                                                 'desplazamiento': len(tree.get_children())}).fetchall()
+            for _, fecha, tipo, entrada, salida, saldo, responsable, destino, _ in filas:
+                tree.insert("", "end", values=(fecha, tipo, f"{entrada:g}" if entrada else "",
+                                               f"{salida:g}" if salida else "", f"{saldo:g}",
+                                               responsable or "", destino or ""))
+            if len(filas) < POR_PAGINA_KARDEX:
+                boton_mas.configure(state="disabled")
+        
+        boton_mas.configure(command=cargar_pagina)
+        boton_mas.pack(pady=10)
+        cargar_pagina()
+        
     def ver_imagen_material(self):
         """Muestra la imagen del material seleccionado"""
         
@@ -1545,10 +1800,8 @@ class InventarioPTAR:
         frame_imagen.pack_propagate(False)
         
         try:
-            # Cargar y mostrar imagen
-            img = Image.open(ruta_completa)
-            img.thumbnail((530, 530), Image.Resampling.LANCZOS)
-            photo = ImageTk.PhotoImage(img)
+            # Cargar imagen (normalmente ya decodificada por la precarga)
+            photo = self.cache_imagenes.obtener(ruta_completa, TAMAÑO_VISOR_IMAGEN)
             
             label_img = ctk.CTkLabel(frame_imagen, image=photo, text="")
             label_img.image = photo  # Mantener referencia
@@ -1563,6 +1816,21 @@ class InventarioPTAR:
         ctk.CTkButton(ventana, text="Cerrar", command=ventana.destroy, 
                      width=150).pack(pady=10)
         
+    def precargar_imagen_seleccionada(self, event):
+        """Decodifica en segundo plano la imagen del material seleccionado"""
+        
+        seleccion = self.tree_inventario.selection()
+        if not seleccion:
+            return
+        
+        material_id = self.tree_inventario.item(seleccion[0])['values'][0]
+        self.cursor.execute("SELECT imagen_ruta FROM materiales WHERE id = ?", (material_id,))
+        resultado = self.cursor.fetchone()
+        
+        if resultado and resultado[0]:
+            ruta_completa = os.path.join(self.imagenes_dir, resultado[0])
+            self.cache_imagenes.precargar(ruta_completa, TAMAÑO_VISOR_IMAGEN)
+        
     def eliminar_material(self):
         """Elimina el material seleccionado"""
         
@@ -1583,35 +1851,24 @@ class InventarioPTAR:
             try:
                 self.cursor.execute("DELETE FROM materiales WHERE id = ?", (material_id,))
                 self.conn.commit()
+                self.catalogo.eliminar(material_id)
                 messagebox.showinfo("Éxito", "Material eliminado correctamente")
                 self.cargar_datos()
             except Exception as e:
                 messagebox.showerror("Error", f"Error al eliminar: {str(e)}")
 
-    def filtrar_materiales_entrada(self):
-        """Filtra los materiales en el tab de entrada"""
-        for item in self.tree_mat_entrada.get_children():
-            self.tree_mat_entrada.delete(item)
-
-        busqueda = self.entry_buscar_mat_entrada.get().lower()
-        categoria = self.combo_cat_entrada.get()
-
-        query = "SELECT id, codigo, nombre, categoria, cantidad_actual, unidad FROM materiales WHERE 1=1"
-        params = []
-
-        if busqueda:
-            query += " AND (LOWER(nombre) LIKE ? OR LOWER(codigo) LIKE ?)"
-            params.extend([f"%{busqueda}%", f"%{busqueda}%"])
+    def llenar_tabla_materiales(self, tree, entry_busqueda, combo_categoria):
+        """Llena una tabla de selección de materiales filtrando el catálogo en memoria"""
+        tree.delete(*tree.get_children())
 
-        if categoria != "Todas":
-            query += " AND categoria = ?"
-            params.append(categoria)
-
-        query += " ORDER BY nombre"
+        for row in self.catalogo.filtrar(entry_busqueda.get(), combo_categoria.get()):
+            tree.insert("", "end", values=row)
+        
+        self.aplicar_orden(tree)
 
-        self.cursor.execute(query, params)
-        for row in self.cursor.fetchall():
-            self.tree_mat_entrada.insert("", "end", values=row)
+    def filtrar_materiales_entrada(self):
+        """Filtra los materiales en el tab de entrada"""
+        self.llenar_tabla_materiales(self.tree_mat_entrada, self.entry_buscar_mat_entrada, self.combo_cat_entrada)
 
     def seleccionar_material_entrada(self, event):
         """Maneja la selección de un material en entrada"""
@@ -1647,12 +1904,9 @@ class InventarioPTAR:
             observaciones = self.text_obs_entrada.get("1.0", "end-1c")
 
             material_id = self.material_seleccionado_entrada['id']
-            cantidad_actual = self.material_seleccionado_entrada['stock']
-            nueva_cantidad = cantidad_actual + cantidad
             
             # Actualizar cantidad
-            self.cursor.execute("UPDATE materiales SET cantidad_actual = ? WHERE id = ?",
-                              (nueva_cantidad, material_id))
+            nueva_cantidad = self.ajustar_stock(material_id, cantidad)
             
             # Registrar movimiento
             fecha_actual = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
@@ -1663,6 +1917,7 @@ class InventarioPTAR:
             ''', (material_id, 'ENTRADA', cantidad, fecha_actual, responsable, origen, observaciones))
             
             self.conn.commit()
+            self.catalogo.actualizar_stock(material_id, nueva_cantidad)
             
             messagebox.showinfo("Éxito", f"Entrada registrada correctamente\n"
                               f"Nueva cantidad: {nueva_cantidad:.2f}")
@@ -1687,28 +1942,7 @@ class InventarioPTAR:
         
     def filtrar_materiales_salida(self):
         """Filtra los materiales en el tab de salida"""
-        for item in self.tree_mat_salida.get_children():
-            self.tree_mat_salida.delete(item)
-
-        busqueda = self.entry_buscar_mat_salida.get().lower()
-        categoria = self.combo_cat_salida.get()
-
-        query = "SELECT id, codigo, nombre, categoria, cantidad_actual, unidad FROM materiales WHERE 1=1"
-        params = []
-
-        if busqueda:
-            query += " AND (LOWER(nombre) LIKE ? OR LOWER(codigo) LIKE ?)"
-            params.extend([f"%{busqueda}%", f"%{busqueda}%"])
-
-        if categoria != "Todas":
-            query += " AND categoria = ?"
-            params.append(categoria)
-
-        query += " ORDER BY nombre"
-
-        self.cursor.execute(query, params)
-        for row in self.cursor.fetchall():
-            self.tree_mat_salida.insert("", "end", values=row)
+        self.llenar_tabla_materiales(self.tree_mat_salida, self.entry_buscar_mat_salida, self.combo_cat_salida)
 
     def seleccionar_material_salida(self, event):
         """Maneja la selección de un material en salida"""
@@ -1744,7 +1978,7 @@ class InventarioPTAR:
             observaciones = self.text_obs_salida.get("1.0", "end-1c")
 
             material_id = self.material_seleccionado_salida['id']
-            cantidad_actual = self.material_seleccionado_salida['stock']
+            cantidad_actual = self.stock_guardado(material_id)
 
             if cantidad > cantidad_actual:
                 messagebox.showerror("Error", 
@@ -1753,11 +1987,8 @@ class InventarioPTAR:
                                    f"Solicitado: {cantidad:.2f}")
                 return
             
-            nueva_cantidad = cantidad_actual - cantidad
-            
             # Actualizar cantidad
-            self.cursor.execute("UPDATE materiales SET cantidad_actual = ? WHERE id = ?",
-                              (nueva_cantidad, material_id))
+            nueva_cantidad = self.ajustar_stock(material_id, -cantidad)
             
             # Registrar movimiento
             fecha_actual = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
@@ -1768,6 +1999,7 @@ class InventarioPTAR:
             ''', (material_id, 'SALIDA', cantidad, fecha_actual, responsable, destino, observaciones))
             
             self.conn.commit()
+            self.catalogo.actualizar_stock(material_id, nueva_cantidad)
             
             messagebox.showinfo("Éxito", f"Salida registrada correctamente\n"
                               f"Nueva cantidad: {nueva_cantidad:.2f}")
@@ -1798,13 +2030,11 @@ class InventarioPTAR:
             self.label_stock_actual_entrada.configure(text="")
             return
         
-        self.cursor.execute("SELECT cantidad_actual FROM materiales WHERE nombre = ?", 
-                          (material_nombre,))
-        resultado = self.cursor.fetchone()
+        resultado = self.catalogo.por_nombre(material_nombre)
         
         if resultado:
             self.label_stock_actual_entrada.configure(
-                text=f"(Stock actual: {resultado[0]:.2f})",
+                text=f"(Stock actual: {resultado[4]:.2f})",
                 text_color="#666666"
             )
         else:
@@ -1819,13 +2049,11 @@ class InventarioPTAR:
             self.label_cantidad_disponible.configure(text="0.00", text_color="#1f4788")
             return
         
-        # Buscar el material en la base de datos
-        self.cursor.execute("SELECT cantidad_actual FROM materiales WHERE nombre = ?", 
-                          (material_nombre,))
-        resultado = self.cursor.fetchone()
+        # Buscar el material en el catálogo
+        resultado = self.catalogo.por_nombre(material_nombre)
         
         if resultado:
-            cantidad = resultado[0]
+            cantidad = resultado[4]
             # Cambiar color según cantidad
             if cantidad > 0:
                 color = "#2fa72f"  # Verde
@@ -1834,14 +2062,8 @@ class InventarioPTAR:
             self.label_cantidad_disponible.configure(text=f"{cantidad:.2f}", text_color=color)
         else:
             # Material no encontrado - buscar coincidencias parciales
-            self.cursor.execute("""
-                SELECT nombre, cantidad_actual FROM materiales 
-                WHERE nombre LIKE ? 
-                ORDER BY nombre 
-                LIMIT 1
-            """, (f"%{material_nombre}%",))
-            
-            resultado_parcial = self.cursor.fetchone()
+            coincidencias = self.catalogo.filtrar(material_nombre)
+            resultado_parcial = (coincidencias[0][2], coincidencias[0][4]) if coincidencias else None
             if resultado_parcial:
                 messagebox.showinfo("Sugerencia", 
                                   f"No se encontró '{material_nombre}'\n\n"
@@ -1863,28 +2085,7 @@ class InventarioPTAR:
         
     def filtrar_materiales_prestamo(self):
         """Filtra los materiales en el tab de préstamos"""
-        for item in self.tree_mat_prestamo.get_children():
-            self.tree_mat_prestamo.delete(item)
-
-        busqueda = self.entry_buscar_mat_prestamo.get().lower()
-        categoria = self.combo_cat_prestamo.get()
-
-        query = "SELECT id, codigo, nombre, categoria, cantidad_actual, unidad FROM materiales WHERE 1=1"
-        params = []
-
-        if busqueda:
-            query += " AND (LOWER(nombre) LIKE ? OR LOWER(codigo) LIKE ?)"
-            params.extend([f"%{busqueda}%", f"%{busqueda}%"])
-
-        if categoria != "Todas":
-            query += " AND categoria = ?"
-            params.append(categoria)
-
-        query += " ORDER BY nombre"
-
-        self.cursor.execute(query, params)
-        for row in self.cursor.fetchall():
-            self.tree_mat_prestamo.insert("", "end", values=row)
+        self.llenar_tabla_materiales(self.tree_mat_prestamo, self.entry_buscar_mat_prestamo, self.combo_cat_prestamo)
 
     def seleccionar_material_prestamo(self, event):
         """Maneja la selección de un material en préstamos"""
@@ -1920,16 +2121,14 @@ class InventarioPTAR:
                 return
 
             material_id = self.material_seleccionado_prestamo['id']
-            cantidad_actual = self.material_seleccionado_prestamo['stock']
+            cantidad_actual = self.stock_guardado(material_id)
 
             if cantidad > cantidad_actual:
                 messagebox.showerror("Error", "No hay suficiente stock disponible")
                 return
 
             # Reducir stock
-            nueva_cantidad = cantidad_actual - cantidad
-            self.cursor.execute("UPDATE materiales SET cantidad_actual = ? WHERE id = ?",
-                              (nueva_cantidad, material_id))
+            nueva_cantidad = self.ajustar_stock(material_id, -cantidad)
             
             # Registrar préstamo
             fecha_actual = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
@@ -1947,6 +2146,7 @@ class InventarioPTAR:
             ''', (material_id, 'PRÉSTAMO', cantidad, fecha_actual, prestado_a, area, observaciones))
             
             self.conn.commit()
+            self.catalogo.actualizar_stock(material_id, nueva_cantidad)
             
             messagebox.showinfo("Éxito", "Préstamo registrado correctamente")
 
@@ -2001,6 +2201,8 @@ class InventarioPTAR:
         for row in self.cursor.fetchall():
             self.tree_prestamos.insert("", "end", values=row)
         
+        self.aplicar_orden(self.tree_prestamos)
+        
     def registrar_devolucion(self):
         """Registra la devolución de un préstamo"""
         
@@ -2021,15 +2223,14 @@ class InventarioPTAR:
         
         if respuesta:
             try:
-                # Obtener material_id
-                self.cursor.execute("SELECT id, cantidad_actual FROM materiales WHERE nombre = ?",
-                                  (material_nombre,))
-                material_id, cantidad_actual = self.cursor.fetchone()
+                # Obtener material_id del propio préstamo (el nombre no es único)
+                self.cursor.execute("SELECT material_id FROM prestamos WHERE id = ?",
+                                  (prestamo_id,))
+                material_id = self.cursor.fetchone()[0]
                 
                 # Actualizar stock
-                nueva_cantidad = cantidad_actual + cantidad
-                self.cursor.execute("UPDATE materiales SET cantidad_actual = ? WHERE id = ?",
-                                  (nueva_cantidad, material_id))
+                self.cursor.execute("UPDATE materiales SET cantidad_actual = cantidad_actual + ? WHERE id = ?",
+                                  (cantidad, material_id))
                 
                 # Actualizar préstamo
                 fecha_actual = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
@@ -2048,6 +2249,7 @@ class InventarioPTAR:
                      'Sistema', 'Devolución de préstamo', f'Préstamo ID: {prestamo_id}'))
                 
                 self.conn.commit()
+                self.catalogo.refrescar(material_id)
                 
                 messagebox.showinfo("Éxito", "Devolución registrada correctamente")
                 self.cargar_datos()
@@ -2058,28 +2260,7 @@ class InventarioPTAR:
         
     def filtrar_materiales_uso(self):
         """Filtra los materiales en el tab de material en uso"""
-        for item in self.tree_mat_uso.get_children():
-            self.tree_mat_uso.delete(item)
-
-        busqueda = self.entry_buscar_mat_uso.get().lower()
-        categoria = self.combo_cat_uso.get()
-
-        query = "SELECT id, codigo, nombre, categoria, cantidad_actual, unidad FROM materiales WHERE 1=1"
-        params = []
-
-        if busqueda:
-            query += " AND (LOWER(nombre) LIKE ? OR LOWER(codigo) LIKE ?)"
-            params.extend([f"%{busqueda}%", f"%{busqueda}%"])
-
-        if categoria != "Todas":
-            query += " AND categoria = ?"
-            params.append(categoria)
-
-        query += " ORDER BY nombre"
-
-        self.cursor.execute(query, params)
-        for row in self.cursor.fetchall():
-            self.tree_mat_uso.insert("", "end", values=row)
+        self.llenar_tabla_materiales(self.tree_mat_uso, self.entry_buscar_mat_uso, self.combo_cat_uso)
 
     def seleccionar_material_uso(self, event):
         """Maneja la selección de un material en uso"""
@@ -2115,16 +2296,14 @@ class InventarioPTAR:
                 return
 
             material_id = self.material_seleccionado_uso['id']
-            cantidad_actual = self.material_seleccionado_uso['stock']
+            cantidad_actual = self.stock_guardado(material_id)
 
             if cantidad > cantidad_actual:
                 messagebox.showerror("Error", "No hay suficiente stock disponible")
                 return
 
             # Reducir stock
-            nueva_cantidad = cantidad_actual - cantidad
-            self.cursor.execute("UPDATE materiales SET cantidad_actual = ? WHERE id = ?",
-                              (nueva_cantidad, material_id))
+            nueva_cantidad = self.ajustar_stock(material_id, -cantidad)
             
             # Registrar material en uso
             fecha_actual = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
@@ -2142,6 +2321,7 @@ class InventarioPTAR:
             ''', (material_id, 'EN USO', cantidad, fecha_actual, responsable, equipo, observaciones))
             
             self.conn.commit()
+            self.catalogo.actualizar_stock(material_id, nueva_cantidad)
             
             messagebox.showinfo("Éxito", "Material en uso registrado correctamente")
 
@@ -2190,6 +2370,8 @@ class InventarioPTAR:
         for row in self.cursor.fetchall():
             self.tree_en_uso.insert("", "end", values=row)
         
+        self.aplicar_orden(self.tree_en_uso)
+        
     def dar_baja_material_uso(self):
         """Da de baja material en uso"""
         
@@ -2236,7 +2418,7 @@ class InventarioPTAR:
             search_term = f"%{self.busqueda_entrada_var.get()}%"
             params.extend([search_term, search_term, search_term])
 
-        query += " ORDER BY m.fecha DESC LIMIT 50"
+        query += f" ORDER BY {self.orden_sql(self.tree_entradas, 'm.fecha DESC')} LIMIT 50"
 
         self.cursor.execute(query, params)
         for row in self.cursor.fetchall():
@@ -2262,7 +2444,7 @@ class InventarioPTAR:
             search_term = f"%{self.busqueda_salida_var.get()}%"
             params.extend([search_term, search_term, search_term])
 
-        query += " ORDER BY m.fecha DESC LIMIT 50"
+        query += f" ORDER BY {self.orden_sql(self.tree_salidas, 'm.fecha DESC')} LIMIT 50"
 
         self.cursor.execute(query, params)
         for row in self.cursor.fetchall():
@@ -2272,84 +2454,175 @@ class InventarioPTAR:
         """Carga el historial de movimientos recientes"""
         self.cargar_historial_entradas()
         self.cargar_historial_salidas()
+
+    def revisar_cambios_externos(self):
+        """Revisa periódicamente si otro proceso modificó la base de datos"""
+        try:
+            cambios = self.vigilante.revisar()
+            if cambios:
+                self.aplicar_cambios_externos(cambios)
+        except sqlite3.Error:
+            pass  # Base de datos ocupada: se reintenta en la próxima revisión
+        finally:
+            self.root.after(INTERVALO_REVISION_CAMBIOS_MS, self.revisar_cambios_externos)
+
+    def actualizar_catalogos(self):
+        """Vuelve a leer los catálogos si hay valores nuevos y actualiza los combos de categoría"""
+        if not self.catalogos.actualizar(self.conn):
+            return
+        categorias = ["Todas"] + self.catalogos.nombres("categorias")
+        for combo in (self.combo_categoria, self.combo_cat_entrada, self.combo_cat_salida,
+                      self.combo_cat_prestamo, self.combo_cat_uso):
+            combo.configure(values=categorias)
+
+    def aplicar_cambios_externos(self, cambios):
+        """Refresca solo las tablas y registros que cambiaron en otro proceso"""
+        
+        ids_materiales = cambios.get('materiales')
+        if ids_materiales:
+            for material_id in ids_materiales:
+                self.catalogo.refrescar(material_id)
+            self.actualizar_catalogos()
+            self.actualizar_filas_inventario(ids_materiales)
+            self.filtrar_materiales_entrada()
+            self.filtrar_materiales_salida()
+            self.filtrar_materiales_prestamo()
+            self.filtrar_materiales_uso()
+        
+        if 'movimientos' in cambios:
+            self.cargar_historial_movimientos()
+        
+        if 'prestamos' in cambios:
+            self.cargar_prestamos()
+        
+        if 'material_en_uso' in cambios:
+            self.cargar_material_en_uso()
         
     def exportar_reporte(self, tipo):
-        """Exporta reportes a Excel"""
+        """Exporta reportes a Excel en segundo plano"""
         
-        try:
-            if tipo == "inventario":
-                self.cursor.execute("SELECT * FROM materiales")
-                df = pd.DataFrame(self.cursor.fetchall(), 
-                                columns=['ID', 'Código', 'Nombre', 'Descripción', 'Categoría',
-                                        'Unidad', 'Cantidad', 'Stock Mín', 'Ubicación', 
-                                        'Costo Unit', 'Fecha Registro', 'Notas'])
-                filename = f"Inventario_PTAR_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-                
-            elif tipo == "stock_bajo":
-                self.cursor.execute('''
-                    SELECT codigo, nombre, categoria, cantidad_actual, stock_minimo, ubicacion
-                    FROM materiales 
-                    WHERE cantidad_actual <= stock_minimo
-                    ORDER BY cantidad_actual ASC
-                ''')
-                df = pd.DataFrame(self.cursor.fetchall(),
-                                columns=['Código', 'Nombre', 'Categoría', 'Cantidad', 
-                                        'Stock Mín', 'Ubicación'])
-                filename = f"Stock_Bajo_PTAR_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-                
-            elif tipo == "movimientos":
-                self.cursor.execute('''
-                    SELECT m.fecha, mat.nombre, m.tipo_movimiento, m.cantidad, 
-                           m.responsable, m.destino_origen, m.observaciones
-                    FROM movimientos m
-                    JOIN materiales mat ON m.material_id = mat.id
-                    WHERE m.fecha >= date('now', '-30 days')
-                    ORDER BY m.fecha DESC
-                ''')
-                df = pd.DataFrame(self.cursor.fetchall(),
-                                columns=['Fecha', 'Material', 'Tipo', 'Cantidad',
-                                        'Responsable', 'Destino/Origen', 'Observaciones'])
-                filename = f"Movimientos_PTAR_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-                
-            elif tipo == "prestamos":
-                self.cursor.execute('''
-                    SELECT p.fecha_prestamo, m.nombre, p.cantidad, p.prestado_a,
-                           p.area_destino, p.estado, p.fecha_devolucion
-                    FROM prestamos p
-                    JOIN materiales m ON p.material_id = m.id
-                    ORDER BY p.fecha_prestamo DESC
-                ''')
-                df = pd.DataFrame(self.cursor.fetchall(),
-                                columns=['Fecha Préstamo', 'Material', 'Cantidad', 'Prestado a',
-                                        'Área', 'Estado', 'Fecha Devolución'])
-                filename = f"Prestamos_PTAR_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-                
-            elif tipo == "en_uso":
-                self.cursor.execute('''
-                    SELECT u.fecha_instalacion, m.nombre, u.cantidad, u.equipo_instalacion,
-                           u.responsable, u.observaciones
-                    FROM material_en_uso u
-                    JOIN materiales m ON u.material_id = m.id
-                    ORDER BY u.fecha_instalacion DESC
-                ''')
-                df = pd.DataFrame(self.cursor.fetchall(),
-                                columns=['Fecha Instalación', 'Material', 'Cantidad', 
-                                        'Equipo/Instalación', 'Responsable', 'Observaciones'])
-                filename = f"Material_En_Uso_PTAR_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
+        if self.exportacion and self.exportacion.activa():
+            messagebox.showwarning("Advertencia", "Ya hay una exportación en curso")
+            return
+        
+        fecha = datetime.now().strftime('%Y%m%d_%H%M%S')
+        params = ()
+        
+        if tipo == "inventario":
+            query = '''
+                SELECT id, codigo, nombre, descripcion, categoria, unidad, cantidad_actual,
+                       stock_minimo, ubicacion, costo_unitario, fecha_registro, notas
+                FROM materiales
+            '''
+            columnas = ['ID', 'Código', 'Nombre', 'Descripción', 'Categoría',
+                        'Unidad', 'Cantidad', 'Stock Mín', 'Ubicación', 
+                        'Costo Unit', 'Fecha Registro', 'Notas']
+            filename = f"Inventario_PTAR_{fecha}.xlsx"
             
-            # Guardar archivo
-            filepath = filedialog.asksaveasfilename(
-                defaultextension=".xlsx",
-                filetypes=[("Excel files", "*.xlsx")],
-                initialfile=filename
-            )
+        elif tipo == "stock_bajo":
+            query = '''
+                SELECT codigo, nombre, categoria, cantidad_actual, stock_minimo, ubicacion
+                FROM materiales 
+                WHERE cantidad_actual <= stock_minimo
+                ORDER BY cantidad_actual ASC
+            '''
+            columnas = ['Código', 'Nombre', 'Categoría', 'Cantidad', 
+                        'Stock Mín', 'Ubicación']
+            filename = f"Stock_Bajo_PTAR_{fecha}.xlsx"
             
-            if filepath:
-                df.to_excel(filepath, index=False, sheet_name='Reporte')
-                messagebox.showinfo("Éxito", f"Reporte exportado:\n{filepath}")
-                
-        except Exception as e:
-            messagebox.showerror("Error", f"Error al exportar: {str(e)}")
+        elif tipo == "movimientos":
+            query = '''
+                SELECT m.fecha, mat.nombre, m.tipo_movimiento, m.cantidad, 
+                       m.responsable, m.destino_origen, m.observaciones
+                FROM movimientos m
+                JOIN materiales mat ON m.material_id = mat.id
+                WHERE m.fecha >= ?
+                ORDER BY m.fecha DESC
+            '''
+            # Hora local, como se guardan las fechas (date('now') está en UTC)
+            params = ((datetime.now() - timedelta(days=30)).strftime(FORMATO_FECHA),)
+            columnas = ['Fecha', 'Material', 'Tipo', 'Cantidad',
+                        'Responsable', 'Destino/Origen', 'Observaciones']
+            filename = f"Movimientos_PTAR_{fecha}.xlsx"
+            
+        elif tipo == "prestamos":
+            query = '''
+                SELECT p.fecha_prestamo, m.nombre, p.cantidad, p.prestado_a,
+                       p.area_destino, p.estado, p.fecha_devolucion
+                FROM prestamos p
+                JOIN materiales m ON p.material_id = m.id
+                ORDER BY p.fecha_prestamo DESC
+            '''
+            columnas = ['Fecha Préstamo', 'Material', 'Cantidad', 'Prestado a',
+                        'Área', 'Estado', 'Fecha Devolución']
+            filename = f"Prestamos_PTAR_{fecha}.xlsx"
+            
+        elif tipo == "en_uso":
+            query = '''
+                SELECT u.fecha_instalacion, m.nombre, u.cantidad, u.equipo_instalacion,
+                       u.responsable, u.observaciones
+                FROM material_en_uso u
+                JOIN materiales m ON u.material_id = m.id
+                ORDER BY u.fecha_instalacion DESC
+            '''
+            columnas = ['Fecha Instalación', 'Material', 'Cantidad', 
+                        'Equipo/Instalación', 'Responsable', 'Observaciones']
+            filename = f"Material_En_Uso_PTAR_{fecha}.xlsx"
+        
+        else:
+            return
+        
+        # Elegir archivo antes de consultar
+        filepath = filedialog.asksaveasfilename(
+            defaultextension=".xlsx",
+            filetypes=[("Excel files", "*.xlsx")],
+            initialfile=filename
+        )
+        
+        if not filepath:
+            return
+        
+        self.exportacion = ExportacionEnSegundoPlano(DB_PATH, query, params, columnas, filepath)
+        
+        self.progress_exportacion.set(0)
+        self.label_exportacion.configure(text="Exportando...")
+        self.frame_exportacion.pack(pady=10)
+        
+        self.exportacion.iniciar()
+        self.root.after(100, self.revisar_exportacion)
+        
+    def revisar_exportacion(self):
+        """Actualiza la barra de progreso con los mensajes del hilo de exportación"""
+        
+        exportacion = self.exportacion
+        while True:
+            try:
+                mensaje = exportacion.cola.get_nowait()
+            except queue.Empty:
+                break
+            
+            if mensaje[0] == 'progreso':
+                _, escritas, total = mensaje
+                self.progress_exportacion.set(escritas / total if total else 1)
+                self.label_exportacion.configure(text=f"Exportando... {escritas:,} de {total:,} registros")
+                continue
+            
+            self.frame_exportacion.pack_forget()
+            if mensaje[0] == 'fin':
+                messagebox.showinfo("Éxito", f"Reporte exportado:\n{exportacion.filepath}")
+            elif mensaje[0] == 'cancelado':
+                messagebox.showinfo("Cancelado", "La exportación fue cancelada")
+            else:
+                messagebox.showerror("Error", f"Error al exportar: {mensaje[1]}")
+            return
+        
+        self.root.after(100, self.revisar_exportacion)
+        
+    def cancelar_exportacion(self):
+        """Cancela la exportación en curso"""
+        if self.exportacion and self.exportacion.activa():
+            self.label_exportacion.configure(text="Cancelando...")
+            self.exportacion.cancelar()
         
     def actualizar_estadisticas(self):
         """Actualiza las estadísticas del sistema"""
@@ -2359,11 +2632,11 @@ class InventarioPTAR:
         total_materiales = self.cursor.fetchone()[0]
         
         # Materiales con stock bajo
-        self.cursor.execute("SELECT COUNT(*) FROM materiales WHERE cantidad_actual <= stock_minimo")
+        self.cursor.execute("SELECT COUNT(*) FROM materiales WHERE cantidad_actual <= stock_minimo AND cantidad_actual > 0")
         stock_bajo = self.cursor.fetchone()[0]
         
         # Sin stock
-        self.cursor.execute("SELECT COUNT(*) FROM materiales WHERE cantidad_actual = 0")
+        self.cursor.execute("SELECT COUNT(*) FROM materiales WHERE cantidad_actual <= 0")
         sin_stock = self.cursor.fetchone()[0]
         
         # Préstamos activos
@@ -2377,8 +2650,8 @@ class InventarioPTAR:
         # Movimientos del mes
         self.cursor.execute("""
             SELECT COUNT(*) FROM movimientos 
-            WHERE fecha >= date('now', 'start of month')
-        """)
+            WHERE fecha >= ? AND fecha < ?
+        """, rango_de_mes(datetime.now()))
         movimientos_mes = self.cursor.fetchone()[0]
         
         # Valor total del inventario
@@ -2406,10 +2679,62 @@ Materiales Sin Stock: {sin_stock}
         
         self.label_stats.configure(text=texto_stats)
         
-    def ordenar_columna(self, col):
-        """Ordena el treeview por la columna seleccionada"""
-        # Implementación básica de ordenamiento
-        pass
+    def configurar_ordenamiento(self, tree, recargar_paginado=None):
+        """Hace que los encabezados del Treeview ordenen por su columna al hacer clic
+
+        Si la tabla muestra solo una página de la consulta (LIMIT), se indica la
+        función que la recarga para ordenar con ORDER BY en lugar de en memoria.
+        """
+        for col in tree["columns"]:
+            tree.heading(col, command=lambda c=col, t=tree: self.ordenar_columna(c, t))
+        if recargar_paginado:
+            self.historiales_paginados[str(tree)] = recargar_paginado
+        
+    def ordenar_columna(self, col, tree=None):
+        """Ordena el treeview por la columna seleccionada (un segundo clic invierte el orden)"""
+        
+        tree = tree or self.tree_inventario
+        anterior = self.orden_columnas.get(str(tree))
+        descendente = anterior == (col, False)
+        self.orden_columnas[str(tree)] = (col, descendente)
+        
+        # Indicador en el encabezado
+        for c in tree["columns"]:
+            flecha = (" ▼" if descendente else " ▲") if c == col else ""
+            tree.heading(c, text=f"{c}{flecha}")
+        
+        if str(tree) in self.historiales_paginados:
+            self.historiales_paginados[str(tree)]()
+        elif anterior and anterior[0] == col:
+            # Misma columna: basta invertir el orden actual
+            for i, iid in enumerate(reversed(tree.get_children())):
+                tree.move(iid, "", i)
+        else:
+            self.aplicar_orden(tree)
+    
+    def aplicar_orden(self, tree):
+        """Reordena en memoria las filas cargadas según la columna elegida"""
+        
+        orden = self.orden_columnas.get(str(tree))
+        if not orden:
+            return
+        
+        col, descendente = orden
+        clave = CLAVES_ORDEN_COLUMNA.get(col, clave_orden_texto)
+        hijos = sorted(tree.get_children(), key=lambda iid: clave(tree.set(iid, col)),
+                       reverse=descendente)
+        for i, iid in enumerate(hijos):
+            tree.move(iid, "", i)
+    
+    def orden_sql(self, tree, por_defecto):
+        """Cláusula ORDER BY para un historial paginado según la columna elegida"""
+        
+        orden = self.orden_columnas.get(str(tree))
+        if not orden or orden[0] not in COLUMNAS_SQL_HISTORIAL:
+            return por_defecto
+        
+        col, descendente = orden
+        return f"{COLUMNAS_SQL_HISTORIAL[col]} {'DESC' if descendente else 'ASC'}, m.id DESC"
     
     def __del__(self):
         """Cierra la conexión a la base de datos"""
@@ -2419,4 +2744,6 @@ Materiales Sin Stock: {sin_stock}
 if __name__ == "__main__":
     root = ctk.CTk()
     app = InventarioPTAR(root)
+    if precarga_solicitada():
+        precargar_dependencias(con_pandas=False)
     root.mainloop()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Kardex de un material: sus movimientos en orden con el saldo después de cada uno
+
+El saldo se calcula en SQLite con una función de ventana sobre los movimientos
+del material, que se leen en orden por idx_movimientos_material_fecha sin
+ordenar la tabla. El saldo inicial es el stock justo antes del rango (con las
+instantáneas mensuales, ver instantaneas_stock.py), así que una página o un
+rango de fechas no necesita recorrer toda la historia.
+"""
+from instantaneas_stock import DELTA_SQL, consulta_stock_en_fecha
+
+COLUMNAS_KARDEX = ('id', 'fecha', 'tipo_movimiento', 'entrada', 'salida', 'saldo',
+                   'responsable', 'destino_origen', 'observaciones')
+
+POR_PAGINA_KARDEX = 100
+MAX_POR_PAGINA_KARDEX = 1000
+
+
+def saldo_inicial(conn, material_id, desde=None, tabla='movimientos'):
+    """Stock del material justo antes de `desde` (antes de su primer movimiento si no hay desde)"""
+    if desde:
+        consulta, params = consulta_stock_en_fecha(conn, desde, material_id, tabla)
+        fila = conn.execute(consulta, params).fetchone()
+        if fila is not None:
+            return fila[4]
+
+    # Sin rango, o el material se registró después de `desde`: se descuenta toda su historia
+    fila = conn.execute(f'''
+        SELECT COALESCE(m.cantidad_actual, 0) - COALESCE((
+            SELECT SUM({DELTA_SQL}) FROM {tabla} WHERE material_id = m.id), 0)
+        FROM materiales m WHERE m.id = ?
+    ''', (material_id,)).fetchone()
+    return fila[0] if fila else None
+
+
+def consulta_kardex(desde=None, hasta=None, tabla='movimientos'):
+    """Consulta con parámetros :material_id y :saldo_inicial (más :desde y :hasta si se usan)
+
+    Devuelve las columnas de COLUMNAS_KARDEX en orden cronológico.
+    """
+    rango = ''
+    if desde:
+        rango += ' AND fecha >= :desde'
+    if hasta:
+        rango += ' AND fecha < :hasta'
+
+    return f'''
+        WITH k AS (
+            SELECT id, fecha, tipo_movimiento, {DELTA_SQL} AS delta,
+                   responsable, destino_origen, observaciones
+            FROM {tabla}
+            WHERE material_id = :material_id {rango}
+        )
+        SELECT id, fecha, tipo_movimiento,
+               CASE WHEN delta > 0 THEN delta ELSE 0 END AS entrada,
+               CASE WHEN delta < 0 THEN -delta ELSE 0 END AS salida,
+               :saldo_inicial + SUM(delta) OVER (ORDER BY fecha, id ROWS UNBOUNDED PRECEDING) AS saldo,
+               responsable, destino_origen, observaciones
+        FROM k
+        ORDER BY fecha, id
+    '''
+
+
+def parametros_kardex(conn, material_id, desde=None, hasta=None, tabla='movimientos'):
+    """Parámetros de consulta_kardex(), o None si el material no existe"""
+    inicial = saldo_inicial(conn, material_id, desde, tabla)
+    if inicial is None:
+        return None
+    return {'material_id': material_id, 'saldo_inicial': inicial, 'desde': desde, 'hasta': hasta}
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Proveedor JSON de Flask basado en orjson
+
+jsonify() y request.get_json() usan orjson si está instalado; si no, o si un
+valor no se puede serializar con orjson (por ejemplo un entero de más de 64
+bits), se usa el módulo json estándar como hasta ahora. Las listas de tuplas
+que devuelve consultar_filas() se serializan directamente, sin convertirlas.
+"""
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # orjson es opcional: sin él se usa json estándar
+    orjson = None
+
+
+class ProveedorJSONRapido(DefaultJSONProvider):
+    """DefaultJSONProvider que serializa con orjson cuando es posible"""
+
+    def _opciones(self, indentar=False):
+        # Las fechas pasan a default() para conservar el formato de Flask
+        opciones = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if self.sort_keys:
+            opciones |= orjson.OPT_SORT_KEYS
+        if indentar:
+            opciones |= orjson.OPT_INDENT_2
+        return opciones
+
+    def _serializar(self, obj, indentar=False):
+        """bytes con el JSON de obj, o None si orjson no puede serializarlo"""
+        if orjson is None:
+            return None
+        try:
+            return orjson.dumps(obj, default=self.default, option=self._opciones(indentar))
+        except orjson.JSONEncodeError:
+            return None
+
+    def dumps(self, obj, **kwargs):
+        if not kwargs:
+            datos = self._serializar(obj)
+            if datos is not None:
+                return datos.decode('utf-8')
+        return super().dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        if orjson is not None and not kwargs:
+            return orjson.loads(s)
+        return super().loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indentar = (self.compact is None and self._app.debug) or self.compact is False
+        datos = self._serializar(obj, indentar)
+        if datos is None:
+            return super().response(obj)
+        return self._app.response_class(datos + b'\n', mimetype=self.mimetype)
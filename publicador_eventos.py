@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Publicador de eventos en proceso para el flujo Server-Sent Events (/api/eventos)
+
+Las rutas de escritura publican un evento después de confirmar la transacción
+y cada navegador conectado tiene una cola propia; no hay sondeo por cliente.
+PuenteCambios publica además todo lo que se confirma en la base de datos,
+también lo que escriben los demás procesos. ColaAsincrona permite que una
+corrutina (api_asincrona.py) espere los eventos sin ocupar un hilo.
+
+El id de cada evento del puente es el `seq` del registro de cambios, que
+comparten todos los procesos: un navegador que se reconecta a otro worker de
+gunicorn recibe lo que perdió con eventos_perdidos(), leído de la base de
+datos. Los eventos que publican las rutas van sin id (el navegador conserva el
+último que recibió) porque el puente los vuelve a enviar con su seq.
+"""
+import asyncio
+import json
+import queue
+import sqlite3
+import threading
+
+from vigilante_cambios import VigilanteCambios, historial_disponible, registros_cambiados_desde, ultimo_seq
+
+# Eventos pendientes por cliente antes de desconectarlo por lento
+MAX_PENDIENTES_CLIENTE = 500
+# Con más registros perdidos que estos, se pide al navegador recargar todo
+MAX_EVENTOS_REENVIO = 256
+
+# Tabla vigilada -> (consulta de las filas cambiadas, tipo de evento)
+CONSULTAS_PUENTE = {
+    'materiales': ('SELECT id, cantidad_actual, stock_minimo FROM materiales WHERE id IN ({})', 'stock'),
+    'movimientos': ('SELECT id, material_id, tipo_movimiento, cantidad FROM movimientos WHERE id IN ({})',
+                    'movimiento'),
+    'prestamos': ('SELECT id, material_id, estado FROM prestamos WHERE id IN ({})', 'prestamo'),
+    'material_en_uso': ('SELECT id, material_id FROM material_en_uso WHERE id IN ({})', 'material_en_uso'),
+}
+
+
+class PublicadorEventos:
+    """Reparte cada evento publicado a todas las colas suscritas"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._suscriptores = set()
+
+    def suscribir(self, cola=None):
+        """Crea la cola de un cliente
+
+        `cola` permite pasar una cola ya creada (por ejemplo una ColaAsincrona).
+        Los eventos anteriores a la conexión se leen con eventos_perdidos().
+        """
+        if cola is None:
+            cola = queue.Queue(maxsize=MAX_PENDIENTES_CLIENTE)
+        with self._lock:
+            self._suscriptores.add(cola)
+        return cola
+
+    def desuscribir(self, cola):
+        """Quita la cola de un cliente desconectado"""
+        with self._lock:
+            self._suscriptores.discard(cola)
+
+    def publicar(self, tipo, datos, evento_id=None):
+        """Envía un evento a todos los clientes conectados
+
+        evento_id es el seq del registro de cambios (solo desde PuenteCambios).
+        """
+        with self._lock:
+            evento = (evento_id, tipo, datos)
+            for cola in list(self._suscriptores):
+                try:
+                    cola.put_nowait(evento)
+                except queue.Full:
+                    # Cliente que no consume: se le cierra el flujo y el navegador se reconecta
+                    self._suscriptores.discard(cola)
+                    vaciar(cola)
+                    cola.put_nowait(None)
+
+    def clientes(self):
+        """Número de clientes conectados"""
+        return len(self._suscriptores)
+
+
+def vaciar(cola):
+    """Descarta los eventos pendientes con get_nowait(), que toma el candado de la cola
+
+    El cliente puede estar leyendo la misma cola desde su hilo al mismo tiempo.
+    """
+    while True:
+        try:
+            cola.get_nowait()
+        except queue.Empty:
+            return
+
+
+class ColaAsincrona(queue.Queue):
+    """queue.Queue que además avisa a un bucle asyncio cada vez que recibe un evento
+
+    El publicador la llena desde cualquier hilo; la corrutina del cliente espera
+    `aviso` y luego vacía la cola con get_nowait().
+    """
+
+    def __init__(self, loop, maxsize=MAX_PENDIENTES_CLIENTE):
+        super().__init__(maxsize)
+        self._loop = loop
+        self.aviso = asyncio.Event()
+
+    def _put(self, item):
+        super()._put(item)
+        try:
+            self._loop.call_soon_threadsafe(self.aviso.set)
+        except RuntimeError:
+            # Bucle ya cerrado: el servidor se está deteniendo
+            pass
+
+    def vaciar(self):
+        """Eventos pendientes en orden (None si el publicador cerró el flujo)"""
+        self.aviso.clear()
+        eventos = []
+        while True:
+            try:
+                eventos.append(self.get_nowait())
+            except queue.Empty:
+                return eventos
+
+
+def formatear_sse(evento):
+    """Convierte (id, tipo, datos) al formato de texto de Server-Sent Events (id None: sin id)"""
+    evento_id, tipo, datos = evento
+    linea_id = '' if evento_id is None else f"id: {evento_id}\n"
+    return f"{linea_id}event: {tipo}\ndata: {json.dumps(datos, ensure_ascii=False)}\n\n"
+
+
+def eventos_de_registros(conn, registros):
+    """Eventos (seq, tipo, datos) de los registros [(seq, tabla, registro_id)], en el mismo orden"""
+    por_tabla = {}
+    for seq, tabla, registro_id in registros:
+        por_tabla.setdefault(tabla, {})[registro_id] = seq
+
+    eventos = []
+    for tabla, (consulta, tipo) in CONSULTAS_PUENTE.items():
+        seqs = por_tabla.get(tabla)
+        if not seqs:
+            continue
+        marcadores = ', '.join('?' for _ in seqs)
+        cursor = conn.execute(consulta.format(marcadores), list(seqs))
+        columnas = [d[0] for d in cursor.description]
+        encontrados = set()
+        for fila in cursor:
+            datos = dict(zip(columnas, fila))
+            encontrados.add(datos['id'])
+            eventos.append((seqs[datos['id']], tipo, datos))
+        # Un material que ya no existe se eliminó
+        if tabla == 'materiales':
+            for material_id in seqs.keys() - encontrados:
+                eventos.append((seqs[material_id], 'material', {'id': material_id, 'accion': 'eliminado'}))
+    eventos.sort(key=lambda evento: evento[0])
+    return eventos
+
+
+def eventos_perdidos(conn, ultimo_id):
+    """Eventos de los cambios con seq posterior a ultimo_id (el Last-Event-ID del navegador)
+
+    Si ese historial ya se purgó, la base de datos se restauró o son más de
+    MAX_EVENTOS_REENVIO registros, devuelve un solo evento 'reiniciar' con el
+    seq actual: el navegador vuelve a cargar todo.
+    """
+    if historial_disponible(conn, ultimo_id):
+        registros = registros_cambiados_desde(conn, ultimo_id, MAX_EVENTOS_REENVIO + 1)
+        if len(registros) <= MAX_EVENTOS_REENVIO:
+            return eventos_de_registros(conn, registros)
+    return [(ultimo_seq(conn), 'reiniciar', {})]
+
+
+class PuenteCambios:
+    """Publica los cambios confirmados en la base de datos, con su seq como id del evento
+
+    Incluye los de otros workers y el escritorio. Revisa el registro de cambios
+    con VigilanteCambios cada `intervalo` segundos desde un hilo propio. Un
+    cambio hecho en este mismo proceso llega dos veces (por la ruta, sin id, y
+    por el puente); los clientes solo recargan datos, así que no importa.
+    """
+
+    def __init__(self, db_path, publicador, intervalo=1.0):
+        self.db_path = db_path
+        self.publicador = publicador
+        self.intervalo = intervalo
+        self._detener = threading.Event()
+        self._hilo = threading.Thread(target=self._ejecutar, name='puente-cambios', daemon=True)
+
+    def iniciar(self):
+        """Inicia la revisión periódica"""
+        self._hilo.start()
+
+    def detener(self):
+        """Detiene la revisión al terminar la vuelta actual"""
+        self._detener.set()
+
+    def _ejecutar(self):
+        conn = sqlite3.connect(self.db_path, timeout=30.0)
+        try:
+            vigilante = VigilanteCambios(conn)
+            while not self._detener.wait(self.intervalo):
+                revisado = vigilante.data_version, vigilante.ultimo_seq
+                try:
+                    eventos = eventos_de_registros(conn, vigilante.revisar_registros())
+                except sqlite3.Error:
+                    # Base de datos ocupada: los mismos cambios se leen en la siguiente vuelta
+                    vigilante.data_version, vigilante.ultimo_seq = revisado
+                    continue
+                for evento_id, tipo, datos in eventos:
+                    self.publicador.publicar(tipo, datos, evento_id)
+        finally:
+            conn.close()
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Recursos estáticos con hash en el nombre y compresión de respuestas HTTP
+
+Al arrancar se copian app.js y styles.css a static/dist/ con el hash de su
+contenido en el nombre (más sus variantes .gz y .br ya comprimidas), de modo
+que el navegador los guarde sin volver a validarlos. Las respuestas de texto
+de la API se comprimen al vuelo si superan UMBRAL_COMPRESION.
+"""
+import gzip
+import hashlib
+import os
+import shutil
+import threading
+
+try:
+    import brotli
+except ImportError:  # brotli es opcional: sin él solo se usa gzip
+    brotli = None
+
+ARCHIVOS_RECURSOS = ('js/app.js', 'css/styles.css')
+CARPETA_DIST = 'dist'
+
+# Bytes a partir de los que vale la pena comprimir una respuesta
+UMBRAL_COMPRESION = 1024
+TIPOS_COMPRIMIBLES = {
+    'application/json',
+    'application/javascript',
+    'text/javascript',
+    'text/css',
+    'text/html',
+    'text/plain',
+    'image/svg+xml',
+    'application/vnd.ptar.columnas+json',
+    'application/x-msgpack',
+}
+
+# Un año: el nombre cambia cuando cambia el contenido
+CACHE_INMUTABLE = 'public, max-age=31536000, immutable'
+
+
+def elegir_codificacion(accept_encodings):
+    """Devuelve 'br', 'gzip' o None según el Accept-Encoding del cliente"""
+    if brotli is not None and accept_encodings.quality('br') > 0:
+        return 'br'
+    if accept_encodings.quality('gzip') > 0:
+        return 'gzip'
+    return None
+
+
+def comprimir(datos, codificacion, maxima=False):
+    """Comprime datos; maxima=True para archivos que se comprimen una sola vez"""
+    if codificacion == 'br':
+        return brotli.compress(datos, quality=11 if maxima else 5)
+    return gzip.compress(datos, compresslevel=9 if maxima else 6, mtime=0)
+
+
+def comprimir_respuesta(respuesta, accept_encodings):
+    """Comprime en el lugar una respuesta de texto si el cliente lo acepta"""
+    if (respuesta.direct_passthrough or respuesta.is_streamed
+            or respuesta.status_code not in (200, 201)
+            or respuesta.mimetype not in TIPOS_COMPRIMIBLES
+            or 'Content-Encoding' in respuesta.headers):
+        return respuesta
+
+    respuesta.vary.add('Accept-Encoding')
+    codificacion = elegir_codificacion(accept_encodings)
+    datos = respuesta.get_data()
+    if codificacion is None or len(datos) < UMBRAL_COMPRESION:
+        return respuesta
+
+    respuesta.set_data(comprimir(datos, codificacion))
+    respuesta.headers['Content-Encoding'] = codificacion
+    return respuesta
+
+
+class RecursosEstaticos:
+    """Genera y localiza las copias con hash de los recursos estáticos
+
+    Si un archivo fuente cambia con el servidor en marcha, la siguiente
+    llamada a ruta() genera la nueva copia.
+    """
+
+    def __init__(self, carpeta_static, archivos=ARCHIVOS_RECURSOS):
+        self.carpeta_static = carpeta_static
+        self.carpeta_dist = os.path.join(carpeta_static, CARPETA_DIST)
+        self.archivos = archivos
+        self._manifiesto = {}   # nombre -> (mtime_ns, ruta relativa a static)
+        self._lock = threading.Lock()
+
+    def construir(self):
+        """Regenera static/dist/ desde cero"""
+        with self._lock:
+            shutil.rmtree(self.carpeta_dist, ignore_errors=True)
+            os.makedirs(self.carpeta_dist)
+            self._manifiesto.clear()
+            for nombre in self.archivos:
+                self._construir_archivo(nombre)
+
+    def ruta(self, nombre):
+        """Ruta (relativa a static/) de la copia con hash del recurso"""
+        origen = os.path.join(self.carpeta_static, nombre)
+        try:
+            mtime = os.stat(origen).st_mtime_ns
+        except OSError:
+            return nombre
+
+        with self._lock:
+            entrada = self._manifiesto.get(nombre)
+            if entrada is None or entrada[0] != mtime:
+                entrada = self._construir_archivo(nombre)
+            return entrada[1]
+
+    def variante(self, nombre, codificacion):
+        """Archivo de dist/ a servir para la codificación pedida y la codificación real"""
+        if codificacion:
+            extension = '.br' if codificacion == 'br' else '.gz'
+            if os.path.isfile(os.path.join(self.carpeta_dist, nombre + extension)):
+                return nombre + extension, codificacion
+        return nombre, None
+
+    def _construir_archivo(self, nombre):
+        origen = os.path.join(self.carpeta_static, nombre)
+        mtime = os.stat(origen).st_mtime_ns
+        with open(origen, 'rb') as f:
+            datos = f.read()
+
+        base, extension = os.path.splitext(os.path.basename(nombre))
+        destino = f"{base}.{hashlib.sha256(datos).hexdigest()[:12]}{extension}"
+        ruta_destino = os.path.join(self.carpeta_dist, destino)
+
+        if not os.path.exists(ruta_destino):
+            os.makedirs(self.carpeta_dist, exist_ok=True)
+            with open(ruta_destino, 'wb') as f:
+                f.write(datos)
+            with open(ruta_destino + '.gz', 'wb') as f:
+                f.write(comprimir(datos, 'gzip', maxima=True))
+            if brotli is not None:
+                with open(ruta_destino + '.br', 'wb') as f:
+                    f.write(comprimir(datos, 'br', maxima=True))
+
+        entrada = (mtime, f"{CARPETA_DIST}/{destino}")
+        self._manifiesto[nombre] = entrada
+        return entrada
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Servidor de producción del Sistema de Inventario PTAR (versión web)
+
+En Windows usa waitress (un proceso con varios hilos) y en Linux gunicorn
+(varios procesos con hilos y la aplicación precargada). Con --servidor uvicorn
+se usa la API asíncrona de api_asincrona.py: las consultas y /api/eventos se
+atienden en un bucle asyncio y --threads es el número de hilos de lectura.
+`python app.py` queda solo para desarrollo.
+
+Uso:
+    python servidor.py [--host 0.0.0.0] [--port 5000] [--workers N] [--threads N]
+                       [--servidor waitress|gunicorn|uvicorn] [--precargar-reportes]
+
+Los valores por defecto también se pueden dar con las variables de entorno
+PTAR_HOST, PTAR_PORT, PTAR_WORKERS, PTAR_THREADS y PTAR_PRECARGAR_REPORTES.
+
+Con waitress y gunicorn cada navegador con la página abierta mantiene un hilo
+ocupado con /api/eventos, así que --threads debe ser mayor que el número de
+terminales conectadas; con uvicorn los eventos no ocupan hilos.
+"""
+import argparse
+import os
+import sys
+
+from exportador_reportes import precarga_solicitada, precargar_dependencias
+
+# Segundos que se espera a las peticiones en curso al detener el servidor
+TIEMPO_APAGADO = 10
+# Hilos por proceso con waitress y gunicorn
+HILOS_POR_DEFECTO = 32
+
+
+def workers_por_defecto():
+    """Procesos gunicorn: SQLite admite un solo escritor, más de 4 no aporta"""
+    return min(4, os.cpu_count() or 1)
+
+
+def leer_opciones(argv=None):
+    """Opciones de línea de comandos con valores por defecto desde el entorno"""
+    parser = argparse.ArgumentParser(description='Servidor de producción del inventario PTAR')
+    parser.add_argument('--host', default=os.environ.get('PTAR_HOST', '0.0.0.0'))
+    parser.add_argument('--port', type=int, default=int(os.environ.get('PTAR_PORT', 5000)))
+    parser.add_argument('--workers', type=int,
+                        default=int(os.environ.get('PTAR_WORKERS', workers_por_defecto())),
+                        help='procesos (solo gunicorn)')
+    parser.add_argument('--threads', type=int, default=os.environ.get('PTAR_THREADS'),
+                        help=f'hilos por proceso (por defecto {HILOS_POR_DEFECTO}; '
+                             f'con uvicorn, hilos de lectura)')
+    parser.add_argument('--servidor', choices=('waitress', 'gunicorn', 'uvicorn'),
+                        default='waitress' if sys.platform == 'win32' else 'gunicorn')
+    parser.add_argument('--precargar-reportes', action='store_true', default=precarga_solicitada(),
+                        help='importar pandas y openpyxl al arrancar en vez de en el primer reporte')
+    opciones = parser.parse_args(argv)
+    if opciones.threads is None and opciones.servidor == 'uvicorn':
+        from api_asincrona import HILOS_LECTURA
+        opciones.threads = HILOS_LECTURA
+    elif opciones.threads is None:
+        opciones.threads = HILOS_POR_DEFECTO
+    return opciones
+
+
+def servir_waitress(opciones):
+    """Un proceso con varios hilos (por defecto en Windows); Ctrl+C detiene el servidor"""
+    from waitress import serve
+
+    import app as aplicacion
+
+    aplicacion.preparar_aplicacion(precargar_reportes=opciones.precargar_reportes)
+    aplicacion.iniciar_worker()
+    serve(aplicacion.app, host=opciones.host, port=opciones.port, threads=opciones.threads,
+          ident='inventario-ptar')
+
+
+def servir_gunicorn(opciones):
+    """Varios procesos gthread con la aplicación precargada (por defecto en Linux)"""
+    from gunicorn.app.base import BaseApplication
+
+    # Se prepara antes del fork: esquema, recursos estáticos y rutas se hacen una vez
+    import app as aplicacion
+
+    aplicacion.preparar_aplicacion(precargar_reportes=False)
+    if opciones.precargar_reportes:
+        # Sin hilo: lo importado antes del fork lo comparten todos los procesos
+        precargar_dependencias(en_segundo_plano=False)
+
+    def post_fork(server, worker):
+        worker.servicios = aplicacion.iniciar_worker()
+
+    def worker_exit(server, worker):
+        for servicio in getattr(worker, 'servicios', ()):
+            servicio.detener()
+
+    configuracion = {
+        'bind': f'{opciones.host}:{opciones.port}',
+        'workers': opciones.workers,
+        'threads': opciones.threads,
+        'worker_class': 'gthread',
+        'preload_app': True,
+        'graceful_timeout': TIEMPO_APAGADO,
+        'post_fork': post_fork,
+        'worker_exit': worker_exit,
+    }
+
+    class ServidorInventario(BaseApplication):
+        def load_config(self):
+            for clave, valor in configuracion.items():
+                self.cfg.set(clave, valor)
+
+        def load(self):
+            return aplicacion.app
+
+    ServidorInventario().run()
+
+
+def servir_uvicorn(opciones):
+    """Un proceso con la API asíncrona: consultas en hilos de lectura, eventos sin hilos"""
+    import uvicorn
+
+    import app as aplicacion
+    from api_asincrona import AplicacionAsincrona
+
+    aplicacion.preparar_aplicacion(precargar_reportes=opciones.precargar_reportes)
+    uvicorn.run(AplicacionAsincrona(hilos_lectura=opciones.threads),
+                host=opciones.host, port=opciones.port, lifespan='on',
+                timeout_graceful_shutdown=TIEMPO_APAGADO)
+
+
+def main(argv=None):
+    opciones = leer_opciones(argv)
+
+    print("=" * 60)
+    print("SISTEMA DE INVENTARIO PTAR - SERVIDOR DE PRODUCCIÓN")
+    print("=" * 60)
+    print(f"\nURL: http://localhost:{opciones.port}")
+    if opciones.servidor == 'waitress':
+        print(f"Servidor: waitress, {opciones.threads} hilos")
+    elif opciones.servidor == 'uvicorn':
+        print(f"Servidor: uvicorn (asíncrono), {opciones.threads} hilos de lectura")
+    else:
+        print(f"Servidor: gunicorn, {opciones.workers} procesos x {opciones.threads} hilos")
+    print(f"\nPresiona Ctrl+C para detener el servidor\n")
+    print("=" * 60)
+
+    if opciones.servidor == 'waitress':
+        servir_waitress(opciones)
+    elif opciones.servidor == 'uvicorn':
+        servir_uvicorn(opciones)
+    else:
+        servir_gunicorn(opciones)
+
+
+if __name__ == '__main__':
+    main()
@@ -10,6 +10,7 @@ let editandoMaterialId = null;
 document.addEventListener('DOMContentLoaded', function() {
     inicializarEventos();
     cargarDatosIniciales();
+    conectarEventos();
 });
 
 function inicializarEventos() {
@@ -21,22 +22,22 @@ function inicializarEventos() {
     });
 
     // Filtros de inventario
-    document.getElementById('searchInput')?.addEventListener('input', filtrarInventario);
+    document.getElementById('searchInput')?.addEventListener('input', debounce(filtrarInventario));
     document.getElementById('filterCategoria')?.addEventListener('change', filtrarInventario);
     document.getElementById('filterUbicacion')?.addEventListener('change', filtrarInventario);
     document.getElementById('filterEstado')?.addEventListener('change', filtrarInventario);
 
     // Filtros de búsqueda de materiales en otros tabs
-    document.getElementById('searchEntradaMaterial')?.addEventListener('input', cargarMaterialesEntrada);
+    document.getElementById('searchEntradaMaterial')?.addEventListener('input', debounce(cargarMaterialesEntrada));
     document.getElementById('filterEntradaCategoria')?.addEventListener('change', cargarMaterialesEntrada);
 
-    document.getElementById('searchSalidaMaterial')?.addEventListener('input', cargarMaterialesSalida);
+    document.getElementById('searchSalidaMaterial')?.addEventListener('input', debounce(cargarMaterialesSalida));
     document.getElementById('filterSalidaCategoria')?.addEventListener('change', cargarMaterialesSalida);
 
-    document.getElementById('searchPrestamoMaterial')?.addEventListener('input', cargarMaterialesPrestamo);
+    document.getElementById('searchPrestamoMaterial')?.addEventListener('input', debounce(cargarMaterialesPrestamo));
     document.getElementById('filterPrestamoCategoria')?.addEventListener('change', cargarMaterialesPrestamo);
 
-    document.getElementById('searchEnUsoMaterial')?.addEventListener('input', cargarMaterialesEnUso);
+    document.getElementById('searchEnUsoMaterial')?.addEventListener('input', debounce(cargarMaterialesEnUso));
     document.getElementById('filterEnUsoCategoria')?.addEventListener('change', cargarMaterialesEnUso);
 
     // Forms
@@ -55,18 +56,573 @@ function inicializarEventos() {
     });
 }
 
-function cargarDatosIniciales() {
-    cargarMateriales();
-    actualizarEstadisticas();
-    cargarMovimientos();
-    cargarPrestamos();
-    cargarMaterialEnUso();
+async function cargarDatosIniciales() {
+    // Catálogo guardado en el navegador (si lo hay); si no, llega con la carga inicial
+    const desdeGuardado = await cargarCatalogoGuardado();
+
+    try {
+        const response = await obtenerLista(`/api/bootstrap?materiales=${desdeGuardado ? 0 : 1}`);
+        if (!response.ok) throw new Error(`Error ${response.status} en la carga inicial`);
+        const datos = await leerDocumento(response);
+
+        if (datos.materiales) {
+            establecerCatalogo(filasDesdeColumnas(datos.materiales), datos.cambios_hasta);
+        }
+        mostrarEstadisticas(datos.estadisticas);
+        renderizarPrestamos(filasDesdeColumnas(datos.prestamos));
+        renderizarMaterialEnUso(filasDesdeColumnas(datos.material_en_uso));
+        renderizarMovimientos(filasDesdeColumnas(datos.entradas), 'entradasTableBody');
+        renderizarMovimientos(filasDesdeColumnas(datos.salidas), 'salidasTableBody');
+        if (datos.catalogos) aplicarCatalogos(datos.catalogos);
+    } catch (error) {
+        // Si falla, cada sección se carga por separado
+        console.error('Error en la carga inicial:', error);
+        if (!catalogo) await sincronizarCatalogo();
+        cargarCatalogos();
+        actualizarEstadisticas();
+        cargarPrestamos();
+        cargarMaterialEnUso();
+        cargarMovimientos('ENTRADA', 'entradasTableBody');
+        cargarMovimientos('SALIDA', 'salidasTableBody');
+    }
 
-    // Cargar materiales en las tablas de selección
+    // Inventario y tablas de selección se filtran desde el catálogo
+    cargarMateriales();
     cargarMaterialesEntrada();
     cargarMaterialesSalida();
     cargarMaterialesPrestamo();
     cargarMaterialesEnUso();
+
+    // Lo guardado se concilia con el servidor en segundo plano
+    if (desdeGuardado) {
+        sincronizarCatalogo().then(cambio => {
+            if (cambio) refrescarVistasCatalogo();
+        });
+    }
+}
+
+// ================================
+// CATÁLOGOS (OPCIONES DE LOS FILTROS)
+// ================================
+// Selects que se llenan con cada catálogo de /api/catalogos; las opciones
+// escritas en index.html solo se usan si el catálogo no llega
+const SELECTS_CATALOGO = {
+    categorias: ['filterCategoria', 'filterEntradaCategoria', 'filterSalidaCategoria',
+                 'filterPrestamoCategoria', 'filterEnUsoCategoria', 'materialCategoria'],
+    ubicaciones: ['filterUbicacion', 'materialUbicacion']
+};
+
+async function cargarCatalogos() {
+    try {
+        const response = await fetch('/api/catalogos');
+        if (response.ok) aplicarCatalogos(await leerDocumento(response));
+    } catch (error) {
+        console.error('Error al cargar catálogos:', error);
+    }
+}
+
+function aplicarCatalogos(catalogos) {
+    for (const [nombre, ids] of Object.entries(SELECTS_CATALOGO)) {
+        const valores = (catalogos[nombre] || []).map(([, valor]) => valor);
+        if (!valores.length) continue;
+
+        ids.forEach(id => {
+            const select = document.getElementById(id);
+            if (!select) return;
+            const actual = select.value;
+            const todas = select.querySelector('option[value=""]');
+            select.replaceChildren(...(todas ? [todas] : []), ...valores.map(v => new Option(v, v)));
+            if (actual && !valores.includes(actual)) select.add(new Option(actual, actual));
+            if (actual || todas) select.value = actual;
+        });
+    }
+
+    const unidades = document.getElementById('listaUnidades');
+    if (unidades && catalogos.unidades) {
+        unidades.replaceChildren(...catalogos.unidades.map(([, valor]) => new Option(valor)));
+    }
+}
+
+// ================================
+// CONSULTAS (DEBOUNCE, CANCELACIÓN Y CACHÉ)
+// ================================
+const ESPERA_BUSQUEDA_MS = 250;
+const CACHE_CONSULTAS_MAX = 50;
+const CACHE_CONSULTAS_TTL_MS = 15000;
+
+const cacheConsultas = new Map();        // url -> { tiempo, datos }
+const consultasEnCurso = new Map();      // url -> { promesa, controlador, consumidores }
+const busquedasActivas = new Map();      // buscador -> AbortController
+let generacionCache = 0;                 // aumenta con cada invalidación
+
+function debounce(fn, espera = ESPERA_BUSQUEDA_MS) {
+    let temporizador = null;
+    return function(...args) {
+        clearTimeout(temporizador);
+        temporizador = setTimeout(() => fn.apply(this, args), espera);
+    };
+}
+
+function esCancelacion(error) {
+    return error && error.name === 'AbortError';
+}
+
+// GET con caché por URL y deduplicación de peticiones idénticas en curso.
+// La petición de red solo se aborta cuando todos los que la esperan cancelan.
+// Una respuesta que empezó antes de una invalidación no se guarda en la caché.
+async function consultarAPI(url, signal = null) {
+    const enCache = cacheConsultas.get(url);
+    if (enCache && Date.now() - enCache.tiempo < CACHE_CONSULTAS_TTL_MS) {
+        cacheConsultas.delete(url);
+        cacheConsultas.set(url, enCache);
+        return enCache.datos;
+    }
+
+    let consulta = consultasEnCurso.get(url);
+    if (!consulta) {
+        const controlador = new AbortController();
+        const generacion = generacionCache;
+        consulta = { controlador, consumidores: 0 };
+        consulta.promesa = obtenerLista(url, { signal: controlador.signal })
+            .then(response => {
+                if (!response.ok) throw new Error(`Error ${response.status} en ${url}`);
+                return leerRespuesta(response);
+            })
+            .then(datos => {
+                if (generacion !== generacionCache) return datos;
+                cacheConsultas.set(url, { tiempo: Date.now(), datos });
+                if (cacheConsultas.size > CACHE_CONSULTAS_MAX) {
+                    cacheConsultas.delete(cacheConsultas.keys().next().value);
+                }
+                return datos;
+            })
+            .finally(() => {
+                if (consultasEnCurso.get(url) === consulta) consultasEnCurso.delete(url);
+            });
+        consultasEnCurso.set(url, consulta);
+    }
+
+    consulta.consumidores++;
+    if (!signal) return consulta.promesa;
+
+    return new Promise((resolve, reject) => {
+        const alCancelar = () => {
+            if (--consulta.consumidores === 0) consulta.controlador.abort();
+            reject(new DOMException('Consulta cancelada', 'AbortError'));
+        };
+        if (signal.aborted) return alCancelar();
+        signal.addEventListener('abort', alCancelar, { once: true });
+        consulta.promesa.then(resolve, reject).finally(() => {
+            signal.removeEventListener('abort', alCancelar);
+        });
+    });
+}
+
+// Cancela la búsqueda anterior del mismo buscador y lanza la nueva.
+// Con el catálogo local cargado se filtra en el navegador sin ir al servidor.
+async function buscarMateriales(buscador, params) {
+    busquedasActivas.get(buscador)?.abort();
+    const controlador = new AbortController();
+    busquedasActivas.set(buscador, controlador);
+
+    if (catalogo) {
+        await sincronizacionCatalogo;
+        if (controlador.signal.aborted) throw new DOMException('Consulta cancelada', 'AbortError');
+        return filtrarCatalogo(params);
+    }
+    return consultarAPI(`/api/materiales?${params}`, controlador.signal);
+}
+
+// Se llama después de cualquier cambio para no mostrar datos viejos
+function invalidarCacheConsultas() {
+    generacionCache++;
+    cacheConsultas.clear();
+    // Las consultas en curso pueden traer datos anteriores al cambio: las nuevas no se les unen
+    consultasEnCurso.clear();
+    // Las búsquedas de materiales esperan a esta sincronización antes de filtrar
+    if (catalogo) sincronizarCatalogo();
+}
+
+// ================================
+// FORMATOS DE LISTA (COLUMNAS Y MESSAGEPACK)
+// ================================
+// Las listas llegan como { columns, rows } en MessagePack o JSON y se
+// convierten a objetos; el resto de las respuestas siguen siendo JSON.
+const ACEPTAR_LISTAS = 'application/x-msgpack, application/vnd.ptar.columnas+json;q=0.9, application/json;q=0.5';
+
+function obtenerLista(url, opciones = {}) {
+    return fetch(url, { ...opciones, headers: { Accept: ACEPTAR_LISTAS, ...opciones.headers } });
+}
+
+// Documento tal como llega (MessagePack o JSON)
+async function leerDocumento(response) {
+    const tipo = response.headers.get('Content-Type') || '';
+    if (tipo.startsWith('application/x-msgpack')) {
+        return decodificarMsgpack(await response.arrayBuffer());
+    }
+    return response.json();
+}
+
+// Lista de objetos, venga en columnas o como arreglo de objetos
+async function leerRespuesta(response) {
+    const tipo = response.headers.get('Content-Type') || '';
+    const datos = await leerDocumento(response);
+    const enColumnas = tipo.startsWith('application/x-msgpack') ||
+        tipo.startsWith('application/vnd.ptar.columnas+json');
+    return enColumnas ? filasDesdeColumnas(datos) : datos;
+}
+
+function filasDesdeColumnas({ columns, rows }) {
+    return rows.map(fila => {
+        const objeto = {};
+        for (let i = 0; i < columns.length; i++) {
+            objeto[columns[i]] = fila[i];
+        }
+        return objeto;
+    });
+}
+
+// Decodificador de MessagePack con los tipos que genera el servidor
+// (nulos, booleanos, números, textos, binarios, arreglos y mapas)
+function decodificarMsgpack(buffer) {
+    const bytes = new Uint8Array(buffer);
+    const vista = new DataView(buffer);
+    const decodificadorTexto = new TextDecoder();
+    let pos = 0;
+
+    const avanzar = (n, valor) => { pos += n; return valor; };
+    const texto = n => avanzar(n, decodificadorTexto.decode(bytes.subarray(pos, pos + n)));
+    const binario = n => avanzar(n, bytes.slice(pos, pos + n));
+    const arreglo = n => {
+        const resultado = new Array(n);
+        for (let i = 0; i < n; i++) resultado[i] = leer();
+        return resultado;
+    };
+    const mapa = n => {
+        const resultado = {};
+        for (let i = 0; i < n; i++) {
+            const clave = leer();
+            resultado[clave] = leer();
+        }
+        return resultado;
+    };
+    const u8 = () => avanzar(1, vista.getUint8(pos));
+    const u16 = () => avanzar(2, vista.getUint16(pos));
+    const u32 = () => avanzar(4, vista.getUint32(pos));
+
+    function leer() {
+        const b = bytes[pos++];
+        if (b <= 0x7f) return b;
+        if (b >= 0xe0) return b - 0x100;
+        if (b >= 0xa0 && b <= 0xbf) return texto(b & 0x1f);
+        if (b >= 0x90 && b <= 0x9f) return arreglo(b & 0x0f);
+        if (b >= 0x80 && b <= 0x8f) return mapa(b & 0x0f);
+
+        switch (b) {
+            case 0xc0: return null;
+            case 0xc2: return false;
+            case 0xc3: return true;
+            case 0xc4: return binario(u8());
+            case 0xc5: return binario(u16());
+            case 0xc6: return binario(u32());
+            case 0xca: return avanzar(4, vista.getFloat32(pos));
+            case 0xcb: return avanzar(8, vista.getFloat64(pos));
+            case 0xcc: return u8();
+            case 0xcd: return u16();
+            case 0xce: return u32();
+            case 0xcf: return avanzar(8, Number(vista.getBigUint64(pos)));
+            case 0xd0: return avanzar(1, vista.getInt8(pos));
+            case 0xd1: return avanzar(2, vista.getInt16(pos));
+            case 0xd2: return avanzar(4, vista.getInt32(pos));
+            case 0xd3: return avanzar(8, Number(vista.getBigInt64(pos)));
+            case 0xd9: return texto(u8());
+            case 0xda: return texto(u16());
+            case 0xdb: return texto(u32());
+            case 0xdc: return arreglo(u16());
+            case 0xdd: return arreglo(u32());
+            case 0xde: return mapa(u16());
+            case 0xdf: return mapa(u32());
+        }
+        throw new Error(`Tipo de MessagePack no soportado: 0x${b.toString(16)}`);
+    }
+
+    return leer();
+}
+
+// ================================
+// CATÁLOGO LOCAL (INDEXEDDB)
+// ================================
+const CATALOGO_BD = 'inventario-ptar';
+const CATALOGO_BD_VERSION = 1;
+
+let catalogo = null;                 // Map id -> material; null mientras no se ha cargado
+let catalogoOrdenado = null;         // Lista ordenada por nombre, se recalcula tras cada cambio
+let catalogoHasta = 0;               // Última secuencia de /api/cambios aplicada
+let sincronizacionCatalogo = null;   // Promesa de la sincronización en curso
+let resincronizarCatalogo = false;
+let bdCatalogo = null;
+
+function solicitudIDB(solicitud) {
+    return new Promise((resolve, reject) => {
+        solicitud.onsuccess = () => resolve(solicitud.result);
+        solicitud.onerror = () => reject(solicitud.error);
+    });
+}
+
+// Sin IndexedDB (p. ej. navegación privada) el catálogo vive solo en memoria
+function abrirBDCatalogo() {
+    if (!bdCatalogo) {
+        bdCatalogo = new Promise(resolve => {
+            if (!window.indexedDB) return resolve(null);
+            const solicitud = indexedDB.open(CATALOGO_BD, CATALOGO_BD_VERSION);
+            solicitud.onupgradeneeded = () => {
+                solicitud.result.createObjectStore('materiales', { keyPath: 'id' });
+                solicitud.result.createObjectStore('meta');
+            };
+            solicitud.onsuccess = () => resolve(solicitud.result);
+            solicitud.onerror = () => resolve(null);
+        });
+    }
+    return bdCatalogo;
+}
+
+async function leerCatalogoGuardado() {
+    const bd = await abrirBDCatalogo();
+    if (!bd) return null;
+
+    const tx = bd.transaction(['materiales', 'meta'], 'readonly');
+    const [materiales, hasta] = await Promise.all([
+        solicitudIDB(tx.objectStore('materiales').getAll()),
+        solicitudIDB(tx.objectStore('meta').get('hasta'))
+    ]);
+    return hasta === undefined ? null : { materiales, hasta };
+}
+
+async function guardarCatalogo(upserts, deletes, hasta, reemplazar = false) {
+    const bd = await abrirBDCatalogo();
+    if (!bd) return;
+
+    const tx = bd.transaction(['materiales', 'meta'], 'readwrite');
+    const materiales = tx.objectStore('materiales');
+    if (reemplazar) materiales.clear();
+    upserts.forEach(m => materiales.put(m));
+    deletes.forEach(id => materiales.delete(id));
+    tx.objectStore('meta').put(hasta, 'hasta');
+
+    return new Promise((resolve, reject) => {
+        tx.oncomplete = () => resolve();
+        tx.onerror = tx.onabort = () => reject(tx.error);
+    });
+}
+
+// Carga el catálogo guardado en IndexedDB; indica si había uno
+async function cargarCatalogoGuardado() {
+    try {
+        const guardado = await leerCatalogoGuardado();
+        if (guardado) {
+            catalogo = new Map(guardado.materiales.map(m => [m.id, m]));
+            catalogoOrdenado = null;
+            catalogoHasta = guardado.hasta;
+            return true;
+        }
+    } catch (error) {
+        console.error('Error al leer el catálogo guardado:', error);
+    }
+    return false;
+}
+
+// Reemplaza el catálogo completo (lista de materiales y secuencia de cambios que le corresponde)
+function establecerCatalogo(materiales, hasta) {
+    catalogo = new Map(materiales.map(m => [m.id, m]));
+    catalogoOrdenado = null;
+    catalogoHasta = hasta;
+    guardarCatalogo(materiales, [], hasta, true).catch(error => console.error(error));
+}
+
+async function descargarCatalogoCompleto() {
+    const response = await obtenerLista('/api/materiales');
+    if (!response.ok) throw new Error(`Error ${response.status} al descargar el catálogo`);
+    const materiales = await leerRespuesta(response);
+    establecerCatalogo(materiales, parseInt(response.headers.get('X-Cambios-Hasta') || '0', 10));
+}
+
+// Aplica los cambios de materiales posteriores a catalogoHasta; indica si hubo alguno
+async function aplicarCambiosCatalogo() {
+    if (!catalogo) {
+        await descargarCatalogoCompleto();
+        return true;
+    }
+
+    let cambio = false;
+    let mas = true;
+    while (mas) {
+        const response = await fetch(`/api/cambios?desde=${catalogoHasta}&tablas=materiales`);
+        if (!response.ok) throw new Error(`Error ${response.status} al consultar cambios`);
+        const datos = await response.json();
+
+        if (datos.reiniciar) {
+            await descargarCatalogoCompleto();
+            return true;
+        }
+
+        const { upserts = [], deletes = [] } = datos.cambios.materiales || {};
+        upserts.forEach(m => catalogo.set(m.id, m));
+        deletes.forEach(id => catalogo.delete(id));
+        if (upserts.length || deletes.length) {
+            catalogoOrdenado = null;
+            cambio = true;
+        }
+        catalogoHasta = datos.hasta;
+        guardarCatalogo(upserts, deletes, datos.hasta).catch(error => console.error(error));
+        mas = datos.mas;
+    }
+    return cambio;
+}
+
+// Una sola sincronización a la vez; si se pide otra mientras corre, se repite al terminar
+function sincronizarCatalogo() {
+    if (sincronizacionCatalogo) {
+        resincronizarCatalogo = true;
+        return sincronizacionCatalogo;
+    }
+
+    sincronizacionCatalogo = (async () => {
+        let cambio = false;
+        try {
+            do {
+                resincronizarCatalogo = false;
+                cambio = (await aplicarCambiosCatalogo()) || cambio;
+            } while (resincronizarCatalogo);
+        } catch (error) {
+            // Sin conexión se sigue trabajando con el catálogo que ya se tiene
+            console.error('Error al sincronizar el catálogo:', error);
+        } finally {
+            sincronizacionCatalogo = null;
+        }
+        return cambio;
+    })();
+    return sincronizacionCatalogo;
+}
+
+function claseEstado(m) {
+    if (m.cantidad_actual <= 0) return 'sin-stock';
+    if (m.cantidad_actual <= m.stock_minimo) return 'stock-bajo';
+    return 'stock-normal';
+}
+
+// LIKE de SQLite solo ignora mayúsculas y minúsculas en letras ASCII ('É' != 'é')
+function minusculasAscii(texto) {
+    return texto.replace(/[A-Z]/g, c => c.toLowerCase());
+}
+
+// Búsqueda como `LIKE '%busqueda%'`: % y _ son comodines
+function patronBusqueda(busqueda) {
+    const cuerpo = [...minusculasAscii(busqueda)].map(c =>
+        c === '%' ? '[\\s\\S]*' :
+        c === '_' ? '[\\s\\S]' :
+        c.replace(/[.*+?^${}()|[\]\\/]/g, '\\$&')).join('');
+    return new RegExp(cuerpo, 'u');
+}
+
+// Mismos filtros que GET /api/materiales (consultar_materiales en app.py)
+function filtrarCatalogo(params) {
+    const categoria = params.get('categoria') || '';
+    const ubicacion = params.get('ubicacion') || '';
+    const estado = params.get('estado') || '';
+    const busqueda = params.get('busqueda') || '';
+    const patron = busqueda ? patronBusqueda(busqueda) : null;
+    const contiene = valor => patron.test(minusculasAscii(valor || ''));
+
+    if (!catalogoOrdenado) {
+        catalogoOrdenado = [...catalogo.values()].sort((a, b) =>
+            a.nombre < b.nombre ? -1 : a.nombre > b.nombre ? 1 : 0);
+    }
+
+    return catalogoOrdenado
+        .filter(m => !categoria || categoria === 'Todas' || m.categoria === categoria)
+        .filter(m => !ubicacion || ubicacion === 'Todas' || m.ubicacion === ubicacion)
+        .filter(m => !busqueda || contiene(m.codigo) || contiene(m.nombre) || contiene(m.descripcion))
+        .map(m => ({ ...m, estado_clase: claseEstado(m) }))
+        .filter(m => {
+            if (estado === 'sin_stock') return m.estado_clase === 'sin-stock';
+            if (estado === 'stock_bajo') return m.estado_clase === 'stock-bajo';
+            if (estado === 'stock_normal') return m.estado_clase === 'stock-normal';
+            return true;
+        });
+}
+
+function refrescarVistasCatalogo() {
+    cargarMateriales();
+    RECARGAS.seleccion();
+}
+
+// ================================
+// EVENTOS EN TIEMPO REAL (SSE)
+// ================================
+const ESPERA_RECARGA_EVENTOS_MS = 300;
+
+// Recargas pendientes por eventos recibidos; se agrupan para no repetir consultas
+const recargasPendientes = new Set();
+let temporizadorRecargas = null;
+
+const RECARGAS = {
+    materiales: () => cargarMateriales(),
+    seleccion: () => {
+        cargarMaterialesEntrada();
+        cargarMaterialesSalida();
+        cargarMaterialesPrestamo();
+        cargarMaterialesEnUso();
+    },
+    entradas: () => cargarMovimientos('ENTRADA', 'entradasTableBody'),
+    salidas: () => cargarMovimientos('SALIDA', 'salidasTableBody'),
+    prestamos: () => cargarPrestamos(),
+    enUso: () => cargarMaterialEnUso(),
+    estadisticas: () => actualizarEstadisticas()
+};
+
+function programarRecarga(...nombres) {
+    nombres.forEach(nombre => recargasPendientes.add(nombre));
+    clearTimeout(temporizadorRecargas);
+    temporizadorRecargas = setTimeout(() => {
+        invalidarCacheConsultas();
+        recargasPendientes.forEach(nombre => RECARGAS[nombre]());
+        recargasPendientes.clear();
+    }, ESPERA_RECARGA_EVENTOS_MS);
+}
+
+// Actualiza la fila del inventario en cuanto llega el evento, sin esperar la recarga
+function aplicarStock(stock) {
+    const material = materialesData.find(m => m.id === stock.id);
+    if (material) {
+        material.cantidad_actual = stock.cantidad_actual;
+        material.stock_minimo = stock.stock_minimo;
+        material.estado_clase = claseEstado(material);
+        renderizarInventario();
+        actualizarHeaderStats();
+    }
+    // Los filtros de estado pueden cambiar qué filas se muestran
+    programarRecarga('materiales', 'seleccion', 'estadisticas');
+}
+
+function conectarEventos() {
+    if (!window.EventSource) return;
+
+    // EventSource se reconecta solo y envía Last-Event-ID (el seq del registro de cambios,
+    // válido en cualquier proceso del servidor) para recibir lo perdido
+    const fuente = new EventSource('/api/eventos');
+    const leer = (tipo, fn) => fuente.addEventListener(tipo, e => fn(JSON.parse(e.data)));
+
+    leer('stock', aplicarStock);
+    leer('material', () => programarRecarga('materiales', 'seleccion', 'estadisticas'));
+    leer('movimiento', mov => {
+        if (mov.tipo_movimiento === 'ENTRADA') programarRecarga('entradas');
+        if (mov.tipo_movimiento === 'SALIDA') programarRecarga('salidas');
+        programarRecarga('estadisticas');
+    });
+    leer('prestamo', () => programarRecarga('prestamos', 'estadisticas'));
+    leer('material_en_uso', () => programarRecarga('enUso', 'estadisticas'));
+    // El servidor ya no tiene los cambios perdidos durante la desconexión
+    leer('reiniciar', () => programarRecarga(...Object.keys(RECARGAS)));
 }
 
 // ================================
@@ -105,8 +661,7 @@ async function cargarMaterialesEntrada() {
         const categoria = document.getElementById('filterEntradaCategoria')?.value || '';
 
         const params = new URLSearchParams({ busqueda, categoria });
-        const response = await fetch(`/api/materiales?${params}`);
-        const materiales = await response.json();
+        const materiales = await buscarMateriales('entrada', params);
 
         const tbody = document.getElementById('entradaMaterialesTableBody');
         if (materiales.length === 0) {
@@ -140,6 +695,7 @@ async function cargarMaterialesEntrada() {
             });
         });
     } catch (error) {
+        if (esCancelacion(error)) return;
         console.error('Error al cargar materiales:', error);
     }
 }
@@ -158,8 +714,7 @@ async function cargarMaterialesSalida() {
         const categoria = document.getElementById('filterSalidaCategoria')?.value || '';
 
         const params = new URLSearchParams({ busqueda, categoria });
-        const response = await fetch(`/api/materiales?${params}`);
-        const materiales = await response.json();
+        const materiales = await buscarMateriales('salida', params);
 
         const tbody = document.getElementById('salidaMaterialesTableBody');
         if (materiales.length === 0) {
@@ -193,6 +748,7 @@ async function cargarMaterialesSalida() {
             });
         });
     } catch (error) {
+        if (esCancelacion(error)) return;
         console.error('Error al cargar materiales:', error);
     }
 }
@@ -211,8 +767,7 @@ async function cargarMaterialesPrestamo() {
         const categoria = document.getElementById('filterPrestamoCategoria')?.value || '';
 
         const params = new URLSearchParams({ busqueda, categoria });
-        const response = await fetch(`/api/materiales?${params}`);
-        const materiales = await response.json();
+        const materiales = await buscarMateriales('prestamo', params);
 
         const tbody = document.getElementById('prestamoMaterialesTableBody');
         if (materiales.length === 0) {
@@ -246,6 +801,7 @@ async function cargarMaterialesPrestamo() {
             });
         });
     } catch (error) {
+        if (esCancelacion(error)) return;
         console.error('Error al cargar materiales:', error);
     }
 }
@@ -264,8 +820,7 @@ async function cargarMaterialesEnUso() {
         const categoria = document.getElementById('filterEnUsoCategoria')?.value || '';
 
         const params = new URLSearchParams({ busqueda, categoria });
-        const response = await fetch(`/api/materiales?${params}`);
-        const materiales = await response.json();
+        const materiales = await buscarMateriales('enUso', params);
 
         const tbody = document.getElementById('enUsoMaterialesTableBody');
         if (materiales.length === 0) {
@@ -299,6 +854,7 @@ async function cargarMaterialesEnUso() {
             });
         });
     } catch (error) {
+        if (esCancelacion(error)) return;
         console.error('Error al cargar materiales:', error);
     }
 }
@@ -323,68 +879,187 @@ async function cargarMateriales() {
             busqueda: document.getElementById('searchInput')?.value || ''
         });
 
-        const response = await fetch(`/api/materiales?${params}`);
-        materialesData = await response.json();
+        materialesData = await buscarMateriales('inventario', params);
 
         renderizarInventario();
         actualizarHeaderStats();
     } catch (error) {
+        if (esCancelacion(error)) return;
         mostrarToast('Error al cargar materiales', 'error');
         console.error(error);
     }
 }
 
+// ================================
+// TABLA VIRTUAL
+// ================================
+const FILAS_EXTRA_VIRTUAL = 10;   // Filas fuera de la vista que se pintan para el scroll rápido
+
+// Tabla que solo crea las filas visibles dentro de un contenedor con scroll.
+// Las filas <tr> se reutilizan al desplazarse; dos filas espaciadoras ocupan
+// la altura de las que no se pintan. crearFila() arma una fila vacía y
+// pintarFila(tr, item) rellena su contenido.
+function crearTablaVirtual(contenedor, tbody, numColumnas, crearFila, pintarFila) {
+    const tabla = {
+        datos: [],
+        filas: [],
+        altoFila: 53,
+        pendiente: false
+    };
+
+    const crearEspaciador = () => {
+        const tr = document.createElement('tr');
+        tr.className = 'espaciador-virtual';
+        const td = document.createElement('td');
+        td.colSpan = numColumnas;
+        tr.appendChild(td);
+        return tr;
+    };
+    const espaciadorSuperior = crearEspaciador();
+    const espaciadorInferior = crearEspaciador();
+
+    tabla.pintar = function(forzar = false) {
+        // Con la pestaña oculta el contenedor no tiene altura: se estima con la ventana
+        const altoVista = contenedor.clientHeight || window.innerHeight;
+        const primera = Math.floor(contenedor.scrollTop / tabla.altoFila);
+        const inicio = Math.max(0, primera - FILAS_EXTRA_VIRTUAL);
+        const fin = Math.min(tabla.datos.length,
+            primera + Math.ceil(altoVista / tabla.altoFila) + FILAS_EXTRA_VIRTUAL);
+
+        while (tabla.filas.length < fin - inicio) {
+            tabla.filas.push(crearFila());
+        }
+
+        tabla.filas.forEach((tr, i) => {
+            const indice = inicio + i;
+            if (indice >= fin) {
+                tr.hidden = true;
+                return;
+            }
+            if (tr.parentNode !== tbody) tbody.insertBefore(tr, espaciadorInferior);
+            if (forzar || tr.indice !== indice) {
+                pintarFila(tr, tabla.datos[indice]);
+                tr.indice = indice;
+            }
+            tr.hidden = false;
+        });
+
+        espaciadorSuperior.firstChild.style.height = `${inicio * tabla.altoFila}px`;
+        espaciadorInferior.firstChild.style.height = `${(tabla.datos.length - fin) * tabla.altoFila}px`;
+
+        // La altura real depende de la fuente y del tamaño de pantalla
+        const alto = tabla.filas[0]?.getBoundingClientRect().height;
+        if (alto && Math.abs(alto - tabla.altoFila) > 0.5) {
+            tabla.altoFila = alto;
+            tabla.programar();
+        }
+    };
+
+    tabla.programar = function() {
+        if (tabla.pendiente) return;
+        tabla.pendiente = true;
+        requestAnimationFrame(() => {
+            tabla.pendiente = false;
+            tabla.pintar();
+        });
+    };
+
+    tabla.establecerDatos = function(datos) {
+        tabla.datos = datos;
+        if (espaciadorSuperior.parentNode !== tbody) {
+            tbody.replaceChildren(espaciadorSuperior, espaciadorInferior);
+        }
+        tabla.pintar(true);
+    };
+
+    // Item de la fila que contiene al elemento (para eventos delegados)
+    tabla.itemDe = function(elemento) {
+        const tr = elemento.closest('tr');
+        return tr && tr.parentNode === tbody && tr.indice !== undefined ? tabla.datos[tr.indice] : null;
+    };
+
+    contenedor.addEventListener('scroll', tabla.programar, { passive: true });
+    window.addEventListener('resize', tabla.programar);
+    return tabla;
+}
+
+let tablaInventario = null;
+
+function crearFilaInventario() {
+    const tr = document.createElement('tr');
+    tr.innerHTML = `
+        <td><strong></strong></td>
+        <td><i class="fas fa-image" style="color: #4CAF50; margin-right: 5px;"></i><span></span></td>
+        <td></td>
+        <td><span class="badge"></span></td>
+        <td></td>
+        <td><strong></strong></td>
+        <td></td>
+        <td></td>
+        <td></td>
+        <td>
+            <button class="btn btn-sm btn-primary" data-accion="editar">
+                <i class="fas fa-edit"></i>
+            </button>
+            <button class="btn btn-sm btn-danger" data-accion="eliminar">
+                <i class="fas fa-trash"></i>
+            </button>
+        </td>
+    `;
+    return tr;
+}
+
+function pintarFilaInventario(tr, m) {
+    const celdas = tr.cells;
+    tr.className = m.estado_clase;
+    tr.style.cursor = m.imagen_ruta ? 'pointer' : 'default';
+    tr.title = m.imagen_ruta ? 'Click para ver imagen' : 'Sin imagen';
+
+    celdas[0].firstChild.textContent = m.codigo;
+    celdas[1].firstChild.style.display = m.imagen_ruta ? '' : 'none';
+    celdas[1].lastChild.textContent = m.nombre;
+    celdas[2].textContent = m.descripcion || '-';
+    celdas[3].firstChild.textContent = m.categoria || '-';
+    celdas[4].textContent = m.ubicacion || '-';
+    celdas[5].firstChild.textContent = m.cantidad_actual;
+    celdas[6].textContent = m.unidad || '-';
+    celdas[7].textContent = m.stock_minimo;
+    celdas[8].textContent = `$${parseFloat(m.costo_unitario || 0).toFixed(2)}`;
+}
+
 function renderizarInventario() {
     const tbody = document.getElementById('inventarioTableBody');
 
+    if (!tablaInventario) {
+        tablaInventario = crearTablaVirtual(document.getElementById('inventarioScroll'), tbody, 10,
+            crearFilaInventario, pintarFilaInventario);
+
+        // Un solo listener para todas las filas, también las que se reutilizan
+        tbody.addEventListener('click', function(e) {
+            const material = tablaInventario.itemDe(e.target);
+            if (!material) return;
+
+            const accion = e.target.closest('button')?.dataset.accion;
+            if (accion === 'editar') {
+                editarMaterial(material.id);
+            } else if (accion === 'eliminar') {
+                eliminarMaterial(material.id, material.nombre);
+            } else if (!accion && material.imagen_ruta) {
+                mostrarModalImagen(material.imagen_ruta, material);
+            }
+        });
+    }
+
     if (materialesData.length === 0) {
         tbody.innerHTML = '<tr><td colspan="10" class="text-center">No se encontraron materiales</td></tr>';
         return;
     }
 
-    tbody.innerHTML = materialesData.map(m => `
-        <tr class="${m.estado_clase}" data-material-id="${m.id}" data-imagen="${m.imagen_ruta || ''}" style="cursor: ${m.imagen_ruta ? 'pointer' : 'default'};" title="${m.imagen_ruta ? 'Click para ver imagen' : 'Sin imagen'}">
-            <td><strong>${m.codigo}</strong></td>
-            <td>
-                ${m.imagen_ruta ? '<i class="fas fa-image" style="color: #4CAF50; margin-right: 5px;"></i>' : ''}
-                ${m.nombre}
-            </td>
-            <td>${m.descripcion || '-'}</td>
-            <td><span class="badge">${m.categoria || '-'}</span></td>
-            <td>${m.ubicacion || '-'}</td>
-            <td><strong>${m.cantidad_actual}</strong></td>
-            <td>${m.unidad || '-'}</td>
-            <td>${m.stock_minimo}</td>
-            <td>$${parseFloat(m.costo_unitario || 0).toFixed(2)}</td>
-            <td>
-                <button class="btn btn-sm btn-primary" onclick="editarMaterial(${m.id}); event.stopPropagation();">
-                    <i class="fas fa-edit"></i>
-                </button>
-                <button class="btn btn-sm btn-danger" onclick="eliminarMaterial(${m.id}, '${m.nombre}'); event.stopPropagation();">
-                    <i class="fas fa-trash"></i>
-                </button>
-            </td>
-        </tr>
-    `).join('');
-
-    // Agregar eventos de click a las filas
-    tbody.querySelectorAll('tr[data-material-id]').forEach(row => {
-        row.addEventListener('click', function(e) {
-            // No abrir imagen si se hace click en botones
-            if (e.target.closest('button')) return;
-
-            const imagenRuta = this.dataset.imagen;
-            const materialId = this.dataset.materialId;
-
-            if (imagenRuta) {
-                const material = materialesData.find(m => m.id == materialId);
-                mostrarModalImagen(imagenRuta, material);
-            }
-        });
-    });
+    tablaInventario.establecerDatos(materialesData);
 }
 
 function filtrarInventario() {
+    document.getElementById('inventarioScroll').scrollTop = 0;
     cargarMateriales();
 }
 
@@ -527,6 +1202,7 @@ async function guardarMaterial(e) {
         const result = await response.json();
 
         if (response.ok) {
+            invalidarCacheConsultas();
             mostrarToast(result.message, 'success');
             cerrarModal();
             cargarMateriales();
@@ -554,6 +1230,7 @@ async function eliminarMaterial(id, nombre) {
         const result = await response.json();
 
         if (response.ok) {
+            invalidarCacheConsultas();
             mostrarToast(result.message, 'success');
             cargarMateriales();
             cargarSelectsMaterial();
@@ -571,8 +1248,7 @@ async function eliminarMaterial(id, nombre) {
 // ================================
 async function cargarSelectsMaterial() {
     try {
-        const response = await fetch('/api/materiales');
-        const materiales = await response.json();
+        const materiales = await buscarMateriales('selects', new URLSearchParams());
 
         const selects = [
             'entradaMaterialId',
@@ -646,6 +1322,7 @@ async function registrarEntrada(e) {
         const result = await response.json();
 
         if (response.ok) {
+            invalidarCacheConsultas();
             mostrarToast(result.message, 'success');
             document.getElementById('formEntrada').reset();
             document.getElementById('entradaMaterialId').value = '';
@@ -693,6 +1370,7 @@ async function registrarSalida(e) {
         const result = await response.json();
 
         if (response.ok) {
+            invalidarCacheConsultas();
             mostrarToast(result.message, 'success');
             document.getElementById('formSalida').reset();
             document.getElementById('salidaMaterialId').value = '';
@@ -740,6 +1418,7 @@ async function registrarPrestamo(e) {
         const result = await response.json();
 
         if (response.ok) {
+            invalidarCacheConsultas();
             mostrarToast(result.message, 'success');
             document.getElementById('formPrestamo').reset();
             document.getElementById('prestamoMaterialId').value = '';
@@ -760,35 +1439,37 @@ async function registrarPrestamo(e) {
 
 async function cargarPrestamos() {
     try {
-        const response = await fetch('/api/prestamos');
-        const prestamos = await response.json();
-
-        const tbody = document.getElementById('prestamosTableBody');
-
-        if (prestamos.length === 0) {
-            tbody.innerHTML = '<tr><td colspan="6" class="text-center">No hay préstamos activos</td></tr>';
-            return;
-        }
-
-        tbody.innerHTML = prestamos.map(p => `
-            <tr>
-                <td>${formatearFecha(p.fecha_prestamo)}</td>
-                <td>${p.material_codigo} - ${p.material_nombre}</td>
-                <td>${p.cantidad}</td>
-                <td>${p.prestado_a}</td>
-                <td>${p.area_destino}</td>
-                <td>
-                    <button class="btn btn-sm btn-success" onclick="devolverPrestamo(${p.id})">
-                        <i class="fas fa-undo"></i> Devolver
-                    </button>
-                </td>
-            </tr>
-        `).join('');
+        const response = await obtenerLista('/api/prestamos');
+        renderizarPrestamos(await leerRespuesta(response));
     } catch (error) {
         console.error('Error al cargar préstamos:', error);
     }
 }
 
+function renderizarPrestamos(prestamos) {
+    const tbody = document.getElementById('prestamosTableBody');
+
+    if (prestamos.length === 0) {
+        tbody.innerHTML = '<tr><td colspan="6" class="text-center">No hay préstamos activos</td></tr>';
+        return;
+    }
+
+    tbody.innerHTML = prestamos.map(p => `
+        <tr>
+            <td>${formatearFecha(p.fecha_prestamo)}</td>
+            <td>${p.material_codigo} - ${p.material_nombre}</td>
+            <td>${p.cantidad}</td>
+            <td>${p.prestado_a}</td>
+            <td>${p.area_destino}</td>
+            <td>
+                <button class="btn btn-sm btn-success" onclick="devolverPrestamo(${p.id})">
+                    <i class="fas fa-undo"></i> Devolver
+                </button>
+            </td>
+        </tr>
+    `).join('');
+}
+
 async function devolverPrestamo(id) {
     if (!confirm('¿Confirmar devolución de este préstamo?')) {
         return;
@@ -802,6 +1483,7 @@ async function devolverPrestamo(id) {
         const result = await response.json();
 
         if (response.ok) {
+            invalidarCacheConsultas();
             mostrarToast(result.message, 'success');
             cargarMateriales();
             cargarPrestamos();
@@ -844,6 +1526,7 @@ async function registrarEnUso(e) {
         const result = await response.json();
 
         if (response.ok) {
+            invalidarCacheConsultas();
             mostrarToast(result.message, 'success');
             document.getElementById('formEnUso').reset();
             document.getElementById('enUsoMaterialId').value = '';
@@ -864,83 +1547,91 @@ async function registrarEnUso(e) {
 
 async function cargarMaterialEnUso() {
     try {
-        const response = await fetch('/api/material-en-uso');
-        const materiales = await response.json();
-
-        const tbody = document.getElementById('enUsoTableBody');
-
-        if (materiales.length === 0) {
-            tbody.innerHTML = '<tr><td colspan="5" class="text-center">No hay material en uso registrado</td></tr>';
-            return;
-        }
-
-        tbody.innerHTML = materiales.map(m => `
-            <tr>
-                <td>${formatearFecha(m.fecha_instalacion)}</td>
-                <td>${m.material_codigo} - ${m.material_nombre}</td>
-                <td>${m.cantidad}</td>
-                <td>${m.equipo_instalacion}</td>
-                <td>${m.responsable}</td>
-            </tr>
-        `).join('');
+        const response = await obtenerLista('/api/material-en-uso');
+        renderizarMaterialEnUso(await leerRespuesta(response));
     } catch (error) {
         console.error('Error al cargar material en uso:', error);
     }
 }
 
+function renderizarMaterialEnUso(materiales) {
+    const tbody = document.getElementById('enUsoTableBody');
+
+    if (materiales.length === 0) {
+        tbody.innerHTML = '<tr><td colspan="5" class="text-center">No hay material en uso registrado</td></tr>';
+        return;
+    }
+
+    tbody.innerHTML = materiales.map(m => `
+        <tr>
+            <td>${formatearFecha(m.fecha_instalacion)}</td>
+            <td>${m.material_codigo} - ${m.material_nombre}</td>
+            <td>${m.cantidad}</td>
+            <td>${m.equipo_instalacion}</td>
+            <td>${m.responsable}</td>
+        </tr>
+    `).join('');
+}
+
 // ================================
 // MOVIMIENTOS
 // ================================
 async function cargarMovimientos(tipo = '', tbodyId = '') {
     try {
         const url = tipo ? `/api/movimientos?tipo=${tipo}` : '/api/movimientos';
-        const response = await fetch(url);
-        const movimientos = await response.json();
+        const response = await obtenerLista(url);
+        const movimientos = await leerRespuesta(response);
 
         // Si se especifica un tbody específico, renderizar solo ahí
         if (tbodyId) {
-            const tbody = document.getElementById(tbodyId);
-            if (tbody) {
-                if (movimientos.length === 0) {
-                    tbody.innerHTML = '<tr><td colspan="5" class="text-center">No hay movimientos registrados</td></tr>';
-                } else {
-                    tbody.innerHTML = movimientos.slice(0, 10).map(m => `
-                        <tr>
-                            <td>${formatearFecha(m.fecha)}</td>
-                            <td>${m.material_codigo} - ${m.material_nombre}</td>
-                            <td>${m.cantidad}</td>
-                            <td>${m.destino_origen}</td>
-                            <td>${m.responsable}</td>
-                        </tr>
-                    `).join('');
-                }
-            }
+            renderizarMovimientos(movimientos, tbodyId);
         }
     } catch (error) {
         console.error('Error al cargar movimientos:', error);
     }
 }
 
+function renderizarMovimientos(movimientos, tbodyId) {
+    const tbody = document.getElementById(tbodyId);
+    if (!tbody) return;
+
+    if (movimientos.length === 0) {
+        tbody.innerHTML = '<tr><td colspan="5" class="text-center">No hay movimientos registrados</td></tr>';
+    } else {
+        tbody.innerHTML = movimientos.slice(0, 10).map(m => `
+            <tr>
+                <td>${formatearFecha(m.fecha)}</td>
+                <td>${m.material_codigo} - ${m.material_nombre}</td>
+                <td>${m.cantidad}</td>
+                <td>${m.destino_origen}</td>
+                <td>${m.responsable}</td>
+            </tr>
+        `).join('');
+    }
+}
+
 // ================================
 // ESTADÍSTICAS
 // ================================
 async function actualizarEstadisticas() {
     try {
         const response = await fetch('/api/estadisticas');
-        const stats = await response.json();
-
-        document.getElementById('statTotalMateriales').textContent = stats.total_materiales;
-        document.getElementById('statStockBajo').textContent = stats.stock_bajo;
-        document.getElementById('statSinStock').textContent = stats.sin_stock;
-        document.getElementById('statPrestamosActivos').textContent = stats.prestamos_activos;
-        document.getElementById('statMaterialEnUso').textContent = stats.material_en_uso;
-        document.getElementById('statMovimientosMes').textContent = stats.movimientos_mes;
-        document.getElementById('statValorTotal').textContent = `$${stats.valor_total.toLocaleString('es-MX', {minimumFractionDigits: 2})}`;
+        mostrarEstadisticas(await response.json());
     } catch (error) {
         console.error('Error al actualizar estadísticas:', error);
     }
 }
 
+function mostrarEstadisticas(stats) {
+    document.getElementById('statTotalMateriales').textContent = stats.total_materiales;
+    document.getElementById('statStockBajo').textContent = stats.stock_bajo;
+    document.getElementById('statSinStock').textContent = stats.sin_stock;
+    document.getElementById('statPrestamosActivos').textContent = stats.prestamos_activos;
+    document.getElementById('statMaterialEnUso').textContent = stats.material_en_uso;
+    document.getElementById('statMovimientosMes').textContent = stats.movimientos_mes;
+    document.getElementById('statValorTotal').textContent = `$${stats.valor_total.toLocaleString('es-MX', {minimumFractionDigits: 2})}`;
+}
+
 // ================================
 // REPORTES
 // ================================
@@ -948,7 +1639,8 @@ async function descargarReporte(tipo) {
     const urls = {
         'inventario': '/api/reportes/inventario',
         'stock-bajo': '/api/reportes/stock-bajo',
-        'movimientos': '/api/reportes/movimientos'
+        'movimientos': '/api/reportes/movimientos',
+        'reorden': '/api/reportes/reorden'
     };
 
     const url = urls[tipo];
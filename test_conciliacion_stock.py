@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Pruebas de la conciliación del stock (python -m pytest test_conciliacion_stock.py)
+"""
+import sqlite3
+
+import pandas as pd
+import pytest
+
+import app
+from conciliacion_stock import conciliar, conciliar_stock, reparar_stock
+from instantaneas_stock import asegurar_instantaneas
+
+CORTES = ('2025-01-01 00:00:00', '2025-02-01 00:00:00', '2025-03-01 00:00:00')
+
+
+def materiales(*filas):
+    """(material_id, cantidad_actual, inicial o None)"""
+    return pd.DataFrame([{'material_id': i, 'codigo': f'M{i}', 'nombre': f'Material {i}',
+                          'cantidad_actual': actual, 'inicial': inicial,
+                          'inicial_estimado': int(inicial is None)}
+                         for i, actual, inicial in filas])
+
+
+def movimientos(*filas):
+    """(material_id, tipo, cantidad, fecha)"""
+    return pd.DataFrame(filas, columns=('material_id', 'tipo_movimiento', 'cantidad', 'fecha'))
+
+
+def instantaneas(*filas):
+    """(material_id, fecha, cantidad)"""
+    return pd.DataFrame(filas, columns=('material_id', 'fecha', 'cantidad'))
+
+
+def libro_consistente():
+    """Material 1: alta con 10, +5 en enero, -3 en febrero, -2 en marzo"""
+    return (
+        materiales((1, 10.0, 10.0)),
+        instantaneas((1, CORTES[0], 10.0), (1, CORTES[1], 15.0), (1, CORTES[2], 12.0)),
+        movimientos((1, 'ENTRADA', 5, '2025-01-15 10:00:00'),
+                    (1, 'SALIDA', 3, '2025-02-10 10:00:00'),
+                    (1, 'SALIDA', 2, '2025-03-05 10:00:00')),
+    )
+
+
+def test_libro_consistente_no_tiene_diferencias():
+    diferencias, libro_cortes = conciliar(*libro_consistente())
+    assert diferencias.empty
+    assert libro_cortes.empty
+
+
+def test_movimiento_en_el_corte_cuenta_para_el_corte_siguiente():
+    # Una instantánea es el stock antes de los movimientos de su mes
+    diferencias, _ = conciliar(
+        materiales((1, 15.0, 10.0)),
+        instantaneas((1, CORTES[0], 10.0), (1, CORTES[1], 15.0)),
+        movimientos((1, 'ENTRADA', 5, CORTES[0])))
+    assert diferencias.empty
+
+
+def test_diferencia_en_la_cantidad_actual():
+    m, s, mov = libro_consistente()
+    m.loc[0, 'cantidad_actual'] = 17.0
+    diferencias, libro_cortes = conciliar(m, s, mov)
+    assert diferencias.loc[0, 'diferencia'] == pytest.approx(7)
+    assert diferencias.loc[0, 'esperado'] == pytest.approx(10)
+    assert diferencias.loc[0, 'instantaneas_con_diferencia'] == 0
+    assert libro_cortes.empty
+
+
+def test_instantanea_distinta_indica_el_mes():
+    m, s, mov = libro_consistente()
+    s.loc[1, 'cantidad'] = 20.0
+    diferencias, libro_cortes = conciliar(m, s, mov)
+    assert diferencias.loc[0, 'instantaneas_con_diferencia'] == 1
+    assert diferencias.loc[0, 'primera_diferencia'] == CORTES[1]
+    assert libro_cortes.values.tolist() == [[1, CORTES[1], 15.0]]
+
+
+def test_diferencia_anterior_a_las_instantaneas():
+    # Instantáneas reconstruidas desde una cantidad ya desviada: todas distintas del libro
+    m, s, mov = libro_consistente()
+    m.loc[0, 'cantidad_actual'] = 17.0
+    s['cantidad'] += 7
+    diferencias, libro_cortes = conciliar(m, s, mov)
+    assert diferencias.loc[0, 'diferencia'] == pytest.approx(7)
+    assert diferencias.loc[0, 'instantaneas_con_diferencia'] == 3
+    assert diferencias.loc[0, 'primera_diferencia'] == CORTES[0]
+    assert libro_cortes['cantidad'].tolist() == [10.0, 15.0, 12.0]
+
+
+def test_saldo_negativo_en_el_libro():
+    diferencias, _ = conciliar(
+        materiales((1, 2.0, None)),
+        instantaneas(),
+        movimientos((1, 'SALIDA', 5, '2025-01-10 00:00:00'),
+                    (1, 'ENTRADA', 7, '2025-01-20 00:00:00')))
+    # Alta estimada: 2 - 2 = 0; la salida del día 10 deja el saldo en -5
+    assert diferencias.loc[0, 'diferencia'] == pytest.approx(0)
+    assert diferencias.loc[0, 'primer_saldo_negativo'] == '2025-01-10 00:00:00'
+    assert bool(diferencias.loc[0, 'inicial_estimado'])
+
+
+def test_varios_materiales_y_movimientos_desordenados():
+    diferencias, _ = conciliar(
+        materiales((1, 10.0, 10.0), (2, 4.0, 0.0), (3, 1.0, 1.0)),
+        instantaneas((1, CORTES[0], 10.0), (2, CORTES[0], 0.0), (2, CORTES[1], 6.0)),
+        movimientos((2, 'SALIDA', 2, '2025-02-03 00:00:00'),
+                    (9, 'ENTRADA', 100, '2025-01-01 00:00:00'),
+                    (2, 'ENTRADA', 6, '2025-01-03 00:00:00')))
+    # Material 9 no existe: no afecta a los demás (lo informa revisar_integridad)
+    assert diferencias.empty
+
+
+@pytest.fixture
+def base(tmp_path, monkeypatch):
+    db_path = str(tmp_path / 'inventario_ptar.db')
+    monkeypatch.setattr(app, 'DB_PATH', db_path)
+    app.init_database()
+    conn = sqlite3.connect(db_path)
+    conn.execute("""
+        INSERT INTO materiales (codigo, nombre, cantidad_actual, fecha_registro)
+        VALUES ('M1', 'Material 1', 10, '2025-01-05 00:00:00')
+    """)
+    conn.executemany("""
+        INSERT INTO movimientos (material_id, tipo_movimiento, cantidad, fecha) VALUES (1, ?, ?, ?)
+    """, [('ENTRADA', 5, '2025-01-15 10:00:00'), ('SALIDA', 3, '2025-02-10 10:00:00')])
+    conn.execute('UPDATE materiales SET cantidad_actual = 12 WHERE id = 1')
+    conn.commit()
+    yield db_path, conn
+    conn.close()
+
+
+def test_diferencia_anterior_a_instalar_las_instantaneas(base):
+    db_path, conn = base
+    # Escritura con un valor desactualizado y después las instantáneas, construidas desde ella
+    conn.execute('UPDATE materiales SET cantidad_actual = cantidad_actual + 7 WHERE id = 1')
+    conn.execute('DELETE FROM stock_instantaneas')
+    asegurar_instantaneas(conn)
+    conn.commit()
+
+    diferencias, integridad = conciliar_stock(db_path)
+    assert diferencias['diferencia'].tolist() == [pytest.approx(7)]
+    assert diferencias.loc[0, 'instantaneas_con_diferencia'] > 0
+    assert not any(integridad.values())
+
+
+def test_reparar_deja_la_conciliacion_limpia(base):
+    db_path, conn = base
+    conn.execute('UPDATE materiales SET cantidad_actual = cantidad_actual + 7 WHERE id = 1')
+    conn.execute('DELETE FROM stock_instantaneas')
+    asegurar_instantaneas(conn)
+    conn.commit()
+
+    assert reparar_stock(db_path) == [1]
+    diferencias, _ = conciliar_stock(db_path)
+    assert diferencias.empty
+    assert conn.execute('SELECT cantidad_actual FROM materiales WHERE id = 1').fetchone()[0] == 12
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Detección de cambios entre procesos (escritorio y web) sobre inventario_ptar.db
+
+Los triggers registran cada INSERT/UPDATE/DELETE en la tabla `cambios` y el
+vigilante consulta `PRAGMA data_version`, que solo cambia cuando otra conexión
+confirma una escritura. Si no cambió, revisar() no hace ninguna otra consulta.
+"""
+from datetime import datetime, timedelta
+
+from catalogos import columnas_por_tabla
+
+TABLAS_VIGILADAS = ('materiales', 'movimientos', 'prestamos', 'material_en_uso')
+
+
+def columnas_derivadas(tabla):
+    """Llaves de catálogo de la tabla: las mantienen los triggers a partir del texto"""
+    return {llave for _, _, llave in columnas_por_tabla().get(tabla, ())}
+
+
+def _sql_trigger_update(conn, tabla):
+    """Trigger de modificaciones sobre las columnas de datos (sin las llaves de catálogo)
+
+    Así, escribir las llaves (trigger de catalogos.py o migración) no se
+    registra como un segundo cambio del mismo registro.
+    """
+    derivadas = columnas_derivadas(tabla)
+    columnas = [fila[1] for fila in conn.execute(f'PRAGMA table_info({tabla})')
+                if fila[1] not in derivadas]
+    return f'''
+        CREATE TRIGGER trg_cambios_{tabla}_update
+        AFTER UPDATE OF {', '.join(columnas)} ON {tabla}
+        BEGIN
+            INSERT INTO cambios (tabla, registro_id, operacion)
+            VALUES ('{tabla}', NEW.id, 'UPDATE');
+        END
+    '''
+
+
+def _reemplazar_trigger(conn, nombre, sql):
+    """Crea el trigger o lo reemplaza si su definición cambió, sin dejar un momento sin él"""
+    actual = conn.execute("SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = ?",
+                          (nombre,)).fetchone()
+    if actual and ' '.join(actual[0].split()) == ' '.join(sql.split()):
+        return
+    # El DROP y el CREATE se confirman juntos o ninguno
+    conn.execute('SAVEPOINT reemplazar_trigger')
+    try:
+        conn.execute(f'DROP TRIGGER IF EXISTS {nombre}')
+        conn.execute(sql)
+    except Exception:
+        conn.execute('ROLLBACK TO reemplazar_trigger')
+        raise
+    finally:
+        conn.execute('RELEASE reemplazar_trigger')
+
+
+def instalar_registro_cambios(conn):
+    """Crea la tabla de cambios y los triggers de las tablas vigiladas
+
+    Llamar después de agregar columnas a las tablas vigiladas: el trigger de
+    modificaciones enumera sus columnas.
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS cambios (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            tabla TEXT NOT NULL,
+            registro_id INTEGER NOT NULL,
+            operacion TEXT NOT NULL,
+            fecha TEXT DEFAULT (datetime('now', 'localtime'))
+        )
+    ''')
+
+    for tabla in TABLAS_VIGILADAS:
+        _reemplazar_trigger(conn, f'trg_cambios_{tabla}_update', _sql_trigger_update(conn, tabla))
+        for operacion, fila in (('INSERT', 'NEW'), ('DELETE', 'OLD')):
+            conn.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_cambios_{tabla}_{operacion.lower()}
+                AFTER {operacion} ON {tabla}
+                BEGIN
+                    INSERT INTO cambios (tabla, registro_id, operacion)
+                    VALUES ('{tabla}', {fila}.id, '{operacion}');
+                END
+            ''')
+
+
+def ultimo_seq(conn):
+    """Secuencia más reciente que se asignó en el registro de cambios
+
+    Se lee de sqlite_sequence y no de MAX(seq): no retrocede cuando la purga
+    deja la tabla vacía.
+    """
+    fila = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'cambios'").fetchone()
+    return fila[0] if fila else 0
+
+
+def purgar_cambios(conn, conservar_dias=30):
+    """Elimina del registro los cambios más antiguos que conservar_dias"""
+    limite = (datetime.now() - timedelta(days=conservar_dias)).strftime('%Y-%m-%d %H:%M:%S')
+    cursor = conn.execute('DELETE FROM cambios WHERE fecha < ?', (limite,))
+    return cursor.rowcount
+
+
+def historial_disponible(conn, desde):
+    """Indica si el registro conserva todos los cambios posteriores a desde
+
+    Falso si parte de ellos ya se purgó o si desde es posterior al último
+    cambio (la base de datos se restauró).
+    """
+    maximo = ultimo_seq(conn)
+    minimo = conn.execute('SELECT MIN(seq) FROM cambios').fetchone()[0]
+    # Sin filas (todo purgado) el siguiente cambio será maximo + 1
+    primero = minimo if minimo is not None else maximo + 1
+    return primero - 1 <= desde <= maximo
+
+
+def registros_cambiados_desde(conn, desde, limite=-1):
+    """[(seq, tabla, registro_id)] de los registros con cambios posteriores a desde
+
+    Cada registro aparece una vez, con el seq de su último cambio, en orden de seq.
+    """
+    return conn.execute('''
+        SELECT MAX(seq), tabla, registro_id FROM cambios
+        WHERE seq > ?
+        GROUP BY tabla, registro_id
+        ORDER BY 1
+        LIMIT ?
+    ''', (desde, limite)).fetchall()
+
+
+def leer_cambios_desde(conn, desde=0, limite=1000, tablas=None):
+    """Cambios con seq > desde, agrupados por tabla como altas/modificaciones y bajas
+
+    Devuelve {'desde', 'hasta', 'mas', 'reiniciar', 'cambios'}. Para cada tabla,
+    'upserts' trae las filas actuales completas y 'deletes' los ids eliminados;
+    si un registro cambió varias veces solo cuenta la última operación.
+    Con tablas solo se devuelven esas tablas, pero 'hasta' avanza igual sobre
+    los cambios de las demás.
+    'reiniciar' indica que parte de ese historial ya se purgó (o que la base de
+    datos se restauró) y el cliente debe volver a cargar todo y continuar desde 'hasta'.
+    """
+    maximo = ultimo_seq(conn)
+    if not historial_disponible(conn, desde):
+        return {'desde': desde, 'hasta': maximo, 'mas': False, 'reiniciar': True, 'cambios': {}}
+
+    filas = conn.execute('''
+        SELECT seq, tabla, registro_id, operacion FROM cambios
+        WHERE seq > ?
+        ORDER BY seq
+        LIMIT ?
+    ''', (desde, limite)).fetchall()
+
+    ultima_operacion = {}
+    hasta = desde
+    for seq, tabla, registro_id, operacion in filas:
+        hasta = seq
+        if tablas is None or tabla in tablas:
+            ultima_operacion[(tabla, registro_id)] = operacion
+
+    por_tabla = {}
+    for (tabla, registro_id), operacion in ultima_operacion.items():
+        por_tabla.setdefault(tabla, {'upserts': set(), 'deletes': set()})
+        clave = 'deletes' if operacion == 'DELETE' else 'upserts'
+        por_tabla[tabla][clave].add(registro_id)
+
+    cambios = {}
+    for tabla, ids in por_tabla.items():
+        upserts = []
+        deletes = set(ids['deletes'])
+        if ids['upserts']:
+            marcadores = ', '.join('?' for _ in ids['upserts'])
+            cursor = conn.execute(f'SELECT * FROM {tabla} WHERE id IN ({marcadores}) ORDER BY id',
+                                  list(ids['upserts']))
+            columnas = [d[0] for d in cursor.description]
+            # Las llaves de catálogo repiten el texto: no se envían
+            derivadas = columnas_derivadas(tabla)
+            upserts = [{c: v for c, v in zip(columnas, fila) if c not in derivadas}
+                       for fila in cursor.fetchall()]
+            # Ya no existe: se borró en un cambio posterior a esta página
+            deletes |= ids['upserts'] - {fila['id'] for fila in upserts}
+        cambios[tabla] = {'upserts': upserts, 'deletes': sorted(deletes)}
+
+    return {
+        'desde': desde,
+        'hasta': hasta,
+        'mas': len(filas) == limite and hasta < maximo,
+        'reiniciar': False,
+        'cambios': cambios
+    }
+
+
+class VigilanteCambios:
+    """Informa qué tablas y registros cambiaron desde la última revisión"""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.data_version = self._leer_data_version()
+        self.ultimo_seq = self._leer_ultimo_seq()
+
+    def _leer_data_version(self):
+        return self.conn.execute('PRAGMA data_version').fetchone()[0]
+
+    def _leer_ultimo_seq(self):
+        return ultimo_seq(self.conn)
+
+    def revisar(self):
+        """Devuelve {tabla: {registro_id, ...}} con los cambios hechos por otros procesos
+
+        Regresa un diccionario vacío si ninguna otra conexión escribió desde
+        la revisión anterior.
+        """
+        cambios = {}
+        for _, tabla, registro_id in self.revisar_registros():
+            cambios.setdefault(tabla, set()).add(registro_id)
+        return cambios
+
+    def revisar_registros(self):
+        """Como revisar(), pero como lista [(seq, tabla, registro_id)] en orden de seq
+
+        Cada registro aparece una vez, con el seq de su último cambio.
+        """
+        version = self._leer_data_version()
+        if version == self.data_version:
+            return []
+
+        registros = registros_cambiados_desde(self.conn, self.ultimo_seq)
+        if registros:
+            self.ultimo_seq = registros[-1][0]
+        self.data_version = version
+        return registros
+
+    def descartar_pendientes(self):
+        """Marca como vistos los cambios existentes (p. ej. después de una recarga completa)"""
+        self.data_version = self._leer_data_version()
+        self.ultimo_seq = self._leer_ultimo_seq()